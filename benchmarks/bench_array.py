@@ -0,0 +1,90 @@
+"""
+Benchmark of creating many small C++ objects
+
+Separate CXXStruct instances (own CStructure, pointer and constructor call
+each) against CXXArray of the same class: one CStructure * N block with
+batch construction. Memory is peak allocated by tracemalloc in a separate run.
+"""
+
+from common import build_library
+from pncpp import *
+import ctypes
+import time
+import tracemalloc
+
+INSTANCES = 100000
+ARRAY_LENGTH = 1000000
+
+SOURCE = """
+struct ClassA
+{
+    const char* text;
+    int value;
+
+    ClassA(int value);
+    ~ClassA();
+};
+
+ClassA::ClassA(int value): text(0), value(value) {}
+ClassA::~ClassA() {}
+"""
+
+
+@cxx_struct(virtual=0)
+class ClassA(CXXStruct):
+
+    _fields_ = [
+        ("text", ctypes.c_char_p),
+        ("value", ctypes.c_int)
+    ]
+
+    @cxx_constructor(t_int)
+    def construct(self, value):
+        pass
+
+    @cxx_destructor()
+    def destroy(self):
+        pass
+
+
+def measure(fn):
+    # timed and traced separately, tracemalloc slows down allocations
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def instances(count):
+    result = []
+    for i in range(count):
+        obj = ClassA()
+        obj.construct(1)
+        result.append(obj)
+    return result
+
+
+def array(count):
+    result = CXXArray(ClassA, count)
+    result.construct(1)
+    return result
+
+
+def main():
+    lib = build_library("bench_array", SOURCE)
+    ClassA.link_with(lib)
+
+    print("create and construct ClassA objects:")
+    for title, fn, count in (("separate instances", instances, INSTANCES), ("CXXArray", array, ARRAY_LENGTH)):
+        objects, elapsed, peak = measure(lambda: fn(count))
+        print("    %-20s %8d objects %8.3f s %10.1f MiB   per object %6.2f us %8.1f bytes" %
+              (title, count, elapsed, peak / 1048576.0, elapsed / count * 1e6, float(peak) / count))
+        del objects
+
+
+if __name__ == '__main__':
+    main()
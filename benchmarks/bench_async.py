@@ -0,0 +1,97 @@
+"""
+Benchmark of awaitable native calls
+
+Overhead of acall against a direct call for a trivial method, and the worst
+event loop stall while a slow method runs directly or through acall.
+"""
+
+from common import build_library, report
+from pncpp import *
+import pncpp.aio as aio
+import asyncio
+import ctypes
+import time
+
+CALLS = 20000
+SLOW_MS = 200
+
+SOURCE = """
+#include <chrono>
+#include <thread>
+
+struct ClassA
+{
+    long value;
+
+    long get();
+    void sleep_ms(int ms);
+};
+
+long ClassA::get() { return value; }
+
+void ClassA::sleep_ms(int ms)
+{
+    std::this_thread::sleep_for(std::chrono::milliseconds(ms));
+}
+"""
+
+
+@cxx_struct(virtual=0)
+class ClassA(CXXStruct):
+
+    _fields_ = [
+        ("value", ctypes.c_long)
+    ]
+
+    @cxx_method(t_long)
+    def get(self):
+        pass
+
+    @cxx_method(t_void, t_int)
+    def sleep_ms(self, ms):
+        pass
+
+
+async def calls_per_second(obj, awaited):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        if awaited:
+            await ClassA.get.acall(obj)
+        else:
+            obj.get()
+    return CALLS / (time.perf_counter() - start)
+
+
+async def max_stall(call):
+    """Longest gap between ticks of a 1 ms ticker while call runs"""
+    stall = 0.0
+    task = asyncio.ensure_future(call())
+    last = time.perf_counter()
+    while not task.done():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        stall = max(stall, now - last)
+        last = now
+    await task
+    return stall
+
+
+async def main():
+    obj = ClassA()
+
+    async def direct():
+        obj.sleep_ms(SLOW_MS)
+
+    report("get() calls per second:", [
+        ("direct", await calls_per_second(obj, False)),
+        ("await acall", await calls_per_second(obj, True)),
+    ])
+    print("event loop stall during sleep_ms(%d):" % SLOW_MS)
+    print("    %-40s %10.1f ms" % ("direct", await max_stall(direct) * 1e3))
+    print("    %-40s %10.1f ms" % ("await acall", await max_stall(lambda: ClassA.sleep_ms.acall(obj, SLOW_MS)) * 1e3))
+    print(aio.default_caller().stats())
+
+
+if __name__ == '__main__':
+    ClassA.link_with(build_library("bench_async", SOURCE))
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Benchmark of batched method calls against a Python loop
+
+Calls NonVirtual.foo overloads from the tests over many objects: a loop of
+bound method calls, and CXXMethod.map / starmap that convert argument
+columns once and call through builtin map().
+"""
+
+from common import build_library, report, tests_dir
+from pncpp import *
+import array
+import ctypes
+import os
+import time
+
+COUNT = 100000
+
+
+@cxx_struct(virtual=0)
+class NonVirtual(CXXStruct):
+
+    _pyobject_ = "py_object"
+    _fields_ = [
+        (_pyobject_, ctypes.c_void_p),
+        ('result', ctypes.c_int)
+    ]
+
+    @cxx_method(t_int)
+    def member_return(self):
+        pass
+
+    @cxx_method(t_int, t_int, t_int, t_int, name="foo")
+    def foo_i_iii(self, a, b, c):
+        pass
+
+    @cxx_method(t_int, t_int.ptr(), t_int.ptr(), t_int.ptr(), name="foo")
+    def foo_i_PiPiPi(self, a, b, c):
+        pass
+
+
+def calls_per_second(fn):
+    start = time.perf_counter()
+    fn()
+    return COUNT / (time.perf_counter() - start)
+
+
+def main():
+    lib = build_library("test_abi", os.path.join(tests_dir, "test_abi.cpp"))
+    NonVirtual.link_with(lib)
+
+    items = CXXArray(NonVirtual, COUNT)
+    views = list(items)
+    a = list(range(COUNT))
+    a_array = array.array("i", a)
+    rows = [(x, 1, 2) for x in a]
+    pointers = [ctypes.pointer(ctypes.c_int(i)) for i in range(3)]
+
+    def loop_iii():
+        return [obj.foo_i_iii(x, 1, 2) for obj, x in zip(views, a)]
+
+    def loop_return():
+        return [obj.member_return() for obj in views]
+
+    def loop_pointers():
+        return [obj.foo_i_PiPiPi(*pointers) for obj in views]
+
+    foo = NonVirtual.foo_i_iii
+    report("foo(int, int, int) calls per second:", [
+        ("python loop", calls_per_second(loop_iii)),
+        ("map, list column", calls_per_second(lambda: foo.map(items, a, 1, 2))),
+        ("map, array.array column", calls_per_second(lambda: foo.map(items, a_array, 1, 2))),
+        ("starmap", calls_per_second(lambda: foo.starmap(items, rows))),
+    ])
+    report("member_return() calls per second:", [
+        ("python loop", calls_per_second(loop_return)),
+        ("map", calls_per_second(lambda: NonVirtual.member_return.map(items))),
+    ])
+    report("foo(int*, int*, int*) calls per second:", [
+        ("python loop", calls_per_second(loop_pointers)),
+        ("map, same pointers", calls_per_second(lambda: NonVirtual.foo_i_PiPiPi.map(items, *pointers))),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark of passing large payloads to pointer arguments
+
+A method summing an int array is called with data copied into a new ctypes
+array per call, as was needed before, and with buffer exporters passed
+directly (array.array, bytearray view, NumPy array when installed).
+"""
+
+from common import build_library, rate, report
+from pncpp import *
+import array
+import ctypes
+
+SIZE = 1 << 20
+
+SOURCE = """
+struct ClassA
+{
+    long sum(const int* data, long count);
+};
+
+long ClassA::sum(const int* data, long count)
+{
+    long result = 0;
+    for (long i = 0; i < count; i++)
+        result += data[i];
+    return result;
+}
+"""
+
+
+@cxx_struct(virtual=0)
+class ClassA(CXXStruct):
+
+    _fields_ = []
+
+    @cxx_method(t_long, t_int.const().ptr(), t_long)
+    def sum(self, data, count):
+        pass
+
+
+def main():
+    ClassA.link_with(build_library("bench_buffers", SOURCE))
+    obj = ClassA()
+    values = array.array("i", range(SIZE))
+    data = bytearray(values.tobytes())
+    view = memoryview(data).cast("i")
+    c_array = (ctypes.c_int * SIZE)
+
+    results = [
+        ("copy into ctypes array", rate(lambda: obj.sum(c_array.from_buffer_copy(values), SIZE), number=200)),
+        ("array.array", rate(lambda: obj.sum(values, SIZE), number=200)),
+        ("memoryview of bytearray", rate(lambda: obj.sum(view, SIZE), number=200)),
+    ]
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        np_values = numpy.arange(SIZE, dtype=numpy.int32)
+        results.append(("NumPy array", rate(lambda: obj.sum(np_values, SIZE), number=200)))
+    report("sum() of %d ints, calls per second:" % SIZE, results)
+
+    small = array.array("i", [1])
+    report("sum() of 1 int, calls per second:", [
+        ("ctypes.byref", rate(lambda: obj.sum(ctypes.byref(ctypes.c_int(1)), 1))),
+        ("array.array", rate(lambda: obj.sum(small, 1))),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Micro-benchmark of Python -> C++ method calls
+
+Compares the generic CXXMethod.__call__ path (per-call CXXMethodInvoke and
+argument type checks) with the precompiled per-method thunks.
+"""
+
+from common import build_library, rate, report, tests_dir
+from pncpp import *
+import ctypes
+import os
+
+
+@cxx_struct(virtual=0)
+class NonVirtual(CXXStruct):
+
+    _pyobject_ = "py_object"
+    _fields_ = [
+        (_pyobject_, ctypes.c_void_p),
+        ('result', ctypes.c_int)
+    ]
+
+    @cxx_method(t_int)
+    def member_return(self):
+        pass
+
+    @cxx_method(t_int, t_int, t_int, t_int, name="foo")
+    def foo_i_iii(self, a, b, c):
+        pass
+
+
+def main():
+    lib = build_library("test_abi", os.path.join(tests_dir, "test_abi.cpp"))
+    NonVirtual.link_with(lib)
+
+    obj = NonVirtual()
+    m0 = NonVirtual.member_return
+    m3 = NonVirtual.foo_i_iii
+
+    report("calls per second:", [
+        ("native member_return()", rate(lambda: m0.c_method(obj.this))),
+        ("generic member_return()", rate(lambda: CXXMethodInvoke(obj, m0)())),
+        ("thunk member_return()", rate(lambda: obj.member_return())),
+        ("native foo(int, int, int)", rate(lambda: m3.c_method(obj.this, 1, 2, 3))),
+        ("generic foo(int, int, int)", rate(lambda: CXXMethodInvoke(obj, m3)(1, 2, 3))),
+        ("thunk foo(int, int, int)", rate(lambda: obj.foo_i_iii(1, 2, 3))),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark of generated binding module against declarations
+
+Startup (import and link in a fresh interpreter) and call rates of a
+synthetic library of 500 classes, wrapped by a module of cxx_struct
+declarations and by the binding module pncpp.codegen generates from it.
+"""
+
+from bench_import import module_source
+from common import build_dir, build_library, rate, report
+from run import library_source
+import pncpp.codegen as codegen
+import os
+import py_compile
+import subprocess
+import sys
+
+CLASSES = 500
+METHODS = 5
+REPEAT = 5
+
+PROBE = """
+import time
+start = time.perf_counter()
+import %(module)s
+import ctypes
+cdll = ctypes.CDLL(%(library)r)
+%(link)s
+print(time.perf_counter() - start)
+"""
+
+
+def startup(directory, module, link, library):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([directory, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))])
+    code = PROBE % {"module": module, "library": library, "link": link}
+    return min(float(subprocess.check_output([sys.executable, "-c", code], env=env)) for _ in range(REPEAT))
+
+
+def main():
+    directory = build_dir()
+    lib = build_library("bench_codegen", library_source(CLASSES, METHODS, 1))
+    with open(os.path.join(directory, "bench_codegen_classes.py"), "w") as f:
+        f.write(module_source(CLASSES, METHODS))
+    sys.path.insert(0, directory)
+    import bench_codegen_classes as declared
+    with open(os.path.join(directory, "bench_codegen_bindings.py"), "w") as f:
+        f.write(codegen.generate(declared, lib))
+    for module in ("bench_codegen_classes", "bench_codegen_bindings"):
+        py_compile.compile(os.path.join(directory, module + ".py"))
+    import bench_codegen_bindings as generated
+    generated.link(lib)
+
+    link_all = "for k in range(%d): getattr(bench_codegen_classes, 'Class%%d' %% k).link_with(cdll)" % CLASSES
+    print("import and link %d classes, best of %d:" % (CLASSES, REPEAT))
+    for title, module, link in (("declarations", "bench_codegen_classes", link_all),
+                                ("generated module", "bench_codegen_bindings", "bench_codegen_bindings.link(cdll)")):
+        print("    %-40s %10.2f ms" % (title, startup(directory, module, link, lib._name) * 1e3))
+
+    results = []
+    for title, cls in (("declarations", declared.Class0), ("generated module", generated.Class0)):
+        obj = cls()
+        obj.construct(1)
+        results.append(("%s, downcall" % title, rate(lambda: obj.m0_i(1))))
+        results.append(("%s, upcall" % title, rate(lambda: obj.run(1000), number=200) * 1000))
+    report("calls per second:", results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of CXXStruct field access
+
+Compares generated field descriptors with the former hasattr-probing
+__getattr__/__setattr__ forwarding and with direct CStructure access.
+"""
+
+from common import rate, report
+from pncpp import *
+import ctypes
+
+
+@cxx_struct(virtual=0)
+class Point(CXXStruct):
+
+    _fields_ = [
+        ("x", ctypes.c_int),
+        ("y", ctypes.c_double),
+        ("name", ctypes.c_char_p)
+    ]
+
+
+class ProbingPoint(object):
+    """Attribute forwarding as CXXStruct did it before field descriptors"""
+
+    def __init__(self):
+        self.struct = Point.CStructure()
+
+    def __getattr__(self, item):
+        if item != "struct" and hasattr(self.struct, item):
+            return getattr(self.struct, item)
+        return super(ProbingPoint, self).__getattribute__(item)
+
+    def __setattr__(self, item, value):
+        if item != "struct" and hasattr(self.struct, item):
+            return setattr(self.struct, item, value)
+        return super(ProbingPoint, self).__setattr__(item, value)
+
+
+def main():
+    obj = Point()
+    old = ProbingPoint()
+    struct = obj.struct
+
+    def set_obj():
+        obj.x = 1
+
+    def set_old():
+        old.x = 1
+
+    def set_struct():
+        struct.x = 1
+
+    report("field get/set per second:", [
+        ("CStructure get", rate(lambda: struct.x)),
+        ("probing get", rate(lambda: old.x)),
+        ("descriptor get", rate(lambda: obj.x)),
+        ("CStructure set", rate(set_struct)),
+        ("probing set", rate(set_old)),
+        ("descriptor set", rate(set_obj)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
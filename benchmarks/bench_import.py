@@ -0,0 +1,77 @@
+"""
+Benchmark of import time of a module declaring many wrapped classes
+
+Generates a module of 500 decorated classes with fields and overloaded
+methods and imports it in a fresh interpreter, so module caches and the
+pncpp import itself are measured as an application sees them. Scanning the
+same classes with inspect.getmembers, as decoration did before, is timed
+for comparison.
+"""
+
+from common import build_dir
+import os
+import py_compile
+import subprocess
+import sys
+
+CLASSES = 500
+METHODS = 5
+REPEAT = 5
+
+PROBE = """
+import time
+start = time.perf_counter()
+import pncpp
+middle = time.perf_counter()
+import %(module)s
+end = time.perf_counter()
+import inspect
+classes = [getattr(%(module)s, "Class%%d" %% k) for k in range(%(classes)d)]
+scan_start = time.perf_counter()
+for cls in classes:
+    inspect.getmembers(cls)
+scan_end = time.perf_counter()
+print(middle - start, end - middle, scan_end - scan_start)
+"""
+
+
+def module_source(classes, methods):
+    lines = ["from pncpp import *", "import ctypes", ""]
+    for k in range(classes):
+        lines += ["", "@cxx_struct(virtual=1)", "class Class%d(CXXStruct):" % k, "",
+                  "    _pyobject_ = \"py_object\"",
+                  "    _fields_ = [(_pyobject_, ctypes.c_void_p), (\"value\", ctypes.c_int), (\"weight\", ctypes.c_double)]",
+                  "", "    @cxx_constructor(t_int)", "    def construct(self, value):", "        pass",
+                  "", "    @cxx_destructor()", "    def destroy(self):", "        pass",
+                  "", "    @cxx_method(t_int, t_int)", "    def run(self, n):", "        pass"]
+        for j in range(methods):
+            lines += ["", "    @cxx_method(t_int, t_int, name=\"m%d\")" % j, "    def m%d_i(self, a):" % j, "        pass",
+                      "", "    @cxx_method(t_long, t_long, name=\"m%d\")" % j, "    def m%d_l(self, a):" % j, "        pass"]
+        lines += ["", "    @cxx_method(t_int, t_int, override=True)", "    def v0(self, a):", "        return a"]
+    return "\n".join(lines) + "\n"
+
+
+def probe(directory, module):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([directory, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))])
+    code = PROBE % {"module": module, "classes": CLASSES}
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+    return [float(value) for value in output.split()]
+
+
+def main():
+    directory = build_dir()
+    module = "bench_import_classes"
+    path = os.path.join(directory, module + ".py")
+    with open(path, "w") as f:
+        f.write(module_source(CLASSES, METHODS))
+    # bytecode is cached, as in an installed application
+    py_compile.compile(path)
+    runs = [probe(directory, module) for _ in range(REPEAT)]
+    print("import of module with %d classes, %d methods each, best of %d:" % (CLASSES, 2 * METHODS + 4, REPEAT))
+    for i, title in enumerate(("import pncpp", "import module", "inspect.getmembers of all classes")):
+        print("    %-40s %10.2f ms" % (title, min(run[i] for run in runs) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark of symbol indexing over large synthetic symbol table
+
+Symbols are generated with the mangler: nested classes with plain, pointer,
+const and self-referencing arguments, class templates in the same
+namespaces, and standard library instantiations (std::vector, std::map of
+them) as a C++ library exports them, a fifth of symbols each. Indexing only
+scans source names and the mangled scope of templated symbols; signatures
+are demangled on query, templated symbols are parsed per scope.
+"""
+
+import common
+import pncpp.itanium_abi_demangle as dm
+import pncpp.itanium_abi_mangle as mg
+import pncpp.symbol_index as symbol_index
+import itertools
+import time
+
+SYMBOLS = 100000
+
+
+def std(name, *args):
+    return mg.struct("std").template(*args).struct(name)
+
+
+def symbol_table():
+    builtins = [mg.m_int, mg.m_char, mg.m_long, mg.m_double, mg.m_bool, mg.m_unsigned_int]
+    for i in itertools.count():
+        owner = mg.struct("ns%d" % (i % 50)).struct("Class%d" % (i % 1000))
+        t = builtins[i % len(builtins)]
+        if i % 5 == 3:
+            owner = mg.struct("ns%d" % (i % 50)).template(t).struct("Box%d" % (i % 40))
+        elif i % 5 == 4:
+            element = mg.struct("ns%d" % (i % 50)).struct("Class%d" % (i % 1000)).type()
+            vector = std("vector", element, std("allocator", element).type())
+            owner = [vector, std("map", t, vector.type(), std("less", t).type(),
+                                 std("allocator", std("pair", t.const(), vector.type()).type()).type())][i % 2]
+        kind = i % 10
+        if kind == 0:
+            yield str(owner.constructor(1, mg.m_void))
+            continue
+        if kind == 1:
+            yield str(owner.vtable())
+            continue
+        args = []
+        for j in range(i % 6):
+            t = builtins[(i + j) % len(builtins)]
+            arg_kind = (i * 7 + j) % 4
+            if arg_kind == 1:
+                t = t.ptr()
+            elif arg_kind == 2:
+                t = t.const().ptr()
+            elif arg_kind == 3:
+                t = owner.type().const().ref()
+            args.append(t)
+        yield str(owner.method("method%d" % i, *(args or [mg.m_void])))
+
+
+def main():
+    symbols = {}
+    for symbol in symbol_table():
+        symbols[symbol] = 0
+        if len(symbols) == SYMBOLS:
+            break
+
+    start = time.perf_counter()
+    index = symbol_index.SymbolIndex(symbols)
+    scan = time.perf_counter() - start
+
+    start = time.perf_counter()
+    suggestions = index.suggest("ns7::Class7", "method7x")
+    suggest = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.methods("ns8::Box8<long>")
+    templated = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scopes = index.scopes()
+    names = time.perf_counter() - start
+
+    start = time.perf_counter()
+    members = len(index)
+    pending = time.perf_counter() - start
+
+    sample = list(symbols)[:5000]
+    start = time.perf_counter()
+    for symbol in sample:
+        dm.demangle(symbol)
+    demangle = (time.perf_counter() - start) / len(sample)
+
+    print("index %d symbols:" % len(symbols))
+    print("    %-40s %10.3f s" % ("scan", scan))
+    print("    %-40s %10.3f s" % ("first suggestion", suggest))
+    print("    %-40s %10.3f s" % ("first query of templated scope", templated))
+    print("    %-40s %10.3f s" % ("scopes()", names))
+    print("    %-40s %10.3f s" % ("len(), parses all templated symbols", pending))
+    print("    %-40s %10.1f us" % ("demangle one symbol", demangle * 1e6))
+    print("    %-40s %10d" % ("scopes", len(scopes)))
+    print("    %-40s %10d" % ("members", members))
+    print("    %-40s %10d" % ("unsupported", len(index.unsupported)))
+    print("    %s" % suggestions)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark of native object lifetime in a long-running loop
+
+Objects whose C++ destructor releases a heap buffer are created and dropped
+without explicit destroy. Counts C++ allocations still alive and time per
+object; owned objects are destroyed by their finalizer.
+"""
+
+from common import build_library
+from pncpp import *
+import ctypes
+import gc
+import time
+
+CYCLES = 100000
+
+SOURCE = """
+static long buffers = 0;
+
+struct ClassA
+{
+    char* buffer;
+
+    ClassA(int size);
+    ~ClassA();
+};
+
+ClassA::ClassA(int size): buffer(new char[size]) { ++buffers; }
+ClassA::~ClassA() { delete[] buffer; --buffers; }
+
+extern "C" long live_buffers() { return buffers; }
+"""
+
+
+@cxx_struct(virtual=0)
+class ClassA(CXXStruct):
+
+    _fields_ = [
+        ("buffer", ctypes.c_void_p)
+    ]
+
+    @cxx_constructor(t_int)
+    def construct(self, size):
+        pass
+
+    @cxx_destructor()
+    def destroy(self):
+        pass
+
+
+def churn(lib, disown):
+    before = lib.live_buffers()
+    start = time.perf_counter()
+    for _ in range(CYCLES):
+        obj = ClassA()
+        obj.construct(256)
+        if disown:
+            obj.disown()
+    del obj
+    gc.collect()
+    elapsed = time.perf_counter() - start
+    return lib.live_buffers() - before, elapsed
+
+
+def main():
+    lib = build_library("bench_lifetime", SOURCE)
+    ClassA.link_with(lib)
+    print("create %d objects and drop them without destroy():" % CYCLES)
+    for title, disown in (("not owned (old behaviour)", True), ("owned, finalizer", False)):
+        leaked, elapsed = churn(lib, disown)
+        print("    %-30s %8d C++ buffers leaked %8.2f us per object" % (title, leaked, elapsed / CYCLES * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of class declaration and link time for a class with many methods
+
+Compares eager link_with, which resolves every method and builds its
+callback type, with lazy link that resolves methods on first access.
+Memory is the peak allocated by tracemalloc during declaration and link.
+"""
+
+from common import build_library
+from pncpp import *
+import ctypes
+import time
+import tracemalloc
+
+METHODS = 1000
+CALLED = 10
+
+ARG_TYPES = [("int", t_int), ("long", t_long), ("short*", t_short.ptr()), ("char const*", t_char.const().ptr())]
+
+
+def library_source(count):
+    lines = ["struct Big", "{", "    int value;"]
+    for i in range(count):
+        c_type, _ = ARG_TYPES[i % len(ARG_TYPES)]
+        lines.append("    int method%d(%s a);" % (i, c_type))
+    lines.append("};")
+    for i in range(count):
+        c_type, _ = ARG_TYPES[i % len(ARG_TYPES)]
+        lines.append("int Big::method%d(%s a) { return value + %d; }" % (i, c_type, i))
+    return "\n".join(lines) + "\n"
+
+
+def declare(count):
+    namespace = {"_fields_": [("value", ctypes.c_int)]}
+    for i in range(count):
+        _, arg_type = ARG_TYPES[i % len(ARG_TYPES)]
+        namespace["method%d" % i] = cxx_method(t_int, arg_type)(lambda self, a: None)
+    return cxx_struct(name="Big")(type("Big", (CXXStruct,), namespace))
+
+
+def measure(lib, lazy):
+    tracemalloc.start()
+    start = time.perf_counter()
+    cls = declare(METHODS)
+    cls.link_with(lib, lazy=lazy)
+    link = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    obj = cls()
+    start = time.perf_counter()
+    for i in range(0, METHODS, METHODS // CALLED):
+        getattr(obj, "method%d" % i)(0)
+    first_calls = time.perf_counter() - start
+    return link, peak, first_calls
+
+
+def main():
+    lib = build_library("bench_link", library_source(METHODS))
+    # warm up: symbol table of library is parsed once and shared by both runs
+    measure(lib, False)
+
+    print("declare and link class with %d methods, then call %d of them:" % (METHODS, CALLED))
+    for title, lazy in (("eager", False), ("lazy", True)):
+        link, peak, first_calls = measure(lib, lazy)
+        print("    %-10s link %8.1f ms   peak memory %8.1f KiB   first calls %6.2f ms" %
+              (title, link * 1e3, peak / 1024.0, first_calls * 1e3))
+
+
+if __name__ == '__main__':
+    main()
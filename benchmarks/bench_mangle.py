@@ -0,0 +1,65 @@
+"""
+Benchmark of name mangling over large synthetic API surface
+
+Builds signatures the same way resolve_as_member does: derived types from
+.const()/.ptr()/.ref() and str() of the resulting function signature.
+The second pass shows the effect of hash-consed nodes with cached encoding.
+Nodes of the first pass are kept alive, as nodes of declared classes are.
+The last pass names a new class in every signature, so nearly every node is
+built and encoded for the first time.
+
+Reference numbers, best of 7 on one core: the first pass takes 1.33 s
+against 1.55 s for the model without interning, which encodes on every
+str(); the second pass takes 0.61 s against 1.71 s. With a new class in
+every signature interning costs more than it saves: 2.24 s against 1.31 s.
+"""
+
+import common
+import pncpp.itanium_abi_mangle as mg
+import time
+
+SIGNATURES = 50000
+
+
+def api_surface(count, classes=1000):
+    builtins = [mg.m_int, mg.m_char, mg.m_long, mg.m_double, mg.m_bool, mg.m_unsigned_int]
+    for i in range(count):
+        owner = mg.struct("ns%d" % (i % 50)).struct("Class%d" % (i % classes))
+        args = []
+        for j in range(i % 6):
+            t = builtins[(i + j) % len(builtins)]
+            kind = (i * 7 + j) % 4
+            if kind == 1:
+                t = t.ptr()
+            elif kind == 2:
+                t = t.const().ptr()
+            elif kind == 3:
+                t = owner.type().const().ref()
+            args.append(t)
+        yield owner, owner.method("method%d" % (i % 97), *(args or [mg.m_void]))
+
+
+def mangle_all(count, alive, classes=1000):
+    start = time.perf_counter()
+    total = 0
+    for owner, sig in api_surface(count, classes):
+        total += len(str(sig))
+        total += len(str(sig))
+        alive.append((owner, sig))
+    return time.perf_counter() - start
+
+
+def main():
+    alive = []
+    cold = mangle_all(SIGNATURES, alive)
+    warm = mangle_all(SIGNATURES, alive)
+    new = mangle_all(SIGNATURES, [], SIGNATURES)
+    print("mangle %d signatures:" % SIGNATURES)
+    print("    %-40s %10.3f s" % ("first pass", cold))
+    print("    %-40s %10.3f s" % ("second pass (interned)", warm))
+    print("    %-40s %10.3f s" % ("new class per signature", new))
+    print("    %-40s %10d" % ("interned nodes", sum(map(len, mg._pools))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of updating one field across many native objects
+
+Python loop over CXXArray views against one vectorized operation on the
+zero-copy NumPy view of the same memory. Requires numpy.
+"""
+
+from common import build_library
+from pncpp import *
+import ctypes
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LENGTH = 1000000
+
+SOURCE = """
+struct ClassA
+{
+    const char* text;
+    int value;
+
+    ClassA(int value);
+};
+
+ClassA::ClassA(int value): text(0), value(value) {}
+"""
+
+
+@cxx_struct(virtual=0)
+class ClassA(CXXStruct):
+
+    _fields_ = [
+        ("text", ctypes.c_char_p),
+        ("value", ctypes.c_int)
+    ]
+
+    @cxx_constructor(t_int)
+    def construct(self, value):
+        pass
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def python_loop(items):
+    for item in items:
+        item.value += 1
+
+
+def vectorized(items):
+    view = items.as_numpy()
+    view["value"] += 1
+
+
+def main():
+    if numpy is None:
+        sys.exit("numpy is not installed")
+    lib = build_library("bench_numpy", SOURCE)
+    ClassA.link_with(lib)
+    items = CXXArray(ClassA, LENGTH)
+    items.construct(0)
+
+    print("increment field of %d objects:" % LENGTH)
+    print("    %-40s %10.3f s" % ("python loop over views", timed(lambda: python_loop(items))))
+    print("    %-40s %10.3f s" % ("numpy view", timed(lambda: vectorized(items))))
+    assert items[LENGTH - 1].value == 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark of construct/destroy churn of short-lived objects
+
+New wrapper per object (CStructure, pointer, python object field, vtable
+pointer) against ObjectPool reusing released instances.
+"""
+
+from common import build_library, report
+from pncpp import *
+import ctypes
+import time
+
+CYCLES = 100000
+
+SOURCE = """
+struct ClassA
+{
+    void* py_object;
+    int value;
+
+    ClassA(int value);
+    virtual ~ClassA();
+    virtual int get();
+};
+
+ClassA::ClassA(int value): value(value) {}
+ClassA::~ClassA() {}
+int ClassA::get() { return value; }
+"""
+
+
+@cxx_struct(virtual=1)
+class ClassA(CXXStruct):
+
+    _pyobject_ = "py_object"
+    _fields_ = [
+        (_pyobject_, ctypes.c_void_p),
+        ("value", ctypes.c_int)
+    ]
+
+    @cxx_constructor(t_int)
+    def construct(self, value):
+        pass
+
+    @cxx_destructor()
+    def destroy(self):
+        pass
+
+    @cxx_method(t_int)
+    def get(self):
+        pass
+
+
+def cycles_per_second(fn):
+    start = time.perf_counter()
+    fn()
+    return CYCLES / (time.perf_counter() - start)
+
+
+def fresh():
+    for i in range(CYCLES):
+        obj = ClassA()
+        obj.construct(i)
+        obj.get()
+        obj.destroy()
+
+
+def pooled(pool):
+    for i in range(CYCLES):
+        obj = pool.acquire(i)
+        obj.get()
+        pool.release(obj)
+
+
+def main():
+    ClassA.link_with(build_library("bench_pool", SOURCE))
+    pool = ObjectPool(ClassA, max_size=16)
+    report("construct, call, destroy cycles per second:", [
+        ("new wrapper each time", cycles_per_second(fresh)),
+        ("ObjectPool", cycles_per_second(lambda: pooled(pool))),
+    ])
+    print(pool.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of native objects sharded between worker processes
+
+CPU-bound calls on independent objects in this process against the same
+calls on objects owned by ProcessPool workers, and cost of one call round
+trip against batched calls. Speedup depends on the number of CPUs.
+"""
+
+from common import build_library, report
+from pncpp import *
+import pncpp.procpool as procpool
+import ctypes
+import os
+import time
+
+OBJECTS = 32
+WORK = 2000000
+CALLS = 5000
+
+SOURCE = """
+struct ClassA
+{
+    long value;
+
+    ClassA(long value);
+    long get();
+    long spin(long count);
+};
+
+ClassA::ClassA(long value): value(value) {}
+
+long ClassA::get() { return value; }
+
+long ClassA::spin(long count)
+{
+    volatile long result = value;
+    for (long i = 0; i < count; ++i)
+        result = result * 31 + i;
+    return result;
+}
+"""
+
+
+@cxx_struct(virtual=0)
+class ClassA(CXXStruct):
+
+    _fields_ = [
+        ("value", ctypes.c_long)
+    ]
+
+    def __init__(self, value=0):
+        super(ClassA, self).__init__()
+        self.construct(value)
+
+    @cxx_constructor(t_long)
+    def construct(self, value):
+        pass
+
+    @cxx_method(t_long)
+    def get(self):
+        pass
+
+    @cxx_method(t_long, t_long)
+    def spin(self, count):
+        pass
+
+
+def rate(fn, count):
+    start = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    lib = build_library("bench_procpool", SOURCE)
+    ClassA.link_with(lib)
+    local = [ClassA(i) for i in range(OBJECTS)]
+    results = [("this process", rate(lambda: [obj.spin(WORK) for obj in local], OBJECTS))]
+
+    for processes in sorted({1, 2, os.cpu_count() or 1}):
+        with procpool.ProcessPool(lib, [ClassA], processes) as pool:
+            remote = pool.create_many(ClassA, [(i,) for i in range(OBJECTS)])
+            results.append(("ProcessPool, %d processes" % processes,
+                            rate(lambda: pool.map("spin", remote, [WORK] * OBJECTS), OBJECTS)))
+            if processes == 1:
+                obj = remote[0]
+                calls = [(obj, "get", ())] * CALLS
+                overhead = [
+                    ("one call per round trip", rate(lambda: [obj.get() for _ in range(CALLS)], CALLS)),
+                    ("call_many, one batch", rate(lambda: pool.call_many(calls), CALLS)),
+                ]
+    report("spin(%d) calls per second (%d CPUs):" % (WORK, os.cpu_count() or 1), results)
+    report("remote get() calls per second:", overhead)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark of method call cost under profiling
+
+Calls of a trivial method before profiling is enabled, after it is
+disabled again, and while every call or every 100th call is timed.
+"""
+
+from common import build_library, rate, report
+from pncpp import *
+import pncpp.profiling as profiling
+import ctypes
+
+SOURCE = """
+struct ClassA
+{
+    long value;
+
+    long get();
+};
+
+long ClassA::get() { return value; }
+"""
+
+
+@cxx_struct(virtual=0)
+class ClassA(CXXStruct):
+
+    _fields_ = [
+        ("value", ctypes.c_long)
+    ]
+
+    @cxx_method(t_long)
+    def get(self):
+        pass
+
+
+def main():
+    ClassA.link_with(build_library("bench_profiling", SOURCE))
+    obj = ClassA()
+    results = [("never enabled", rate(obj.get))]
+    for title, sample in (("enabled, every call", 1), ("enabled, sample=100", 100)):
+        with profiling.profile(ClassA, sample=sample):
+            results.append((title, rate(obj.get)))
+    results.append(("disabled again", rate(obj.get)))
+    report("get() calls per second:", results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark of handing large native state to another process
+
+Array of objects is pickled through a pipe and copied into a new array in
+the worker, against the worker attaching to the same array in a shared
+memory arena. Time is from request until the worker has read the last object.
+"""
+
+from common import build_library, report
+from pncpp import *
+import pncpp.shared as shared
+import ctypes
+import gc
+import multiprocessing
+import time
+
+LENGTH = 1000000
+REPEAT = 5
+
+SOURCE = """
+struct ClassA
+{
+    long value;
+    double weight;
+
+    long get();
+};
+
+long ClassA::get() { return value; }
+"""
+
+
+@cxx_struct(virtual=0)
+class ClassA(CXXStruct):
+
+    _fields_ = [
+        ("value", ctypes.c_long),
+        ("weight", ctypes.c_double)
+    ]
+
+    @cxx_method(t_long)
+    def get(self):
+        pass
+
+
+def worker(connection):
+    # allocator is inherited from parent, copies go to worker heap
+    ClassA._allocator_ = None
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        arena = None
+        if request[0] == "copy":
+            items = CXXArray(ClassA, LENGTH)
+            ctypes.memmove(items.address, request[1], len(request[1]))
+        else:
+            arena = shared.SharedArena(request[1])
+            items = arena.attach(ClassA, request[2], LENGTH)
+        connection.send(items[LENGTH - 1].get())
+        del items
+        gc.collect()
+        if arena is not None:
+            arena.close()
+
+
+def handoff_time(connection, request):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        connection.send(request())
+        assert connection.recv() == LENGTH - 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    ClassA.link_with(build_library("bench_shared", SOURCE))
+    arena = shared.SharedArena(size=LENGTH * ctypes.sizeof(ClassA.CStructure) + 4096)
+    ClassA._allocator_ = arena
+    items = CXXArray(ClassA, LENGTH)
+    for i in range(LENGTH):
+        items.buffer[i].value = i
+
+    parent, child = multiprocessing.get_context("fork").Pipe()
+    process = multiprocessing.get_context("fork").Process(target=worker, args=(child,))
+    process.start()
+    try:
+        offset = arena.offset_of(items)
+        report("hand off %d objects (%.1f MiB), requests per second:" %
+               (LENGTH, LENGTH * ctypes.sizeof(ClassA.CStructure) / 1048576.0), [
+            ("pickle through pipe", 1.0 / handoff_time(parent, lambda: ("copy", bytes(items.buffer)))),
+            ("attach to shared arena", 1.0 / handoff_time(parent, lambda: ("attach", arena.name, offset))),
+        ])
+    finally:
+        parent.send(None)
+        process.join()
+        ClassA._allocator_ = items = None
+        gc.collect()
+        arena.close()
+        arena.unlink()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark of native calls that release GIL
+
+Cost of releasing GIL for a tiny method (nogil=False against default), and
+a CPU-bound method called serially against NativeExecutor. Speedup of the
+executor depends on the number of CPUs.
+"""
+
+from common import build_library, report
+from pncpp import *
+import pncpp.executor as executor
+import ctypes
+import os
+import time
+
+CALLS = 200000
+ITEMS = 64
+WORK = 2000000
+
+SOURCE = """
+struct ClassA
+{
+    long value;
+
+    long get();
+    long spin(long count);
+};
+
+long ClassA::get() { return value; }
+
+long ClassA::spin(long count)
+{
+    volatile long result = value;
+    for (long i = 0; i < count; ++i)
+        result = result * 31 + i;
+    return result;
+}
+"""
+
+
+@cxx_struct(virtual=0)
+class ClassA(CXXStruct):
+
+    _fields_ = [
+        ("value", ctypes.c_long)
+    ]
+
+    @cxx_method(t_long)
+    def get(self):
+        pass
+
+    @cxx_method(t_long, nogil=False, name="get")
+    def get_gil(self):
+        pass
+
+    @cxx_method(t_long, t_long, concurrent=True)
+    def spin(self, count):
+        pass
+
+
+def calls_per_second(fn, count):
+    start = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    lib = build_library("bench_threads", SOURCE)
+    ClassA.link_with(lib)
+    obj = ClassA()
+    items = CXXArray(ClassA, ITEMS)
+
+    report("get() calls per second:", [
+        ("GIL released (default)", calls_per_second(lambda: [obj.get() for _ in range(CALLS)], CALLS)),
+        ("GIL held (nogil=False)", calls_per_second(lambda: [obj.get_gil() for _ in range(CALLS)], CALLS)),
+    ])
+
+    results = [("serial map", calls_per_second(lambda: ClassA.spin.map(items, WORK), ITEMS))]
+    for workers in sorted({2, os.cpu_count() or 1}):
+        with executor.NativeExecutor(workers) as pool:
+            results.append(("NativeExecutor, %d threads" % workers,
+                            calls_per_second(lambda: pool.map(ClassA.spin, items, WORK), ITEMS)))
+    report("spin(%d) calls per second (%d CPUs):" % (WORK, os.cpu_count() or 1), results)
+
+
+if __name__ == '__main__':
+    main()
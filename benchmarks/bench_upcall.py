@@ -0,0 +1,99 @@
+"""
+Benchmark of C++ -> Python virtual calls (upcalls), bidirectional example pattern
+
+C++ loop calls virtual method overridden in Python. Python wrapper is found
+by this address in instance registry; field read fallback and the old
+adapter (pointer argument, cast to py_object per call) are timed for comparison.
+"""
+
+from common import build_library, report
+from pncpp import *
+import pncpp.core
+import ctypes
+import time
+
+CALLS = 200000
+
+SOURCE = """
+struct SampleClass
+{
+    void* py_object;
+    int cpp_member;
+
+    SampleClass();
+    virtual int python_function(int a);
+    int run(int n);
+    virtual ~SampleClass();
+};
+
+SampleClass::SampleClass() {}
+SampleClass::~SampleClass() {}
+int SampleClass::python_function(int a) { return a; }
+
+int SampleClass::run(int n)
+{
+    int s = 0;
+    for (int i = 0; i < n; i++)
+        s += python_function(i);
+    return s;
+}
+"""
+
+
+@cxx_struct(virtual=1)
+class SampleClass(CXXStruct):
+
+    _pyobject_ = "py_object"
+    _fields_ = [
+        (_pyobject_, ctypes.c_void_p),
+        ("cpp_member", ctypes.c_int)
+    ]
+
+    @cxx_method(t_int, t_int, override=True)
+    def python_function(self, a):
+        return 1
+
+    @cxx_method(t_int, t_int)
+    def run(self, n):
+        pass
+
+
+class LegacyAdapter(object):
+
+    def __init__(self, fn, py_object_field):
+        self._fn = fn
+        self._py_object_field = py_object_field
+
+    def __call__(self, p_struct, *args):
+        py_object_addr = getattr(p_struct.contents, self._py_object_field)
+        py_object = ctypes.cast(py_object_addr, ctypes.POINTER(ctypes.py_object)).contents.value
+        return self._fn(py_object, *args)
+
+
+def upcall_rate(obj):
+    start = time.perf_counter()
+    obj.run(CALLS)
+    return CALLS / (time.perf_counter() - start)
+
+
+def main():
+    lib = build_library("bench_upcall", SOURCE)
+    SampleClass.link_with(lib)
+    obj = SampleClass()
+    results = [("registry", upcall_rate(obj))]
+
+    del pncpp.core._instances[ctypes.addressof(obj.struct)]
+    results.append(("python object field", upcall_rate(obj)))
+
+    method = SampleClass.__dict__["python_function"]
+    slot = SampleClass._vtable_index_[ctypes.cast(method.c_method, ctypes.c_void_p).value]
+    legacy = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(SampleClass.CStructure), ctypes.c_int)(
+        LegacyAdapter(method._py_func, SampleClass._pyobject_))
+    SampleClass._vtable_[slot] = ctypes.cast(legacy, ctypes.c_void_p)
+    results.append(("legacy adapter", upcall_rate(obj)))
+
+    report("upcalls per second:", results)
+
+
+if __name__ == '__main__':
+    main()
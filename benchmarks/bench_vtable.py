@@ -0,0 +1,69 @@
+"""
+Benchmark of linking a virtual class where every virtual method is overridden
+
+Override patching looks slots up in the address index built once per class;
+the linear scan over the vtable that it replaces is timed for comparison.
+Setting vtable pointer of new instance uses value cached at link, the casts
+it replaces are timed as well.
+"""
+
+from common import build_library, rate, report
+from pncpp import *
+import ctypes
+import time
+
+VIRTUALS = 300
+
+
+def library_source(count):
+    lines = ["struct Wide", "{", "    void* py_object;", "    int value;", "    Wide();"]
+    for i in range(count):
+        lines.append("    virtual int method%d(int a);" % i)
+    lines += ["    virtual ~Wide();", "};", "Wide::Wide() {}", "Wide::~Wide() {}"]
+    for i in range(count):
+        lines.append("int Wide::method%d(int a) { return value + %d; }" % (i, i))
+    return "\n".join(lines) + "\n"
+
+
+def declare(count):
+    namespace = {"_pyobject_": "py_object", "_fields_": [("py_object", ctypes.c_void_p), ("value", ctypes.c_int)]}
+    for i in range(count):
+        namespace["method%d" % i] = cxx_method(t_int, t_int, override=True)(lambda self, a: a)
+    return cxx_struct(name="Wide", virtual=count)(type("Wide", (CXXStruct,), namespace))
+
+
+def linear_slot(vtable, c_method):
+    for i, vt_entry in enumerate(vtable):
+        if vt_entry == ctypes.cast(c_method, ctypes.c_void_p).value:
+            return i
+
+
+def cast_vptr(obj):
+    vptr = ctypes.cast(obj._vtable_, ctypes.c_void_p).value + 0x10
+    obj.struct._vtable_ = ctypes.cast(ctypes.c_void_p(vptr), ctypes.POINTER(type(obj._vtable_)))
+
+
+def main():
+    lib = build_library("bench_vtable", library_source(VIRTUALS))
+    cls = declare(VIRTUALS)
+    start = time.perf_counter()
+    cls.link_with(lib)
+    link = time.perf_counter() - start
+    print("link class with %d overridden virtuals: %.1f ms" % (VIRTUALS, link * 1e3))
+
+    last = cls.__dict__["method%d" % (VIRTUALS - 1)].c_method
+    address = ctypes.cast(last, ctypes.c_void_p).value
+    report("slot lookups per second (last virtual):", [
+        ("linear scan", rate(lambda: linear_slot(cls._orig_vtable_, last), number=200)),
+        ("address index", rate(lambda: cls._vtable_index_[address])),
+    ])
+    obj = cls()
+    report("vtable pointer updates per second:", [
+        ("cast per instance", rate(lambda: cast_vptr(obj))),
+        ("cached pointer", rate(obj.override_vtable)),
+        ("new instance", rate(cls, number=20000)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
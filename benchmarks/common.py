@@ -0,0 +1,53 @@
+"""
+Shared helpers for pncpp benchmarks
+"""
+
+import ctypes
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+
+here = os.path.abspath(os.path.dirname(__file__))
+tests_dir = os.path.join(os.path.dirname(here), "tests")
+
+sys.path.insert(0, os.path.dirname(here))
+
+_build_dir = None
+
+
+def build_dir():
+    global _build_dir
+    if _build_dir is None:
+        _build_dir = tempfile.mkdtemp(prefix="pncpp_bench_")
+    return _build_dir
+
+
+def build_library(target, *sources, **kwargs):
+    """Compile C++ sources (paths or source text) into shared library and load it"""
+    out_dir = kwargs.get("out_dir") or build_dir()
+    files = []
+    for i, src in enumerate(sources):
+        if os.path.exists(src):
+            files.append(os.path.abspath(src))
+        else:
+            path = os.path.join(out_dir, "%s_%d.cpp" % (target, i))
+            with open(path, "w") as f:
+                f.write(src)
+            files.append(path)
+    out_name = os.path.join(out_dir, "%s.so" % target)
+    subprocess.check_call(["g++", "-O2", "-shared", "-fpic", "-I", tests_dir] + files + ["-o", out_name])
+    return ctypes.CDLL(out_name)
+
+
+def rate(fn, number=200000, repeat=5):
+    """Best of `repeat` runs, in calls per second"""
+    best = min(timeit.repeat(fn, number=number, repeat=repeat))
+    return number / best
+
+
+def report(title, results):
+    print(title)
+    for name, value in results:
+        print("    %-40s %14.0f /s" % (name, value))
@@ -0,0 +1,216 @@
+"""
+Benchmark suite of pncpp hot paths on a synthetic library
+
+Generates and compiles a library of many classes with overloaded methods and
+virtuals, then measures mangling, link time, downcall and upcall rates, field
+access, object construction and memory per object. Results are printed and
+optionally written as JSON; with a baseline JSON from an earlier run, changes
+are reported and the exit status is 1 when any result regressed by more than
+the threshold.
+
+    python run.py --output results.json
+    python run.py --baseline results.json --threshold 10
+"""
+
+from common import build_library
+from pncpp import *
+import pncpp.itanium_abi_mangle as mg
+import argparse
+import ctypes
+import gc
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+
+HIGHER = "higher"
+LOWER = "lower"
+
+
+def library_source(classes, methods, virtuals):
+    lines = []
+    for k in range(classes):
+        name = "Class%d" % k
+        lines += ["struct %s" % name, "{", "    void* py_object;", "    int value;", "    double weight;",
+                  "    %s(int value);" % name, "    virtual ~%s();" % name, "    int run(int n);"]
+        for j in range(methods):
+            lines += ["    int m%d(int a);" % j, "    int m%d(int a, int b);" % j, "    long m%d(long a);" % j]
+        for j in range(virtuals):
+            lines.append("    virtual int v%d(int a);" % j)
+        lines.append("};")
+        lines += ["%s::%s(int value): value(value), weight(0) {}" % (name, name), "%s::~%s() {}" % (name, name),
+                  "int %s::run(int n) { int s = 0; for (int i = 0; i < n; i++) s += v0(i); return s; }" % name]
+        for j in range(methods):
+            lines += ["int %s::m%d(int a) { return value + a; }" % (name, j),
+                      "int %s::m%d(int a, int b) { return value + a + b; }" % (name, j),
+                      "long %s::m%d(long a) { return value - a; }" % (name, j)]
+        for j in range(virtuals):
+            lines.append("int %s::v%d(int a) { return a + %d; }" % (name, j, j))
+    return "\n".join(lines) + "\n"
+
+
+def declare(classes, methods, virtuals):
+    result = []
+    for k in range(classes):
+        namespace = {
+            "_pyobject_": "py_object",
+            "_fields_": [("py_object", ctypes.c_void_p), ("value", ctypes.c_int), ("weight", ctypes.c_double)],
+            "construct": cxx_constructor(t_int)(lambda self, value: None),
+            "destroy": cxx_destructor()(lambda self: None),
+            "run": cxx_method(t_int, t_int)(lambda self, n: None),
+            # overridden in python, called back by run
+            "v0": cxx_method(t_int, t_int, override=True)(lambda self, a: a),
+        }
+        for j in range(methods):
+            namespace["m%d_i" % j] = cxx_method(t_int, t_int, name="m%d" % j)(lambda self, a: None)
+            namespace["m%d_ii" % j] = cxx_method(t_int, t_int, t_int, name="m%d" % j)(lambda self, a, b: None)
+            namespace["m%d_l" % j] = cxx_method(t_long, t_long, name="m%d" % j)(lambda self, a: None)
+        for j in range(1, virtuals):
+            namespace["v%d" % j] = cxx_method(t_int, t_int)(lambda self, a: None)
+        name = "Class%d" % k
+        result.append(cxx_struct(name=name, virtual=virtuals)(type(name, (CXXStruct,), namespace)))
+    return result
+
+
+def best_time(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def per_second(fn, number, repeat):
+    return number / min(timeit.repeat(fn, number=number, repeat=repeat))
+
+
+def measure(args):
+    lib = build_library("bench_suite", library_source(args.classes, args.methods, args.virtuals))
+    path = lib._name
+    results = {}
+
+    def add(name, value, unit, better):
+        results[name] = {"value": value, "unit": unit, "better": better}
+
+    def declared_methods(classes):
+        return [(cls, member) for cls in classes for member in cls.__dict__.values() if isinstance(member, CXXMethod)]
+
+    def mangle_fresh():
+        # signature nodes of earlier repeats are dropped, so names are built and encoded again
+        pairs = declared_methods(declare(args.classes, args.methods, args.virtuals))
+        gc.collect()
+        start = time.perf_counter()
+        for cls, member in pairs:
+            member.mangled_name(cls)
+        return time.perf_counter() - start
+
+    classes = declare(args.classes, args.methods, args.virtuals)
+    methods = declared_methods(classes)
+    add("mangle", len(methods) / min(mangle_fresh() for _ in range(args.repeat)), "names/s", HIGHER)
+
+    def link(cdll):
+        for cls in declare(args.classes, args.methods, args.virtuals):
+            cls.link_with(cdll)
+
+    # new CDLL object has its own resolver, so symbol table is read again
+    add("link_cold", best_time(lambda: link(ctypes.CDLL(path)), args.repeat) * 1e3, "ms", LOWER)
+    add("link_warm", best_time(lambda: link(lib), args.repeat) * 1e3, "ms", LOWER)
+    add("link_methods", len(methods), "methods", None)
+
+    for cls in classes:
+        cls.link_with(lib)
+    cls = classes[0]
+    obj = cls()
+    obj.construct(1)
+
+    number = args.calls
+    add("downcall_int", per_second(lambda: obj.m0_i(1), number, args.repeat), "calls/s", HIGHER)
+    add("downcall_overload", per_second(lambda: obj.m0_ii(1, 2), number, args.repeat), "calls/s", HIGHER)
+    add("downcall_long", per_second(lambda: obj.m0_l(5), number, args.repeat), "calls/s", HIGHER)
+    add("upcall", per_second(lambda: obj.run(number), 1, args.repeat) * number, "calls/s", HIGHER)
+    add("field_read", per_second(lambda: obj.value, number, args.repeat), "reads/s", HIGHER)
+
+    def write():
+        obj.weight = 1.5
+
+    add("field_write", per_second(write, number, args.repeat), "writes/s", HIGHER)
+
+    def construct():
+        item = cls()
+        item.construct(1)
+        item.dispose()
+
+    add("construct", per_second(construct, number // 10, args.repeat), "objects/s", HIGHER)
+
+    gc.collect()
+    tracemalloc.start()
+    objects = []
+    for i in range(args.objects):
+        item = cls()
+        item.construct(i)
+        objects.append(item)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    add("memory_per_object", float(size) / args.objects, "bytes", LOWER)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print change against baseline, return names of results worse by more than threshold percent"""
+    regressions = []
+    print("change against baseline:")
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None or not result["better"] or not old["value"]:
+            continue
+        change = (result["value"] - old["value"]) / old["value"] * 100.0
+        worse = -change if result["better"] == HIGHER else change
+        mark = ""
+        if worse > threshold:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        print("    %-24s %14.2f -> %14.2f %8.1f%%%s" % (name, old["value"], result["value"], change, mark))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--classes", type=int, default=20)
+    parser.add_argument("--methods", type=int, default=10, help="overloaded methods per class, 3 overloads each")
+    parser.add_argument("--virtuals", type=int, default=5, help="virtual methods per class")
+    parser.add_argument("--calls", type=int, default=100000, help="calls per timed run")
+    parser.add_argument("--objects", type=int, default=10000, help="objects for memory measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per result, best one is taken")
+    parser.add_argument("--output", help="write results to JSON file")
+    parser.add_argument("--baseline", help="compare with JSON file written by earlier run")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold, percent")
+    args = parser.parse_args(argv)
+
+    results = measure(args)
+    for name, result in sorted(results.items()):
+        print("%-24s %16.2f %s" % (name, result["value"], result["unit"]))
+
+    document = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "config": {key: getattr(args, key) for key in ("classes", "methods", "virtuals", "calls", "objects")},
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["config"] != document["meta"]["config"]:
+            print("warning: baseline was measured with different configuration %s" % baseline["meta"]["config"])
+        if compare(results, baseline["results"], args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
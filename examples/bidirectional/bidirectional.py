@@ -59,14 +59,11 @@ class SampleClass(CXXStruct):
     def run(self):
         """This function implemented in C++"""
 
-    def __del__(self):
-        self.destroy()
-
 if __name__ == '__main__':
 
     lib = ctypes.CDLL("bidirectional.dll")
     SampleClass.link_with(lib)
 
-    obj = SampleClass(cpp_member=42, python_member=77)
-    obj.run()
-    obj.destroy()
\ No newline at end of file
+    # object constructed by python is owned by wrapper and destroyed once, on exit from with block
+    with SampleClass(cpp_member=42, python_member=77) as obj:
+        obj.run()
@@ -0,0 +1,136 @@
+"""
+asyncio facade for native method calls
+
+Calls run on a bounded thread pool, so the event loop keeps running while
+C++ code works (as long as the method releases GIL, which is the CDLL default).
+Number of calls running at once is limited per wrapped class, time spent
+waiting for the limit and for a pool thread is collected as queue latency.
+
+Calls are made by acall(obj.method, ...) or Class.method.acall(obj, ...);
+bound methods have no acall of their own.
+"""
+
+import pncpp.executor as executor
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+import weakref
+
+
+class CallStats(object):
+    """Latency of calls of one method, times in seconds"""
+
+    __slots__ = ("calls", "errors", "queue_total", "queue_max", "run_total")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.queue_total = 0.0
+        self.queue_max = 0.0
+        self.run_total = 0.0
+
+    @property
+    def queue_mean(self):
+        return self.queue_total / self.calls if self.calls else 0.0
+
+    @property
+    def run_mean(self):
+        return self.run_total / self.calls if self.calls else 0.0
+
+    def __repr__(self):
+        return "CallStats(calls=%d, errors=%d, queue_mean=%.6f, queue_max=%.6f, run_mean=%.6f)" % \
+               (self.calls, self.errors, self.queue_mean, self.queue_max, self.run_mean)
+
+
+class AsyncCaller(object):
+    """
+    Runs native methods from coroutines
+
+    :param max_workers: pool threads shared by all classes
+    :param per_class: calls of one class running at once, by default max_workers;
+        class attribute _async_limit_ overrides it
+    """
+
+    def __init__(self, max_workers=None, per_class=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.per_class = per_class or self.max_workers
+        self._pool = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+        # semaphores are bound to event loop they are first used in
+        self._limits = weakref.WeakKeyDictionary()
+        self._stats = {}
+
+    def _limit(self, cls):
+        limits = self._limits.setdefault(asyncio.get_running_loop(), {})
+        result = limits.get(cls)
+        if result is None:
+            result = limits[cls] = asyncio.Semaphore(getattr(cls, "_async_limit_", None) or self.per_class)
+        return result
+
+    async def call(self, method, *args):
+        """
+        Await one call
+
+        :param method: bound method (obj.method) or CXXMethod with object as first argument
+        :return: call result, exception raised by call is raised here
+        """
+        method, obj = executor.unbind(method, concurrent=False)
+        if obj is not None:
+            args = (obj,) + args
+        method.require_resolved()
+        target = method._thunk or method
+        # class of object, method may be declared in base
+        cls = type(args[0]) if args else method.parent
+        key = "%s.%s" % (cls.__name__, method.attr_name or method.name)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = CallStats()
+
+        queued = time.perf_counter()
+        times = [queued, queued]
+
+        def run():
+            times[0] = time.perf_counter()
+            try:
+                return target(*args)
+            finally:
+                times[1] = time.perf_counter()
+
+        async with self._limit(cls):
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._pool, run)
+            except BaseException:
+                stats.errors += 1
+                raise
+            finally:
+                stats.calls += 1
+                wait = max(times[0] - queued, 0.0)
+                stats.queue_total += wait
+                stats.queue_max = max(stats.queue_max, wait)
+                stats.run_total += max(times[1] - times[0], 0.0)
+
+    def stats(self):
+        """Dict of "Class.method" -> CallStats"""
+        return dict(self._stats)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_caller():
+    """AsyncCaller used by acall and CXXMethod.acall, created on first use"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = AsyncCaller()
+        return _default
+
+
+def acall(method, *args):
+    """Awaitable call on default caller, see AsyncCaller.call"""
+    return default_caller().call(method, *args)
@@ -0,0 +1,357 @@
+"""
+Static binding modules generated from class declarations
+
+Declarations made with cxx_struct are linked once, at generation time, and
+written out as a flat module: CStructure types and field descriptors as
+source, literal symbol names, argtypes and restype of every function, vtable
+slots of python overrides. The generated module imports without decoration,
+mangling or symbol table scans, and its link() only looks up the listed
+symbols. Methods are plain functions calling module globals.
+
+    pncpp mymodule libfoo.so -o mymodule_bindings.py
+
+Generated classes keep field access, construction, ownership and upcalls of
+CXXStruct. Bodies of python overrides are taken from the declaration
+module, which is imported on the first upcall. Other python members of
+declared classes are not copied; subclass generated classes to add them.
+Features working on CXXMethod objects (map, acall, lazy link, profiling,
+instance overrides) need the declaration module.
+"""
+
+import pncpp.core as core
+import ctypes
+import importlib
+import os
+import sys
+
+
+# runtime support of generated modules
+
+def not_linked(*args):
+    raise RuntimeError("Bindings are not linked, call link() of generated module")
+
+
+def function(cdll, symbol, restype, argtypes, nogil=None):
+    """ctypes function of symbol with given types, see linker.SymbolResolver.function for nogil"""
+    if nogil is None:
+        fn = cdll._FuncPtr((symbol, cdll))
+    else:
+        import pncpp.linker as linker
+        fn = linker.function_type(cdll, nogil)((symbol, cdll))
+    fn.restype = restype
+    fn.argtypes = argtypes
+    return fn
+
+
+class Deferred(object):
+    """Python body of overridden virtual method, taken from declaration module on first call"""
+
+    def __init__(self, module, cls, name):
+        self.module = module
+        self.cls = cls
+        self.name = name
+        self._fn = None
+        self._adapters = []
+
+    def resolve(self):
+        if self._fn is None:
+            # method may be inherited, table of class has methods of bases too
+            declared = dict(getattr(importlib.import_module(self.module), self.cls)._methods_)[self.name]
+            self._fn = declared._py_func
+            # upcalls go straight to body from now on
+            for adapter in self._adapters:
+                adapter._fn = self._fn
+        return self._fn
+
+    def __call__(self, *args):
+        return (self._fn or self.resolve())(*args)
+
+
+def upcall(cls, body, restype, argtypes):
+    """C callback of python body taking this as address, see CXXMethod._make_closure"""
+    adapter = core.CXXClassMethodAdapter(body, cls._pyobject_, cls.CStructure)
+    if isinstance(body, Deferred):
+        body._adapters.append(adapter)
+    return ctypes.CFUNCTYPE(restype, ctypes.c_void_p, *argtypes)(adapter)
+
+
+def link_vtable(cls, cdll, symbol, overrides):
+    """Copy vtable of class from library and put closures of overrides, {slot: closure}, into copy"""
+    cls._orig_vtable_ = type(cls._vtable_).in_dll(cdll, symbol)
+    vtable = core._new_copy(cls._orig_vtable_)
+    for slot, closure in overrides.items():
+        vtable[slot] = ctypes.cast(closure, ctypes.c_void_p)
+    core._set_vtable(cls, vtable)
+
+
+def destructor(cls, cdll, symbol, nogil=None):
+    """Use symbol as destructor of owned objects of class, see CXXStruct.own"""
+    core._default_destructors[cls] = function(cdll, symbol, None, (ctypes.c_void_p,), nogil)
+
+
+# generator
+
+HEADER = '''"""
+Bindings of %(module)s for %(library)s
+
+Generated by pncpp.codegen, regenerate after declarations or library change.
+"""
+
+import pncpp.codegen as _codegen
+import pncpp.core as _core
+import ctypes
+
+LIBRARY = %(path)r
+
+_as_pointer = _core._as_pointer
+_as_struct = _core._as_struct
+_after_construct = _core._after_construct
+_before_destroy = _core._before_destroy'''
+
+
+def declared_classes(module):
+    """Classes decorated by cxx_struct in module, in definition order"""
+    return [member for member in vars(module).values()
+            if isinstance(member, type) and issubclass(member, core.CXXStruct)
+            and "CStructure" in member.__dict__ and member.__module__ == module.__name__]
+
+
+def _type_source(c_type, names):
+    if c_type is None:
+        return "None"
+    if c_type in names:
+        return names[c_type]
+    if getattr(ctypes, c_type.__name__, None) is c_type:
+        return "ctypes.%s" % c_type.__name__
+    if issubclass(c_type, ctypes._Pointer):
+        return "ctypes.POINTER(%s)" % _type_source(c_type._type_, names)
+    if issubclass(c_type, ctypes.Array):
+        return "(%s * %d)" % (_type_source(c_type._type_, names), c_type._length_)
+    raise ValueError("Can't generate ctypes type %r, structures must be of generated classes" % c_type)
+
+
+def _tuple_source(items):
+    items = list(items)
+    return "(%s,)" % items[0] if len(items) == 1 else "(%s)" % ", ".join(items)
+
+
+def _symbol(cls, method):
+    """Symbol method is resolved to, one found in library at its address if possible"""
+    symbol = cls._resolver.symbol_at(ctypes.cast(method.c_method, ctypes.c_void_p).value)
+    return symbol or method.mangled_name(cls)
+
+
+class _Writer(object):
+
+    def __init__(self, module, cdll, classes):
+        self.module = module
+        self.cdll = cdll
+        self.classes = classes
+        self.names = dict((cls.CStructure, "%s_CStructure" % cls.__name__) for cls in classes)
+        # structures of bases that are not generated stand for structure of subclass in inherited methods
+        for cls in classes:
+            for base in cls.__mro__[1:]:
+                if "CStructure" in base.__dict__ and issubclass(base, core.CXXStruct) and base is not core.CXXStruct:
+                    self.names.setdefault(base.CStructure, self.names[cls.CStructure])
+        self.pointers = dict((ctypes.POINTER(cls.CStructure), "%s_p" % cls.__name__) for cls in classes)
+        self.lines = []
+        self.stubs = []
+        self.bodies = []
+        self.link = []
+
+    def emit(self, line=""):
+        self.lines.append(line)
+
+    def structure(self, cls):
+        self.emit()
+        self.emit()
+        self.emit("class %s(ctypes.Structure):" % self.names[cls.CStructure])
+        self.emit("    pass")
+
+    def fields(self, cls):
+        # assigned after all structures are declared, so fields may point to any of them
+        self.emit()
+        self.emit("%s._fields_ = [" % self.names[cls.CStructure])
+        for field in cls.CStructure._fields_:
+            self.emit("    (%r, %s)," % (field[0], _type_source(field[1], self.names)))
+        self.emit("]")
+        self.emit("%s_p = ctypes.POINTER(%s)" % (cls.__name__, self.names[cls.CStructure]))
+
+    def thunk(self, cls, nm, method, target):
+        params = ["obj"]
+        call_args = ["obj.this"]
+        for i, c_type in enumerate(method.c_args[1:]):
+            arg = "a%d" % i
+            params.append(arg)
+            if issubclass(c_type, ctypes._Pointer):
+                call_args.append("_as_pointer(%s, %s)" % (arg, _type_source(c_type._type_, self.names)))
+            elif c_type is ctypes.c_void_p:
+                call_args.append("_as_pointer(%s)" % arg)
+            elif issubclass(c_type, ctypes.Structure):
+                call_args.append("_as_struct(%s)" % arg)
+            else:
+                call_args.append(arg)
+        if method.override:
+            # python body is called directly, not through C++
+            call = "%s(%s)" % (target, ", ".join(params))
+        else:
+            call = "%s(%s)" % (target, ", ".join(call_args))
+        self.emit()
+        self.emit("    def %s(%s):" % (nm, ", ".join(params)))
+        if method._type == 1:
+            self.emit("        result = %s" % call)
+            self.emit("        _after_construct(obj)")
+            self.emit("        return result")
+        elif method._type == 2:
+            self.emit("        _before_destroy(obj)")
+            self.emit("        return %s" % call)
+        else:
+            self.emit("        return %s" % call)
+
+    def wrapper(self, cls):
+        name = cls.__name__
+        self.emit()
+        self.emit()
+        self.emit("class %s(_core.CXXStruct):" % name)
+        self.emit()
+        self.emit("    CStructure = %s" % self.names[cls.CStructure])
+        self.emit("    _fields_ = %s._fields_%s" % (self.names[cls.CStructure], "[1:]" if cls._vtable_ else ""))
+        if cls._pyobject_:
+            self.emit("    _pyobject_ = %r" % cls._pyobject_)
+        for field in cls._fields_:
+            if isinstance(cls.__dict__.get(field[0]), core.CXXField):
+                self.emit("    %s = _core.CXXField(%r, %s.%s)" % (field[0], field[0], self.names[cls.CStructure], field[0]))
+
+        overrides = []
+        destructors = []
+        stubs = []
+        link = []
+        for nm, method in cls._methods_:
+            if method.c_method is None and method._lazy_owner is not None:
+                method.resolve_lazy()
+            if method.c_method is None:
+                self.emit()
+                self.emit("    # %s is not resolved in library" % nm)
+                continue
+            if method.override:
+                target = "_b_%s_%s" % (name, nm)
+                closure = "_u_%s_%s" % (name, nm)
+                self.bodies.append("%s = _codegen.Deferred(%r, %r, %r)" % (target, cls.__module__, name, nm))
+                stubs.append(closure)
+                link.append("    %s = _codegen.upcall(%s, %s, %s, %s)" % (
+                    closure, name, target, _type_source(method.c_method.restype, self.names),
+                    _tuple_source(_type_source(c_type, self.names) for c_type in method.c_args[1:])))
+                if cls._vtable_:
+                    slot = cls._vtable_index_.get(ctypes.cast(method.c_method, ctypes.c_void_p).value)
+                    overrides.append("%d: %s" % (slot, closure))
+            else:
+                target = "_f_%s_%s" % (name, nm)
+                symbol = _symbol(cls, method)
+                stubs.append(target)
+                # this of inherited method is pointer to structure of base
+                argtypes = ["%s_p" % name] + [_type_source(c_type, self.names) for c_type in method.c_args[1:]]
+                link.append("    %s = _codegen.function(cdll, %r, %s, %s, %r)" % (
+                    target, symbol, _type_source(method.c_method.restype, self.names),
+                    _tuple_source(argtypes), method.nogil))
+                if method._type == 2 and not method._args:
+                    destructors.append((symbol, method.nogil))
+            self.thunk(cls, nm, method, target)
+
+        if cls._vtable_:
+            self.emit()
+            self.emit()
+            self.emit("_core._set_vtable(%s, %s())" % (name, _type_source(type(cls._vtable_), self.names)))
+            link.append("    _codegen.link_vtable(%s, cdll, %r, {%s})" % (
+                name, str(cls._mangled.vtable()), ", ".join(overrides)))
+        if len(destructors) == 1:
+            link.append("    _codegen.destructor(%s, cdll, %r, %r)" % ((name,) + destructors[0]))
+        link.append("    %s._cdll = cdll" % name)
+        if stubs:
+            link.insert(0, "    global %s" % ", ".join(stubs))
+        self.stubs.extend(stubs)
+        self.link.extend(link)
+
+    def source(self):
+        self.emit(HEADER % {"module": self.module.__name__,
+                            "library": os.path.basename(self.cdll._name), "path": self.cdll._name})
+        for cls in self.classes:
+            self.structure(cls)
+        self.emit()
+        for cls in self.classes:
+            self.fields(cls)
+        # pointer types are referred to by name in argtypes
+        self.names.update(self.pointers)
+        for cls in self.classes:
+            self.wrapper(cls)
+
+        self.emit()
+        self.emit()
+        for stub in self.stubs:
+            self.emit("%s = _codegen.not_linked" % stub)
+        for body in self.bodies:
+            self.emit(body)
+        self.emit()
+        self.emit()
+        self.emit("def link(cdll=None):")
+        self.emit('    """Load functions of classes from library, LIBRARY by default"""')
+        self.emit("    if cdll is None:")
+        self.emit("        cdll = ctypes.CDLL(LIBRARY)")
+        self.lines.extend(self.link)
+        self.emit("    return cdll")
+        return "\n".join(self.lines) + "\n"
+
+
+def generate(module, library, classes=None):
+    """
+    Source of binding module for classes of module
+
+    Classes that are not linked yet are linked with library here.
+
+    :param module: module or its name
+    :param library: path of shared library or CDLL
+    :param classes: names of classes, all classes decorated in module by default
+    """
+    if isinstance(module, str):
+        module = importlib.import_module(module)
+    if isinstance(library, str):
+        library = ctypes.CDLL(os.path.abspath(library))
+    declared = declared_classes(module)
+    if classes is not None:
+        by_name = dict((cls.__name__, cls) for cls in declared)
+        missing = [name for name in classes if name not in by_name]
+        if missing:
+            raise ValueError("Classes not declared in %s: %s" % (module.__name__, ", ".join(missing)))
+        declared = [by_name[name] for name in classes]
+    for cls in declared:
+        if cls.__dict__.get("_cdll") is None:
+            cls.link_with(library)
+    return _Writer(module, library, declared).source()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="pncpp", description="Generate static binding module from declarations")
+    parser.add_argument("module", help="module declaring classes with cxx_struct, name or path of .py file")
+    parser.add_argument("library", help="shared library the classes are linked with")
+    parser.add_argument("-o", "--output", help="file to write, standard output by default")
+    parser.add_argument("-c", "--classes", help="comma separated class names, all classes of module by default")
+    args = parser.parse_args(argv)
+
+    module = args.module
+    if module.endswith(".py"):
+        sys.path.insert(0, os.path.dirname(os.path.abspath(module)))
+        module = os.path.splitext(os.path.basename(module))[0]
+    elif os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    classes = args.classes.split(",") if args.classes else None
+    source = generate(module, args.library, classes)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(source)
+    else:
+        sys.stdout.write(source)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,9 +11,16 @@ __email__ = "dmitry.pavluk@gmail.com"
 __status__ = "Development"
 
 import pncpp.itanium_abi_mangle as mg
+import array as _array
+import collections as _collections
 import ctypes
-import inspect
+import itertools as _itertools
+import operator as _operator
+import sys as _sys
+import threading as _threading
+import types as _types
 import warnings
+import weakref as _weakref
 
 
 class CXXType(object):
@@ -67,7 +74,8 @@ class SelfTypeRefProxy(CXXType):
         return [self._parent.self_class.CStructure, ctypes.POINTER(self._parent.self_class.CStructure)][ self._ref > 0 ]
 
     def get_mangled_type(self):
-        result = mg.s_arg(self._parent.idx)
+        # encoder replaces repeated class name with substitution reference
+        result = self._parent.self_class.get_mangled_type()
         if self.const:
             result = result.const()
         result = [result, result.ptr(), result.ref()][self._ref]
@@ -93,14 +101,14 @@ class SelfTypeProxy(SelfTypeRefProxy):
         self.idx = idx
 
 
-def cxx_struct(name=None, virtual=0, owner=None):
+def cxx_struct(name=None, virtual=0, owner=None, allocator=None):
 
     def decorator(cxx_struct):
         fields = []
 
         if virtual:
-            vtable_type = (ctypes.c_void_p * (virtual + 4)) # ?(1), typeinfo(1), destructor(2)
-            cxx_struct._vtable_ = vtable_type()
+            vtable_type = (ctypes.c_void_p * (virtual + 4)) # offset-to-top(1), typeinfo(1), destructor(2)
+            _set_vtable(cxx_struct, vtable_type())
             fields.append(('_vtable_', ctypes.POINTER(vtable_type)))
         fields.extend(cxx_struct._fields_)
 
@@ -110,27 +118,87 @@ def cxx_struct(name=None, virtual=0, owner=None):
         else:
             mangled_name = mg.struct(cls_name)
         cxx_struct._mangled = mangled_name
+        if allocator is not None:
+            cxx_struct._allocator_ = allocator
         cxx_struct.CStructure = type("%s_CStructure" % cxx_struct.__name__, (ctypes.Structure,), {"_fields_": fields})
 
-        for nm, member in inspect.getmembers(cxx_struct):
+        for field in cxx_struct._fields_:
+            current = cxx_struct.__dict__.get(field[0])
+            if current is None or isinstance(current, CXXField):
+                setattr(cxx_struct, field[0], CXXField(field[0], getattr(cxx_struct.CStructure, field[0])))
+
+        # only own attributes are scanned, methods of bases come from table of nearest decorated base
+        methods = dict(cxx_struct._methods_)
+        for nm, member in cxx_struct.__dict__.items():
             if issubclass(type(member), CXXMethod):
                 if member.name == None:
                     member.name = nm
+                member.attr_name = nm
                 member.parent = cxx_struct
-            elif issubclass(type(member), SelfTypeProxy):
-                member.self_class = cxx_struct
+                methods[nm] = member
+            else:
+                methods.pop(nm, None)
+                if issubclass(type(member), SelfTypeProxy):
+                    member.self_class = cxx_struct
+        cxx_struct._methods_ = tuple(methods.items())
 
         return cxx_struct
 
     return decorator
 
 
+class CXXField(property):
+    """
+    Accessor of CStructure field at fixed offset
+
+    Reads go through ctypes field descriptor directly, without attribute probing.
+    """
+
+    def __init__(self, name, c_field):
+        set_field = c_field.__set__
+
+        def fset(obj, value):
+            set_field(obj.struct, value)
+
+        super(CXXField, self).__init__(_operator.attrgetter("struct.%s" % name), fset)
+        self.name = name
+        self.offset = c_field.offset
+        self.size = c_field.size
+
+    def __repr__(self):
+        return "<CXXField %s offset=%d size=%d>" % (self.name, self.offset, self.size)
+
+
+# Itanium C++ ABI: vtable pointer of object points past offset-to-top and
+# RTTI pointer entries of its vtable, to the first virtual function slot
+_VTABLE_ADDRESS_POINT = 2 * ctypes.sizeof(ctypes.c_void_p)
+
+
+def _set_vtable(cls, vtable):
+    """Use vtable as class vtable copy and cache value of vtable pointer of instances"""
+    cls._vtable_ = vtable
+    cls._vptr_ = ctypes.addressof(vtable) + _VTABLE_ADDRESS_POINT
+    cls._vptr_field_ = ctypes.cast(ctypes.c_void_p(cls._vptr_), ctypes.POINTER(type(vtable)))
+
+
 def _new_copy(src):
     dst = type(src)()
     ctypes.pointer(dst)[0] = src
     return dst
 
 
+def _vtable_index(vtable):
+    """Slot of each address in vtable, first one for repeated addresses"""
+    index = {}
+    for slot, address in enumerate(vtable):
+        if address is not None:
+            index.setdefault(address, slot)
+    return index
+
+
+VTableSlot = _collections.namedtuple("VTableSlot", ["address", "symbol", "method"])
+
+
 def _ptr_copy(dst_ptr, src_ptr):
     dst_ptr[0] = src_ptr[0]
 
@@ -142,6 +210,10 @@ def _vtable_dump(vtable, max=10):
             break
 
 
+# guards first-access resolution of lazily linked methods
+_link_lock = _threading.RLock()
+
+
 class CXXMethod(object):
 
     def __init__(self, mtype, fn, ret_type, *args, **kwargs):
@@ -149,18 +221,61 @@ class CXXMethod(object):
         self.name = None
         self.static = False
         self.override = False
+        self.const = False
+        # None: GIL is released as library does (CDLL releases, PyDLL holds);
+        # holding GIL deadlocks if C++ calls python overrides from its own threads
+        self.nogil = None
+        # safe to call from several threads at once, see pncpp.executor
+        self.concurrent = False
 
         for k, v in kwargs.items():
             setattr(self, k, v)
 
+        if self.concurrent:
+            if self.nogil is False:
+                raise ValueError("Concurrent method must release GIL")
+            self.nogil = True
+
         self._py_func = fn
         self._ret = ret_type
         self._args = args
         self._type = mtype
         self.c_args = None
         self.parent = None
+        self.attr_name = None
         self.c_method = None
         self.v_method = None
+        self._thunk = None
+        self._adapter = None
+        self._lazy_owner = None
+        self._address_target = None
+        # timed map targets by structure and classes waiting to profile method, see pncpp.profiling
+        self._map_targets = None
+        self._profiled_in = ()
+
+    def mangled_name(self, cls):
+        """Mangled symbol name of method as member of cls"""
+        # functions with no arguments always have void in mangled name
+        m_args = [x.get_mangled_type() for x in self._args] or [mg.m_void]
+
+        # generate method signature
+        m_method = \
+        [[cls._mangled.method, cls._mangled.const_method][bool(self.const)](self.name, *m_args),
+         cls._mangled.constructor(1, *m_args),
+         cls._mangled.destructor(1)][self._type]
+        return str(m_method)
+
+    def _unresolved_message(self, cls, symbol):
+        message = "Method not resolved: %s" % symbol
+        index = cls._resolver.index()
+        if index is not None:
+            import pncpp.itanium_abi_demangle as dm
+            import pncpp.symbol_index as symbol_index
+            kind = [symbol_index.METHOD, symbol_index.CONSTRUCTOR, symbol_index.DESTRUCTOR][self._type]
+            suggestions = index.suggest(dm.format_node(cls._mangled.name), self.name, kind)
+            if suggestions:
+                message += "; did you mean: %s" % "; ".join(suggestions)
+        return message
 
     def resolve_as_member(self, cls):
         if not issubclass(cls, CXXStruct):
@@ -172,97 +287,356 @@ class CXXMethod(object):
         if self.c_method != None:
             return
 
-        m_args = [x.get_mangled_type() for x in self._args]
-
-        # handle relative type references (S_, S0_, S1, ...)
-        # Todo: move to separate method
-        prev = None
-        prev_i = 1
-        arg2idx = {}
-        for i, m_arg in enumerate(m_args):
-            str_arg = str(m_arg)
-            if m_arg.is_ref():
-                if str_arg in arg2idx:
-                    m_args[i] = mg.s_arg(arg2idx[str_arg])
-                else:
-                    for deref in m_arg.get_deref_list():
-                        str_deref = str(deref)
-                        if len(str_deref) > 1:
-                            arg2idx[str(deref)] = prev_i
-                            prev_i += 1
-
-        # functions with no arguments always have void in mangled name
-        if len(m_args) == 0:
-            m_args.append(mg.m_void)
-
-        # generate method signature
-        m_method = \
-        [cls._mangled.method(self.name, *m_args),
-         cls._mangled.constructor(1, *m_args),
-         cls._mangled.destructor(1)][self._type]
-        if not hasattr(cls._cdll, str(m_method)):
-            warnings.warn("Method not resolved: %s" % m_method)
+        symbol = cls._resolver.symbol(cls, self.attr_name or self.name, lambda: self.mangled_name(cls))
+        c_method = cls._resolver.function(symbol, self.nogil)
+        if c_method is None:
+            warnings.warn(self._unresolved_message(cls, symbol))
             return None
 
-        c_method = getattr(cls._cdll, str(m_method))
         c_method.restype = self._ret.get_ctypes_type()
         self.c_args = tuple([ctypes.POINTER(cls.CStructure)] + [x.get_ctypes_type() for x in self._args if x is not None])
-        c_method.argtypes = self.c_args
+        # this is taken as address, so subclasses with own structure type call inherited methods
+        c_method.argtypes = (ctypes.c_void_p,) + self.c_args[1:]
+
+        if self.override:
+            self.v_method = self._make_closure(cls, c_method)
+            self._patch_vtable(cls, c_method)
+
+        self._thunk = _compile_thunk(self, [c_method, self.v_method][bool(self.override)])
+        # set last: calls from other threads check c_method before using thunk
         self.c_method = c_method
+        for profiled in self._profiled_in:
+            # lazily resolved method of classes being profiled
+            profiled.__dict__["_profiler_"]._instrument(profiled, self)
+        self._profiled_in = ()
+
+    def _patch_vtable(self, cls, c_method):
+        """Put closure of override to slot of c_method in vtable copy of cls"""
+        if not cls._vtable_:
+            return
+        slot = cls._vtable_index_.get(ctypes.cast(c_method, ctypes.c_void_p).value)
+        if slot is None:
+            raise RuntimeError("Can't override virtual function '%s': not found in vtable" % self.name)
+        cls._vtable_[slot] = ctypes.cast(self.v_method, ctypes.c_void_p)
+
+    def _make_closure(self, cls, c_method):
+        """C callback of python implementation, libffi closure is executable memory held while method lives"""
+        if not cls._pyobject_:
+            raise RuntimeError("Can't override virtual function '%s': class has no _pyobject_ field" % self.name)
+        # this is passed as plain address, so upcall doesn't build pointer object
+        VMType = ctypes.CFUNCTYPE(c_method.restype, ctypes.c_void_p, *c_method.argtypes[1:])
+        self._adapter = CXXClassMethodAdapter(self._py_func, cls._pyobject_, cls.CStructure)
+        return VMType(self._adapter)
+
+    def require_resolved(self):
+        """Resolve lazily linked method now, raise AttributeError if it is not resolved"""
+        if self.c_method is None and self._lazy_owner is not None:
+            self.resolve_lazy()
+        if self.c_method is None:
+            raise AttributeError("Method not resolved")
 
-        VMType = ctypes.CFUNCTYPE(c_method.restype, *c_method.argtypes)
-
-        self.v_method = VMType(CXXClassMethodAdapter(self._py_func, cls._pyobject_))
-
-        if cls._vtable_:
-            vtable_resolved = False
-            for i, vt_entry in enumerate(cls._vtable_):
-                fptr = ctypes.cast(c_method, ctypes.c_void_p)
-                #print "VTABLE RESOLVE [%d]: %x <> %x" % (i, vt_entry or 0, fptr.value)
-                if vt_entry == fptr.value:
-                    #print "VTABLE RESOLVED [%d]: %x == %x" % (i, vt_entry or 0, fptr.value)
-                    if self.override:
-                        cls._vtable_[i] = ctypes.cast(self.v_method, ctypes.c_void_p)
-                        vtable_resolved = True
-                        break
-                        #print "VTABLE OVERRIDE [%d]: %x =  %x" % (i, cls._vtable_[i] or 0, fptr.value)
-            if self.override and not vtable_resolved:
-                raise RuntimeError("Can't override virtual function '%s': not found in vtable" % self.name)
+    def map(self, objects, *columns, **kwargs):
+        """
+        Call method for many objects and argument values
+
+        Columns are converted once, calls are made by builtin map() on a
+        function that takes this as address, so no wrapper code runs per call.
+
+        :param objects: CXXArray, sequence of instances or one instance for all calls
+        :param columns: one per argument: sequence, array.array, NumPy array, or single value for all calls
+        Constructors and destructors are not mapped, see CXXArray.construct and CXXArray.destroy.
+
+        :param out: preallocated array for return values (ctypes array, array.array, NumPy array...), one per call
+        :return: out or new ctypes array of return values, None if method returns void
+        :raise ValueError: out has other length than number of calls
+        """
+        self.require_resolved()
+        if self._type != 0:
+            # wrappers of objects would miss ownership and vtable hooks of construction
+            raise TypeError("Can't map constructor or destructor '%s', use CXXArray.construct or CXXArray.destroy"
+                            % (self.attr_name or self.name))
+        target = self.address_target()
+
+        if len(columns) != len(self.c_args) - 1:
+            raise TypeError("%s takes %d arguments, %d columns given" %
+                            (self.attr_name or self.name, len(self.c_args) - 1, len(columns)))
+        if issubclass(type(objects), CXXArray):
+            addresses = objects._addresses()
+            structure = objects.cls.CStructure
+        elif issubclass(type(objects), CXXStruct):
+            addresses = _itertools.repeat(ctypes.addressof(objects.struct))
+            structure = objects.CStructure
+        else:
+            structure = None
+            if self._map_targets:
+                objects = list(objects)
+                structure = objects[0].CStructure if objects else None
+            addresses = [ctypes.addressof(obj.struct) for obj in objects]
+        if self._map_targets:
+            # profiled calls are attributed to class of first object
+            target = self._map_targets.get(structure, target)
+        args = [_column(c_type, column) for c_type, column in zip(self.c_args[1:], columns)]
+
+        lengths = [len(arg) for arg in [addresses] + args if hasattr(arg, "__len__")]
+        if not lengths:
+            raise TypeError("Number of calls is unknown: objects and all columns are single values")
+        if min(lengths) != max(lengths):
+            raise ValueError("Objects and argument columns have different lengths")
+
+        values = list(map(target, addresses, *args))
+        if self.c_method.restype is None:
+            return None
+        out = kwargs.get("out")
+        if out is None:
+            out = (self.c_method.restype * len(values))()
+        elif len(out) != len(values):
+            # array.array slice assignment would resize it
+            raise ValueError("out has %d items, %d calls made" % (len(out), len(values)))
+        if issubclass(type(out), _array.array):
+            # array.array slice accepts only array of same type
+            values = _array.array(out.typecode, values)
+        out[:] = values
+        return out
+
+    def address_target(self):
+        """Function called by map, takes this as address; method must be resolved"""
+        if self._address_target is None:
+            self._address_target = self.v_method if self.override else _address_function(self)
+        return self._address_target
+
+    def starmap(self, objects, arg_tuples, **kwargs):
+        """Same as map with argument tuples, one per call"""
+        self.require_resolved()
+        columns = list(zip(*arg_tuples)) or [()] * (len(self.c_args) - 1)
+        return self.map(objects, *columns, **kwargs)
+
+    def acall(self, obj, *args):
+        """
+        Awaitable call on a thread of pncpp.aio default caller, so event loop is not blocked
+
+        Bound methods are plain functions without acall, use Class.method.acall(obj, ...)
+        or pncpp.aio.acall(obj.method, ...).
+        """
+        import pncpp.aio as aio
+        return aio.default_caller().call(self, obj, *args)
+
+    def _declaring_class(self, cls):
+        """Class method is resolved through: class declaring it when that one is linked, cls otherwise"""
+        parent = self.parent
+        if parent is not None and parent is not cls and parent.__dict__.get("_cdll") is not None:
+            return parent
+        return cls
+
+    def resolve_lazy(self):
+        """Resolve method deferred by lazy link, safe to call from several threads"""
+        with _link_lock:
+            cls = self._lazy_owner
+            if cls is None:
+                return
+            try:
+                self.resolve_as_member(self._declaring_class(cls))
+            finally:
+                self._lazy_owner = None
 
     def __get__(self, obj, objtype=None):
         if obj is None:
             return self
-        else:
+        if self._thunk is None and self._lazy_owner is not None:
+            self.resolve_lazy()
+        if self._thunk is None:
             return CXXMethodInvoke(obj, self)
+        # not cached in instance dict: bound method refers to wrapper, so cache
+        # would make wrapper collected by gc only, with its native object
+        return _types.MethodType(self._thunk, obj)
 
     def __call__(self, *args):
+        if not self.c_method and self._lazy_owner is not None:
+            self.resolve_lazy()
         if not self.c_method:
             raise AttributeError("Method not resolved")
+        if args and isinstance(args[0], CXXStruct):
+            # same call site as bound methods, so profiler records it
+            return self._thunk(*args)
 
         nargs = list(args)
         for i, arg in enumerate(nargs):
-            if issubclass(type(arg), CXXStruct):
-                c_type = self.c_args[i]
-                if issubclass(c_type, ctypes._Pointer):
-                    nargs[i] = arg.this
-                elif issubclass(c_type, ctypes.Structure):
-                    nargs[i] = arg.struct
+            c_type = self.c_args[i]
+            if issubclass(c_type, ctypes._Pointer):
+                nargs[i] = _as_pointer(arg, c_type._type_)
+            elif c_type is ctypes.c_void_p:
+                nargs[i] = _as_pointer(arg)
+            elif issubclass(type(arg), CXXStruct) and issubclass(c_type, ctypes.Structure):
+                nargs[i] = arg.struct
         if self.override:
-            result = self.v_method(*nargs)
+            return self.v_method(*nargs)
+        return self.c_method(*nargs)
+
+
+# arguments ctypes converts itself
+_native_args = (ctypes._SimpleCData, ctypes._Pointer, ctypes.Array, ctypes.Structure, ctypes.Union, ctypes._CFuncPtr,
+                type(ctypes.byref(ctypes.c_int())), bytes, str, int)
+
+# kinds of struct module format codes, buffer items must match pointer items in kind and size
+# ("u" and "w" are wchar_t of array.array, ctypes item codes "z" and "Z" are char and wchar_t pointers)
+_format_kinds = dict([(code, "signed") for code in "bhilqn"] + [(code, "unsigned") for code in "BHILQN"] +
+                     [(code, "float") for code in "efd"] + [("?", "bool")] +
+                     [(code, "wchar") for code in "uw"] + [(code, "pointer") for code in "PzZ"])
+_native_order = "<" if _sys.byteorder == "little" else ">!"
+# types of arguments seen passing _native_args check, skips isinstance on later calls
+_native_types = set()
+
+
+def _as_pointer(arg, item=ctypes.c_char):
+    """
+    Pointer argument: wrapped object by its pointer, buffer exporter by array over its memory
+
+    :param item: ctypes type pointer points to; char pointers take memory of any buffer
+    """
+    if isinstance(arg, CXXStruct):
+        return arg.this
+    if type(arg) in _native_types:
+        return arg
+    if arg is None or isinstance(arg, _native_args):
+        # ctypes caches its array and pointer types, so set stays small
+        _native_types.add(type(arg))
+        return arg
+    if hasattr(arg, "_as_parameter_"):
+        return arg
+    return _buffer_arg(arg, item)
+
+
+def _buffer_arg(arg, item):
+    """
+    ctypes array of item over memory of buffer exporter, no data is copied
+
+    The array holds buffer export until the call returns, so exporter is kept
+    alive and can't be resized meanwhile.
+    """
+    try:
+        view = memoryview(arg)
+    except TypeError:
+        # not a buffer, ctypes reports wrong argument type
+        return arg
+    if view.readonly:
+        raise TypeError("Read-only %s can't be passed as pointer argument" % type(arg).__name__)
+    if not view.c_contiguous:
+        raise TypeError("%s passed as pointer argument is not C-contiguous" % type(arg).__name__)
+    size = ctypes.sizeof(item)
+    if size != 1 and not _buffer_matches(view, item, size):
+        raise TypeError("Buffer of format '%s', itemsize %d can't be passed as pointer to %s" %
+                        (view.format, view.itemsize, item.__name__))
+    if not view.nbytes:
+        # memory of empty buffer may be at any address, callee gets NULL
+        return None
+    result = (item * (view.nbytes // size)).from_buffer(view)
+    if ctypes.addressof(result) % ctypes.alignment(item):
+        # e.g. structures over a slice of raw bytes
+        raise TypeError("%s passed as pointer to %s is not aligned to %d bytes" %
+                        (type(arg).__name__, item.__name__, ctypes.alignment(item)))
+    return result
+
+
+def _buffer_matches(view, item, size):
+    if issubclass(item, ctypes.Structure):
+        return view.itemsize == size or (view.itemsize == 1 and not view.nbytes % size)
+    code = view.format
+    if code[:1] in "@=" or (code[:1] and code[:1] in _native_order):
+        code = code[1:]
+    kind = _format_kinds.get(code)
+    return view.itemsize == size and kind is not None and kind == _format_kinds.get(getattr(item, "_type_", None))
+
+
+def _as_struct(arg):
+    if isinstance(arg, CXXStruct):
+        return arg.struct
+    return arg
+
+
+def _compile_thunk(method, target):
+    """
+    Build call function specialized for method signature.
+
+    Arguments are converted only at positions where declared ctypes type
+    is a pointer or a structure, so calls with plain values go straight to target.
+    """
+    params = ["obj"]
+    call_args = ["obj.this"]
+    namespace = {"_target": target, "_as_pointer": _as_pointer, "_as_struct": _as_struct,
+                 "_after_construct": _after_construct, "_before_destroy": _before_destroy}
+    for i, c_type in enumerate(method.c_args[1:]):
+        arg = "a%d" % i
+        params.append(arg)
+        if issubclass(c_type, ctypes._Pointer):
+            namespace["_item%d" % i] = c_type._type_
+            call_args.append("_as_pointer(%s, _item%d)" % (arg, i))
+        elif c_type is ctypes.c_void_p:
+            call_args.append("_as_pointer(%s)" % arg)
+        elif issubclass(c_type, ctypes.Structure):
+            call_args.append("_as_struct(%s)" % arg)
         else:
-            result = self.c_method(*nargs)
-        return result
+            call_args.append(arg)
+
+    call = "_target(%s)" % ", ".join(call_args)
+    if method._type == 1:
+        body = "    result = %s\n    _after_construct(obj)\n    return result\n" % call
+    elif method._type == 2:
+        body = "    _before_destroy(obj)\n    return %s\n" % call
+    else:
+        body = "    return %s\n" % call
+    source = "def thunk(%s):\n%s" % (", ".join(params), body)
+    exec(source, namespace)
+    thunk = namespace["thunk"]
+    thunk.__name__ = thunk.__qualname__ = method.attr_name or method.name
+    return thunk
+
+
+# address of C++ object -> weak reference to its python wrapper, see CXXClassMethodAdapter
+_instances = {}
+
+
+def _register_instance(obj):
+    address = ctypes.addressof(obj.struct)
+    box = obj.__dict__.get("_py_box_")
+    field = None if box is None else address + getattr(obj.CStructure, obj._pyobject_).offset
+    box_address = None if box is None else ctypes.addressof(box)
+
+    def forget(ref):
+        if _instances.get(address) is ref:
+            del _instances[address]
+        # memory is still valid here: callbacks run before wrapper drops its structure;
+        # upcalls after wrapper is gone find no python object instead of freed box
+        if field is not None and ctypes.c_void_p.from_address(field).value == box_address:
+            ctypes.c_void_p.from_address(field).value = None
+
+    _instances[address] = _weakref.ref(obj, forget)
+
+
+def _py_object_at(address):
+    return ctypes.py_object.from_address(ctypes.c_void_p.from_address(address).value).value
 
 
 class CXXClassMethodAdapter(object):
+    """
+    Calls python implementation of virtual method from C++
 
-    def __init__(self, fn, py_object_field):
+    Wrapper object is found by this address in instance registry; objects
+    that are not registered are recovered from their python object field,
+    CXXArray elements that have no view yet get one.
+    """
+
+    def __init__(self, fn, py_object_field, c_structure):
         self._fn = fn
         self._py_object_field = py_object_field
-
-    def __call__(self, p_struct, *args):
-        py_object_addr = getattr(p_struct.contents, self._py_object_field)
-        py_object = ctypes.cast(py_object_addr, ctypes.POINTER(ctypes.py_object)).contents.value
+        self._offset = getattr(c_structure, py_object_field).offset
+
+    def __call__(self, this, *args):
+        ref = _instances.get(this)
+        py_object = None if ref is None else ref()
+        if py_object is None:
+            if ctypes.c_void_p.from_address(this + self._offset).value:
+                py_object = _py_object_at(this + self._offset)
+            else:
+                py_object = _array_element_at(this)
         return self._fn(py_object, *args)
 
 t_void = VoidType()
@@ -316,6 +690,110 @@ def cxx_destructor(*args):
     return dec
 
 
+def link_classes(cdll, *classes, **kwargs):
+    """
+    Link classes with one library sharing its symbol table
+
+    Accepts same keyword arguments as CXXStruct.link_with and saves link cache once all classes are linked.
+    """
+    import pncpp.linker as linker
+    for cls in classes:
+        cls.link_with(cdll, **kwargs)
+    linker.resolver_for(cdll).save()
+
+
+_linked_classes = _weakref.WeakSet()
+
+
+def closure_report():
+    """
+    Number of callback closures held by each linked class
+
+    Closures are made only for virtual overrides; each one is a libffi
+    trampoline in executable memory that lives as long as its method.
+    """
+    return dict([(cls, len(cls.closures())) for cls in list(_linked_classes)])
+
+
+LeakRecord = _collections.namedtuple("LeakRecord", ["cls", "address", "stack"])
+
+# number of owned native objects per class
+_live = _collections.Counter()
+# address -> LeakRecord of owned objects while leak detection is on
+_leak_sites = None
+_default_destructors = _weakref.WeakKeyDictionary()
+
+
+def _default_destructor(cls):
+    """Address function of the only destructor of class or None"""
+    if cls not in _default_destructors:
+        destructors = [member for nm, member in cls._methods_ if member._type == 2 and not member._args]
+        fn = None
+        if len(destructors) == 1:
+            try:
+                fn = _address_function(cls._special_method(2, destructors[0], 0))
+            except AttributeError:
+                # destructor is declared but not found in library
+                pass
+        _default_destructors[cls] = fn
+    return _default_destructors[cls]
+
+
+def _caller_stack():
+    """Stack without frames of this module and compiled thunks"""
+    import traceback
+    stack = traceback.extract_stack()
+    while stack and stack[-1].filename in (__file__, "<string>"):
+        stack.pop()
+    return stack
+
+
+def _forget_native(cls, address):
+    _live[cls] -= 1
+    if _leak_sites is not None:
+        _leak_sites.pop(address, None)
+
+
+def _destroy_native(cls, address, destructor):
+    _forget_native(cls, address)
+    if destructor is not None:
+        destructor(address)
+
+
+def _after_construct(obj):
+    # C++ constructor has set vtable pointer to original vtable
+    obj.override_vtable()
+    if obj._owns_memory_ and not obj.owned:
+        obj.own()
+
+
+def _before_destroy(obj):
+    finalizer = obj._finalizer_
+    if finalizer is not None:
+        if not finalizer.alive:
+            raise RuntimeError("%s object at 0x%x is already destroyed" %
+                               (type(obj).__name__, ctypes.addressof(obj.struct)))
+        # destroyed explicitly, finalizer stays as destroyed mark
+        finalizer.detach()
+        _forget_native(type(obj), ctypes.addressof(obj.struct))
+
+
+def live_objects():
+    """Number of owned native objects alive, per class"""
+    return {cls: count for cls, count in _live.items() if count}
+
+
+def set_leak_detection(enabled=True):
+    """Record stack where each owned object was taken, see leak_report"""
+    global _leak_sites
+    _leak_sites = {} if enabled else None
+
+
+def leak_report():
+    """LeakRecord of each owned object alive, taken while leak detection was on"""
+    return [] if _leak_sites is None else list(_leak_sites.values())
+
+
 class CXXStruct(object):
 
     _cdll = None
@@ -324,20 +802,86 @@ class CXXStruct(object):
     _vtable_ = None
     _orig_vtable_ = None
     _pyobject_ = None
+    _resolver = None
+    _vtable_index_ = None
+    # places CStructure of new instances, see pncpp.shared
+    _allocator_ = None
+    # lifetime of native object, see CXXStruct.own
+    _owns_memory_ = False
+    _finalizer_ = None
+    # vtable pointer value of instances and the same as _vtable_ field value, see _set_vtable
+    _vptr_ = None
+    _vptr_field_ = None
+    # pncpp.profiling.Profiler recording calls of class methods
+    _profiler_ = None
+    # (attribute name, CXXMethod) pairs of class and its bases, filled by cxx_struct
+    _methods_ = ()
 
     @classmethod
-    def link_with(cls, cdll):
-        if cls._cdll == None:
+    def link_with(cls, cdll, cache=None, lazy=False, profile=None):
+        """
+        Resolve methods of class in library
+
+        :param cache: link cache directory or True for default one, see linker.resolver_for
+        :param lazy: resolve each method on its first access instead of now;
+                     virtual overrides are always resolved here as they patch the vtable
+        :param profile: pncpp.profiling.Profiler to record calls of class methods from start
+        """
+        import pncpp.linker as linker
+        # subclass of linked class is linked on its own
+        if cls.__dict__.get("_cdll") is None:
             cls._cdll = cdll
+            cls._resolver = linker.resolver_for(cdll, cache)
+            _linked_classes.add(cls)
             if cls._vtable_:
-                cls._orig_vtable_ = type(cls._vtable_).in_dll(cls._cdll, str(cls._mangled.vtable()))
-                cls._vtable_ = _new_copy(cls._orig_vtable_)
-            for nm, member in inspect.getmembers(cls):
-                if issubclass(type(member), CXXMethod):
-                    member.resolve_as_member(cls)
+                symbol = cls._resolver.symbol(cls, "_vtable_", lambda: str(cls._mangled.vtable()))
+                address = cls._resolver.address(symbol)
+                if address is None:
+                    raise ValueError("symbol '%s' not found" % symbol)
+                cls._orig_vtable_ = type(cls._vtable_).from_address(address)
+                _set_vtable(cls, _new_copy(cls._orig_vtable_))
+                cls._vtable_index_ = _vtable_index(cls._orig_vtable_)
+            for nm, member in cls._methods_:
+                if lazy and not member.override and member.c_method is None:
+                    # inherited member keeps class it was deferred by first
+                    if member._lazy_owner is None:
+                        member._lazy_owner = cls
+                else:
+                    member.resolve_as_member(member._declaring_class(cls))
+                    if member.v_method is not None:
+                        # override resolved for a base goes to vtable copy of subclass too
+                        member._patch_vtable(cls, member.c_method)
+            if profile is not None:
+                profile.enable(cls)
         else:
             raise Exception("Already linked with CDLL")
 
+    @classmethod
+    def closures(cls):
+        """Callback closures of overridden virtual methods of class"""
+        return [member.v_method for nm, member in cls._methods_ if member.v_method is not None]
+
+    @classmethod
+    def vtable_layout(cls):
+        """
+        Slots of linked class vtable
+
+        :return: list of VTableSlot(address, symbol, method), address is taken from
+                 original vtable, symbol is None where it can't be found, method is
+                 CXXMethod declared for the symbol or None
+        """
+        if cls._orig_vtable_ is None:
+            raise RuntimeError("Class has no linked vtable")
+        methods = {}
+        for nm, member in cls._methods_:
+            if member._type == 0:
+                methods[cls._resolver.symbol(cls, nm, lambda: member.mangled_name(cls))] = member
+        layout = []
+        for address in cls._orig_vtable_:
+            symbol = None if address is None else cls._resolver.symbol_at(address)
+            layout.append(VTableSlot(address, symbol, methods.get(symbol)))
+        return layout
+
     class CStructure(ctypes.Structure):
         pass
 
@@ -366,35 +910,515 @@ class CXXStruct(object):
         return False
 
     def __init__(self):
-        self.struct = self.CStructure()
-        self.this = ctypes.pointer(self.struct)
+        allocator = self._allocator_
+        if allocator is None:
+            self._attach(self.CStructure())
+            self._owns_memory_ = True
+        else:
+            shared = getattr(allocator, "shared", False)
+            self._attach(allocator.allocate(self.CStructure), shared)
+            self._owns_memory_ = not shared
+
+    @classmethod
+    def wrap(cls, pointer, own=False, destructor=None):
+        """
+        Wrapper of C++ object created elsewhere, memory is not copied
+
+        Object must be of this exact class: its vtable pointer is pointed to vtable
+        copy of class as for instances created by python.
+
+        :param pointer: address, c_void_p or pointer to CStructure
+        :param own: destroy object when wrapper is collected, see own
+        """
+        if isinstance(pointer, ctypes._Pointer):
+            address = ctypes.addressof(pointer.contents)
+        elif isinstance(pointer, ctypes.c_void_p):
+            address = pointer.value
+        else:
+            address = pointer
+        if not address:
+            raise ValueError("Can't wrap null pointer")
+        obj = cls.__new__(cls)
+        obj._attach(cls.CStructure.from_address(address))
+        if own:
+            obj.own(destructor)
+        return obj
+
+    @property
+    def owned(self):
+        """Native object is destroyed by python when wrapper is collected or disposed"""
+        return self._finalizer_ is not None and self._finalizer_.alive
+
+    def own(self, destructor=None):
+        """
+        Take ownership of native object
+
+        Objects made by __init__ are owned after their constructor is called through wrapper.
+        Owned object is destroyed once: by dispose (or with block), explicit destructor call,
+        or when wrapper is collected.
+
+        :param destructor: CXXMethod or its attribute name, or function taking object address
+                           (e.g. one deleting object allocated by C++); by default the only
+                           destructor of class, if there is one
+        :return: self
+        """
+        if self.owned:
+            return self
+        cls = type(self)
+        if destructor is None:
+            fn = _default_destructor(cls)
+        elif issubclass(type(destructor), CXXMethod) or isinstance(destructor, str):
+            fn = _address_function(cls._special_method(2, destructor, 0))
+        else:
+            fn = destructor
+        address = ctypes.addressof(self.struct)
+        self._finalizer_ = _weakref.finalize(self, _destroy_native, cls, address, fn)
+        _live[cls] += 1
+        if _leak_sites is not None:
+            _leak_sites[address] = LeakRecord(cls, address, _caller_stack())
+        return self
+
+    def disown(self):
+        """Give up ownership, e.g. when object is passed to C++ that deletes it; return self"""
+        if self.owned:
+            self._finalizer_.detach()
+            _forget_native(type(self), ctypes.addressof(self.struct))
+        self._finalizer_ = None
+        return self
+
+    def dispose(self):
+        """Destroy owned native object now"""
+        if self.owned:
+            self._finalizer_()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose()
+
+    def _attach(self, struct, shared=False):
+        """
+        Bind wrapper to structure memory
+
+        :param shared: memory is seen by other processes, python object pointer
+                       is not stored in it and upcalls find wrapper in registry only
+        """
+        self.struct = struct
+        self.this = ctypes.pointer(struct)
 
         if self._pyobject_:
-            # save pointer to python object
-            setattr(self.struct, self._pyobject_, ctypes.cast(ctypes.pointer(ctypes.py_object(self)), ctypes.c_void_p))
+            if not shared:
+                # field points to box with borrowed reference to wrapper, box lives
+                # as long as wrapper, so wrapper is freed by reference counting
+                self._py_box_ = ctypes.c_void_p(id(self))
+                setattr(self.struct, self._pyobject_, ctypes.addressof(self._py_box_))
+            _register_instance(self)
+
+        if shared and self._vptr_ is not None:
+            _check_shared_vptr(ctypes.addressof(struct), self._vptr_)
+        else:
+            self.override_vtable()
 
-        self.override_vtable()
+    @classmethod
+    def numpy_dtype(cls):
+        """NumPy structured dtype matching CStructure layout, vtable pointer included (requires numpy)"""
+        import pncpp.numpy_bridge as numpy_bridge
+        return numpy_bridge.structure_dtype(cls.CStructure)
+
+    def as_numpy(self):
+        """Zero-copy NumPy array of one record over object memory (requires numpy)"""
+        import pncpp.numpy_bridge as numpy_bridge
+        return numpy_bridge.as_array(self.struct, self.CStructure)
+
+    @classmethod
+    def _special_method(cls, mtype, which, nargs):
+        """Resolved constructor (mtype 1) or destructor (mtype 2), given or the only one taking nargs arguments"""
+        if issubclass(type(which), CXXMethod):
+            method = which
+        elif which is not None:
+            method = getattr(cls, which)
+        else:
+            candidates = [member for nm, member in cls._methods_
+                          if member._type == mtype and len(member._args) == nargs]
+            if len(candidates) != 1:
+                raise TypeError("%d %s methods of %s take %d arguments, choose one explicitly" %
+                                (len(candidates), ["constructor", "destructor"][mtype - 1], cls.__name__, nargs))
+            method = candidates[0]
+        method.require_resolved()
+        return method
 
     def override_vtable(self):
+        """Point vtable pointer of object to vtable copy with python overrides"""
+        if self._vptr_field_ is not None:
+            self.struct._vtable_ = self._vptr_field_
+
+    def set_instance_override(self, name, fn):
+        """
+        Override virtual method for this object only
+
+        First override gives object its own copy of class vtable, other slots keep
+        functions of class vtable. Python calls of method on object go to fn too.
+        The copy lives as long as wrapper; when wrapper is collected, object
+        is pointed back to class vtable.
+
+        :param name: attribute name of method declared in class for the virtual function
+        :param fn: function taking object and method arguments, None restores class implementation
+        """
+        cls = type(self)
+        method = getattr(cls, name)
+        if not issubclass(type(method), CXXMethod) or method._type != 0:
+            raise TypeError("'%s' is not a C++ method" % name)
+        method.require_resolved()
+        slot = cls._vtable_index_.get(ctypes.cast(method.c_method, ctypes.c_void_p).value) \
+            if cls._vtable_index_ is not None else None
+        if slot is None:
+            raise RuntimeError("Can't override virtual function '%s': not found in vtable" % method.name)
+
+        overrides = self.__dict__.get("_instance_overrides_")
+        if overrides is None:
+            if fn is None:
+                return
+            vtable = _new_copy(cls._vtable_)
+            overrides = self._instance_overrides_ = {}
+            self._instance_vtable_ = vtable
+            vptr = ctypes.addressof(vtable) + _VTABLE_ADDRESS_POINT
+            self._vptr_field_ = ctypes.cast(ctypes.c_void_p(vptr), ctypes.POINTER(type(vtable)))
+            self.override_vtable()
+            # vtable copy lives in wrapper, native object of wrap() or disown() may outlive it
+            _weakref.finalize(self, _restore_vptr, ctypes.addressof(self.struct) + self.CStructure._vtable_.offset,
+                             vptr, cls._vptr_)
+
+        if fn is None:
+            overrides.pop(name, None)
+            self.__dict__.pop(name, None)
+            self._instance_vtable_[slot] = cls._vtable_[slot]
+            return
+        VMType = ctypes.CFUNCTYPE(method.c_method.restype, ctypes.c_void_p, *method.c_method.argtypes[1:])
+        # closure refers to object weakly, object owns closure
+        override = _InstanceOverride(fn, _weakref.ref(self))
+        closure = VMType(override)
+        overrides[name] = closure
+        self._instance_vtable_[slot] = ctypes.cast(closure, ctypes.c_void_p)
+        self.__dict__[name] = override.call
+
+
+def _check_shared_vptr(address, vptr):
+    """
+    Set vtable pointer of object in shared memory if it is not set yet, otherwise check it
+
+    Pointer written by other process is kept, so it must be the same as in this one.
+    """
+    field = ctypes.c_void_p.from_address(address)
+    if field.value is None:
+        field.value = vptr
+    elif field.value != vptr:
+        raise ValueError("Vtable pointer of object in shared memory is of other process, processes "
+                         "must map library and vtable copies at the same addresses (fork after linking)")
+
+
+def _restore_vptr(field, instance_vptr, class_vptr):
+    if ctypes.c_void_p.from_address(field).value == instance_vptr:
+        ctypes.c_void_p.from_address(field).value = class_vptr
+
+
+class _InstanceOverride(object):
+
+    def __init__(self, fn, ref):
+        self._fn = fn
+        self._ref = ref
+
+    def __call__(self, this, *args):
+        return self._fn(self._ref(), *args)
+
+    def call(self, *args):
+        return self._fn(self._ref(), *args)
+
 
-        if hasattr(self.struct, '_vtable_'):
-            #print("override before: %x" % (ctypes.cast(self.struct._vtable_, ctypes.c_void_p).value or 0))
-            #_vtable_dump(self._orig_vtable_)
+# arrays of classes with python object field, for upcalls on elements that have no view yet
+_arrays = _weakref.WeakSet()
 
-            new_vtable_addr = ctypes.cast(self._vtable_, ctypes.c_void_p).value + 0x10  # TODO: describe offset
 
-            self.struct._vtable_ = ctypes.cast(ctypes.c_void_p(new_vtable_addr), ctypes.POINTER(type(self._vtable_)))
-            #print("override after: %x" % ctypes.cast(self.struct._vtable_, ctypes.c_void_p).value)
-            #_vtable_dump(self._vtable_)
+def _array_element_at(address):
+    for items in list(_arrays):
+        if items.address <= address < items.address + len(items) * items.itemsize:
+            return items[(address - items.address) // items.itemsize]
+    return None
 
-    def __getattr__(self, item):
-        if item != "struct" and hasattr(self.struct, item):
-            return getattr(self.struct, item)
 
-        return super(CXXStruct, self).__getattribute__(item)
+def _address_function(method):
+    """Copy of resolved function of method that takes this as plain address"""
+    fn = type(method.c_method)(ctypes.cast(method.c_method, ctypes.c_void_p).value)
+    fn.restype = method.c_method.restype
+    fn.argtypes = (ctypes.c_void_p,) + tuple(method.c_args[1:])
+    return fn
+
+
+def _column(c_type, column):
+    """Argument values of batched call converted once for the whole column"""
+    if not hasattr(column, "__iter__") or issubclass(type(column), (str, bytes, CXXStruct)):
+        return _itertools.repeat(_convert_arg(c_type, column))
+    if hasattr(column, "tolist"):
+        # array.array, NumPy array, memoryview: python values in one call
+        column = column.tolist()
+    if issubclass(c_type, (ctypes._Pointer, ctypes.Structure)):
+        return [_convert_arg(c_type, arg) for arg in column]
+    return column
+
+
+def _convert_arg(c_type, arg):
+    if issubclass(c_type, ctypes._Pointer):
+        return _as_pointer(arg, c_type._type_)
+    if c_type is ctypes.c_void_p:
+        return _as_pointer(arg)
+    if issubclass(c_type, ctypes.Structure):
+        return _as_struct(arg)
+    return arg
+
+
+def _convert_args(method, args):
+    return [_convert_arg(c_type, arg) for c_type, arg in zip(method.c_args[1:], args)]
+
+
+class CXXArray(object):
+    """
+    Array of wrapped class instances in one contiguous CStructure block
+
+    Elements are accessed through views made on first access by index. Views
+    share memory with the array and are created without calling __init__ of
+    class. Contiguous slices are arrays over the same memory. Array is passed
+    to C++ functions taking T* as pointer to its first element. Memory is
+    taken from allocator of class if it has one.
+    """
+
+    def __init__(self, cls, length):
+        if not issubclass(cls, CXXStruct):
+            raise TypeError("CXXArray element type must be CXXStruct subclass")
+        allocator = cls._allocator_
+        if allocator is None:
+            self._bind(cls, (cls.CStructure * length)(), False, {})
+        else:
+            self._bind(cls, allocator.allocate(cls.CStructure * length), getattr(allocator, "shared", False), {})
+
+    def _bind(self, cls, buffer, shared, views):
+        self.cls = cls
+        self.buffer = buffer
+        self.this = ctypes.cast(buffer, ctypes.POINTER(cls.CStructure))
+        self.address = ctypes.addressof(buffer)
+        self.itemsize = ctypes.sizeof(cls.CStructure)
+        self._shared = shared
+        self._views = views
+        if cls._pyobject_:
+            _arrays.add(self)
+
+    @property
+    def _as_parameter_(self):
+        return self.this
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def as_numpy(self):
+        """Zero-copy NumPy array of all elements, see CXXStruct.numpy_dtype (requires numpy)"""
+        import pncpp.numpy_bridge as numpy_bridge
+        return numpy_bridge.as_array(self.buffer, self.cls.CStructure)
+
+    def __getitem__(self, idx):
+        if issubclass(type(idx), slice):
+            return self._slice(idx)
+        if idx < 0:
+            idx += len(self.buffer)
+        if not 0 <= idx < len(self.buffer):
+            raise IndexError("CXXArray index out of range")
+        # views are keyed by address, so they are shared with slices of array
+        address = self.address + idx * self.itemsize
+        view = self._views.get(address)
+        if view is None:
+            view = self.cls.__new__(self.cls)
+            view._attach(self.buffer[idx], self._shared)
+            self._views[address] = view
+        return view
+
+    def _slice(self, idx):
+        start, stop, step = idx.indices(len(self.buffer))
+        if step != 1:
+            raise ValueError("CXXArray slice must be contiguous")
+        length = max(stop - start, 0)
+        result = CXXArray.__new__(CXXArray)
+        buffer = (self.cls.CStructure * length).from_buffer(self.buffer, start * self.itemsize)
+        result._bind(self.cls, buffer, self._shared, self._views)
+        return result
+
+    def __iter__(self):
+        for idx in range(len(self.buffer)):
+            yield self[idx]
+
+    def _addresses(self):
+        return range(self.address, self.address + len(self.buffer) * self.itemsize, self.itemsize)
+
+    def construct(self, *args, **kwargs):
+        """
+        Call C++ constructor on every element with the same arguments
+
+        :param constructor: CXXMethod or its attribute name, by default the only
+                            constructor of class taking len(args) arguments
+        """
+        method = self.cls._special_method(1, kwargs.get("constructor"), len(args))
+        fn = _address_function(method)
+        args = _convert_args(method, args)
+        if self.cls._vtable_:
+            # constructor sets vtable pointer of C++ class, point it back to vtable copy with overrides
+            vptr = self.cls._vptr_
+            for address in self._addresses():
+                fn(address, *args)
+                ctypes.c_void_p.from_address(address).value = vptr
+        else:
+            for address in self._addresses():
+                fn(address, *args)
+
+    def destroy(self, destructor=None):
+        """Call C++ destructor on every element, last element first"""
+        fn = _address_function(self.cls._special_method(2, destructor, 0))
+        for address in reversed(self._addresses()):
+            fn(address)
+
+
+PoolStats = _collections.namedtuple("PoolStats", ["hits", "misses", "in_use", "high_water", "free", "discarded"])
+
+
+class ObjectPool(object):
+    """
+    Free list of wrapped instances reusing their native storage
+
+    Released objects keep their CStructure, pointer, python object field and
+    registration; acquire only calls C++ constructor on them and puts back the
+    precomputed vtable pointer, release only calls destructor. Instances are
+    created without calling __init__ of class, in memory of class allocator
+    if it has one. Python attributes set on wrapper survive reuse. Classes
+    without constructor get zeroed memory. Acquired instance collected without
+    release is destroyed and stops counting as in use.
+
+    :param max_size: released objects kept for reuse, others are dropped
+    :param destructor: CXXMethod or its attribute name, by default the only destructor of class;
+                       False to release without destructor call
+    """
+
+    def __init__(self, cls, max_size=64, destructor=None):
+        if not issubclass(cls, CXXStruct):
+            raise TypeError("ObjectPool element type must be CXXStruct subclass")
+        self.cls = cls
+        self.max_size = max_size
+        self._free = []
+        # weak reference to acquired instance -> its structure; reference calls back if
+        # instance is collected unreleased, and is equal to any reference to same live instance
+        self._acquired = {}
+        self._constructors = {}
+        self._vptr = cls._vptr_
+        self._size = ctypes.sizeof(cls.CStructure)
+        self._py_offset = getattr(cls.CStructure, cls._pyobject_).offset if cls._pyobject_ else None
+        self._destructor = None
+        if destructor is not False and (destructor is not None or self._count(2, 0)):
+            self._destructor = _address_function(cls._special_method(2, destructor, 0))
+        self.hits = 0
+        self.misses = 0
+        self.in_use = 0
+        self.high_water = 0
+        self.discarded = 0
+
+    def _count(self, mtype, nargs):
+        return len([member for nm, member in self.cls._methods_
+                    if member._type == mtype and len(member._args) == nargs])
+
+    def _constructor(self, nargs, which):
+        key = (nargs, which)
+        result = self._constructors.get(key)
+        if result is None:
+            method = fn = None
+            if which is not None or nargs or self._count(1, 0):
+                method = self.cls._special_method(1, which, nargs)
+                fn = _address_function(method)
+            result = self._constructors[key] = (method, fn)
+        return result
+
+    def acquire(self, *args, **kwargs):
+        """
+        Constructed instance, reused if one is free
+
+        :param constructor: CXXMethod or its attribute name, by default the only
+                            constructor of class taking len(args) arguments
+        """
+        method, fn = self._constructor(len(args), kwargs.get("constructor"))
+        if self._free:
+            obj = self._free.pop()
+            self.hits += 1
+        else:
+            obj = self.cls.__new__(self.cls)
+            allocator = self.cls._allocator_
+            if allocator is None:
+                obj._attach(self.cls.CStructure())
+            else:
+                obj._attach(allocator.allocate(self.cls.CStructure), getattr(allocator, "shared", False))
+            self.misses += 1
+        address = ctypes.addressof(obj.struct)
+        if fn is None:
+            py_object = None if self._py_offset is None else ctypes.c_void_p.from_address(address + self._py_offset).value
+            ctypes.memset(address, 0, self._size)
+            if py_object is not None:
+                ctypes.c_void_p.from_address(address + self._py_offset).value = py_object
+        else:
+            fn(address, *_convert_args(method, args))
+        if self._vptr is not None:
+            ctypes.c_void_p.from_address(address).value = self._vptr
+        self._acquired[_weakref.ref(obj, self._dropped)] = obj.struct
+        self.in_use += 1
+        if self.in_use > self.high_water:
+            self.high_water = self.in_use
+        return obj
+
+    def release(self, obj):
+        """
+        Destroy instance and keep it for reuse
+
+        :raise ValueError: instance is not acquired from pool or is released already
+        """
+        # dropped reference with callback doesn't call it
+        if self._acquired.pop(_weakref.ref(obj), None) is None:
+            raise ValueError("Object is not acquired from pool or is released already")
+        if self._destructor is not None:
+            self._destructor(ctypes.addressof(obj.struct))
+        self.in_use -= 1
+        if len(self._free) < self.max_size:
+            self._free.append(obj)
+        else:
+            self.discarded += 1
+
+    def _dropped(self, ref):
+        """Acquired instance collected without release, its structure is still alive here"""
+        struct = self._acquired.pop(ref)
+        if self._destructor is not None:
+            self._destructor(ctypes.addressof(struct))
+        self.in_use -= 1
+
+    def borrow(self, *args, **kwargs):
+        """Context manager acquiring instance and releasing it on exit"""
+        return _Borrowed(self, self.acquire(*args, **kwargs))
+
+    def clear(self):
+        """Drop free instances"""
+        del self._free[:]
+
+    def stats(self):
+        return PoolStats(self.hits, self.misses, self.in_use, self.high_water, len(self._free), self.discarded)
+
+
+class _Borrowed(object):
+
+    def __init__(self, pool, obj):
+        self._pool = pool
+        self._obj = obj
 
-    def __setattr__(self, item, value):
-        if item != "struct" and hasattr(self.struct, item):
-            return setattr(self.struct, item, value)
+    def __enter__(self):
+        return self._obj
 
-        return super(CXXStruct, self).__setattr__(item, value)
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._pool.release(self._obj)
@@ -0,0 +1,139 @@
+"""
+Minimal ELF reader for shared object dynamic symbol tables
+
+https://refspecs.linuxfoundation.org/elf/gabi4+/ch4.symtab.html
+
+"""
+
+import struct
+
+ELF_MAGIC = b"\x7fELF"
+
+SHT_NOTE = 7
+SHT_DYNSYM = 11
+SHT_GNU_VERSYM = 0x6fffffff
+
+SHN_UNDEF = 0
+
+VERSYM_HIDDEN = 0x8000
+
+STT_OBJECT = 1
+STT_FUNC = 2
+STT_GNU_IFUNC = 10
+
+NT_GNU_BUILD_ID = 3
+
+
+class ELFError(Exception):
+    pass
+
+
+class Section(object):
+
+    def __init__(self, sh_type, offset, size, link, entsize):
+        self.type = sh_type
+        self.offset = offset
+        self.size = size
+        self.link = link
+        self.entsize = entsize
+
+
+class ELFFile(object):
+    """
+    Reads section headers of ELF file on construction, section data on demand
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            ident = f.read(64)
+            if ident[:4] != ELF_MAGIC:
+                raise ELFError("Not an ELF file: %s" % path)
+
+            self.is64 = ident[4] == 2
+            self.endian = ["<", ">"][ident[5] == 2]
+
+            if self.is64:
+                header = struct.unpack_from(self.endian + "HHIQQQIHHHHHH", ident, 16)
+            else:
+                header = struct.unpack_from(self.endian + "HHIIIIIHHHHHH", ident, 16)
+            sh_off, sh_entsize, sh_num = header[5], header[10], header[11]
+
+            f.seek(sh_off)
+            table = f.read(sh_entsize * sh_num)
+
+        section_fmt = self.endian + ["IIIIIIIIII", "IIQQQQIIQQ"][self.is64]
+        self.sections = []
+        for i in range(sh_num):
+            sh = struct.unpack_from(section_fmt, table, i * sh_entsize)
+            self.sections.append(Section(sh[1], sh[4], sh[5], sh[6], sh[9]))
+
+    def section_data(self, section):
+        with open(self.path, "rb") as f:
+            f.seek(section.offset)
+            return f.read(section.size)
+
+    def build_id(self):
+        """GNU build-id as hex string or None"""
+        for section in self.sections:
+            if section.type != SHT_NOTE:
+                continue
+            data = self.section_data(section)
+            pos = 0
+            while pos + 12 <= len(data):
+                namesz, descsz, n_type = struct.unpack_from(self.endian + "III", data, pos)
+                pos += 12
+                name = data[pos:pos + namesz]
+                pos += (namesz + 3) & ~3
+                desc = data[pos:pos + descsz]
+                pos += (descsz + 3) & ~3
+                if n_type == NT_GNU_BUILD_ID and name[:3] == b"GNU":
+                    return desc.hex()
+        return None
+
+    def dynamic_symbols(self):
+        """
+        Defined functions and objects of .dynsym
+
+        GNU indirect functions are left out, st_value of them is address of
+        resolver, implementation is chosen at load time and found by dlsym.
+        So are hidden symbol versions, dlsym finds default version only.
+
+        :return: dict of symbol name to st_value (offset from load base for shared objects)
+        """
+        result = {}
+        for index, section in enumerate(self.sections):
+            if section.type != SHT_DYNSYM:
+                continue
+            strtab = self.section_data(self.sections[section.link])
+            data = self.section_data(section)
+            versions = None
+            for other in self.sections:
+                if other.type == SHT_GNU_VERSYM and other.link == index:
+                    versions = self.section_data(other)
+            if self.is64:
+                fmt = self.endian + "IBBHQQ"
+            else:
+                fmt = self.endian + "IIIBBH"
+            for i, entry in enumerate(struct.iter_unpack(fmt, data[:len(data) - len(data) % section.entsize])):
+                if self.is64:
+                    st_name, st_info, _, st_shndx, st_value, _ = entry
+                else:
+                    st_name, st_value, _, st_info, _, st_shndx = entry
+                if st_shndx == SHN_UNDEF or not st_name:
+                    continue
+                if (st_info & 0xf) not in (STT_FUNC, STT_OBJECT):
+                    continue
+                if versions is not None and struct.unpack_from(self.endian + "H", versions, 2 * i)[0] & VERSYM_HIDDEN:
+                    continue
+                end = strtab.index(b"\0", st_name)
+                result[strtab[st_name:end].decode("ascii", "replace")] = st_value
+        return result
+
+
+def read_dynamic_symbols(path):
+    return ELFFile(path).dynamic_symbols()
+
+
+def read_build_id(path):
+    return ELFFile(path).build_id()
@@ -0,0 +1,93 @@
+"""
+Thread pool for native methods declared with concurrent=True
+
+Concurrent methods release GIL while C++ code runs, so calls dispatched to
+several threads run in parallel. Python overrides called back from C++
+(including from threads started by C++) acquire GIL in their ctypes callback.
+"""
+
+import pncpp.core as core
+import concurrent.futures
+import os
+
+
+def unbind(method, concurrent=True):
+    """
+    CXXMethod and object of method given directly or bound to object
+
+    :param concurrent: require method declared with concurrent=True
+    :return: (CXXMethod, object or None)
+    """
+    if isinstance(method, core.CXXMethodInvoke):
+        return unbind(method._method, concurrent)[0], method._obj
+    obj = getattr(method, "__self__", None)
+    if obj is not None:
+        method = getattr(type(obj), method.__name__)
+    if not issubclass(type(method), core.CXXMethod):
+        raise TypeError("CXXMethod expected, got %r" % (method,))
+    if concurrent and not method.concurrent:
+        raise ValueError("Method '%s' is not declared concurrent" % (method.attr_name or method.name))
+    return method, obj
+
+
+class NativeExecutor(object):
+    """
+    Runs concurrent native methods on a pool of threads
+
+    Can be used as context manager, pool is shut down on exit.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+
+    def submit(self, method, *args):
+        """
+        Schedule one call
+
+        :param method: bound method (obj.method) or CXXMethod with object as first argument
+        :return: concurrent.futures.Future of call result
+        """
+        method, obj = unbind(method)
+        if obj is not None:
+            args = (obj,) + args
+        method.require_resolved()
+        return self._pool.submit(method._thunk or method, *args)
+
+    def map(self, method, objects, *columns, **kwargs):
+        """
+        Batched call split across threads, see CXXMethod.map
+
+        :param objects: CXXArray or sequence of instances
+        :param chunksize: calls per task, by default objects are split evenly between workers
+        :return: list of return values, None if method returns void
+        """
+        method, _ = unbind(method)
+        method.require_resolved()
+        count = len(objects)
+        chunksize = kwargs.get("chunksize") or max(1, -(-count // self.max_workers))
+
+        futures = []
+        for start in range(0, count, chunksize):
+            stop = min(start + chunksize, count)
+            chunk_columns = [_chunk(column, start, stop) for column in columns]
+            futures.append(self._pool.submit(method.map, objects[start:stop], *chunk_columns))
+        results = [future.result() for future in futures]
+        if method.c_method.restype is None:
+            return None
+        return [value for chunk in results for value in chunk]
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+def _chunk(column, start, stop):
+    if not hasattr(column, "__iter__") or issubclass(type(column), (str, bytes, core.CXXStruct)):
+        return column
+    return column[start:stop]
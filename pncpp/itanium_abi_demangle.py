@@ -0,0 +1,305 @@
+"""
+Demangler of C++ symbol names (Itanium C++ ABI)
+
+Symbols are parsed into the object model of itanium_abi_mangle, so str() of
+parse result gives the same symbol back.
+
+https://mentorembedded.github.io/cxx-abi/abi.html
+
+"""
+
+import pncpp.itanium_abi_mangle as mg
+
+
+class DemangleError(ValueError):
+    pass
+
+
+builtin_names = {
+    "v": "void", "w": "wchar_t", "b": "bool", "c": "char", "a": "signed char", "h": "unsigned char",
+    "s": "short", "t": "unsigned short", "i": "int", "j": "unsigned int", "l": "long", "m": "unsigned long",
+    "x": "long long", "y": "unsigned long long", "n": "__int128", "o": "unsigned __int128",
+    "f": "float", "d": "double", "e": "long double", "g": "__float128", "z": "...",
+    "Dd": "decimal64", "De": "decimal128", "Df": "decimal32", "Dh": "half", "Di": "char32_t",
+    "Ds": "char16_t", "Du": "char8_t", "Da": "auto", "Dc": "decltype(auto)", "Dn": "decltype(nullptr)",
+}
+
+operator_names = {
+    "nw": "new", "na": "new[]", "dl": "delete", "da": "delete[]", "ps": "+", "ng": "-", "ad": "&",
+    "de": "*", "co": "~", "pl": "+", "mi": "-", "ml": "*", "dv": "/", "rm": "%", "an": "&", "or": "|",
+    "eo": "^", "aS": "=", "pL": "+=", "mI": "-=", "mL": "*=", "dV": "/=", "rM": "%=", "aN": "&=",
+    "oR": "|=", "eO": "^=", "ls": "<<", "rs": ">>", "lS": "<<=", "rS": ">>=", "eq": "==", "ne": "!=",
+    "lt": "<", "gt": ">", "le": "<=", "ge": ">=", "ss": "<=>", "nt": "!", "aa": "&&", "oo": "||",
+    "pp": "++", "mm": "--", "cm": ",", "pm": "->*", "pt": "->", "cl": "()", "ix": "[]", "qu": "?",
+}
+
+_abbreviations = dict([(v, k) for k, v in mg._std_abbreviations.items()])
+
+_references = {"P": mg.Ref.BY_POINTER, "R": mg.Ref.BY_REFERENCE, "O": mg.Ref.BY_RVALUE_REFERENCE}
+
+
+class _Parser(object):
+
+    def __init__(self, symbol):
+        self.s = symbol
+        self.pos = 0
+        self.subs = []
+
+    def error(self, message):
+        raise DemangleError("%s at %d: %s" % (message, self.pos, self.s))
+
+    def peek(self):
+        return self.s[self.pos:self.pos + 1]
+
+    def expect(self, token):
+        if not self.s.startswith(token, self.pos):
+            self.error("Expected '%s'" % token)
+        self.pos += len(token)
+
+    def number(self):
+        start = self.pos
+        while self.s[self.pos:self.pos + 1].isdigit():
+            self.pos += 1
+        if start == self.pos:
+            self.error("Expected number")
+        return int(self.s[start:self.pos])
+
+    def encoding(self):
+        self.expect("_Z")
+        if self.s.startswith("TV", self.pos):
+            self.pos += 2
+            result = mg.VTable(self.type().type_obj)
+        else:
+            name, const = self.function_name()
+            args = []
+            while self.pos < len(self.s):
+                args.append(self.type())
+            if args:
+                result = mg.FnSig(name, mg.Args(*args), const)
+            elif const:
+                self.error("Expected function arguments")
+            else:
+                # data symbol has no type in its encoding
+                result = mg.TypeSig(name)
+        if self.pos != len(self.s):
+            self.error("Unexpected trailing characters")
+        return result
+
+    def function_name(self):
+        if self.peek() == "N":
+            return self.nested_name(True)
+        if self.s.startswith("St", self.pos):
+            self.pos += 2
+            parts = ("std", self.unqualified())
+        else:
+            parts = (self.unqualified(),)
+        if self.peek() == "I":
+            self.subs.append(mg.Name(*parts))
+            parts += (self.template_args(),)
+        return mg.Name(*parts), False
+
+    def nested_name(self, function):
+        self.expect("N")
+        const = self.peek() == "K"
+        if const:
+            self.pos += 1
+        parts = ()
+        while self.peek() != "E":
+            if not self.peek():
+                self.error("Unterminated nested name")
+            candidate = True
+            if not parts and self.s.startswith("St", self.pos):
+                self.pos += 2
+                parts = ("std",)
+                candidate = False
+            elif not parts and self.peek() == "S":
+                node = self.substitution()
+                if not issubclass(type(node), mg.Name):
+                    self.error("Unsupported prefix")
+                parts = node.parts
+                candidate = False
+            elif self.peek() == "I":
+                if not parts:
+                    self.error("Template arguments without name")
+                parts += (self.template_args(),)
+            else:
+                parts += (self.unqualified(),)
+            if candidate and (not function or self.peek() != "E"):
+                self.subs.append(mg.Name(*parts))
+        self.pos += 1
+        if function:
+            return mg.Name(*parts), const
+        if const:
+            self.error("Qualified nested type name")
+        return mg.Name(*parts)
+
+    def unqualified(self):
+        c = self.peek()
+        if c.isdigit():
+            length = self.number()
+            name = self.s[self.pos:self.pos + length]
+            if len(name) != length:
+                self.error("Truncated source name")
+            self.pos += length
+            return name
+        code = self.s[self.pos:self.pos + 2]
+        if c in "CD" and code[1:].isdigit():
+            self.pos += 2
+            return [mg.Constructor, mg.Destructor][c == "D"](int(code[1]))
+        if code in operator_names:
+            self.pos += 2
+            return mg.Operator(code)
+        self.error("Unsupported name")
+
+    def substitution(self):
+        self.expect("S")
+        code = "S" + self.peek()
+        if code in _abbreviations:
+            self.pos += 1
+            return _abbreviations[code]
+        end = self.s.find("_", self.pos)
+        if end < 0:
+            self.error("Unterminated substitution")
+        digits = self.s[self.pos:end]
+        self.pos = end + 1
+        idx = int(digits, 36) + 1 if digits else 0
+        if idx >= len(self.subs):
+            self.error("Substitution out of range")
+        return self.subs[idx]
+
+    def template_args(self):
+        self.expect("I")
+        args = []
+        while self.peek() != "E":
+            if self.peek() == "L":
+                self.pos += 1
+                arg_type = self.type()
+                end = self.s.find("E", self.pos)
+                if end < 0:
+                    self.error("Unterminated literal")
+                args.append(mg.Literal(arg_type, self.s[self.pos:end]))
+                self.pos = end + 1
+            elif not self.peek():
+                self.error("Unterminated template arguments")
+            else:
+                args.append(self.type())
+        self.pos += 1
+        return mg.Template(*args)
+
+    def class_name(self, parts):
+        name = mg.Name(*parts)
+        self.subs.append(name)
+        if self.peek() == "I":
+            name = mg.Name(*(parts + (self.template_args(),)))
+            self.subs.append(name)
+        return mg.Type(name)
+
+    def type(self):
+        c = self.peek()
+        if c in builtin_names:
+            self.pos += 1
+            return mg.mkstype(c)
+        code = self.s[self.pos:self.pos + 2]
+        if code in builtin_names:
+            self.pos += 2
+            return mg.mkstype(code)
+        if c in _references:
+            self.pos += 1
+            result = mg.Type(self.type(), _references[c])
+            self.subs.append(result)
+            return result
+        if c == "K":
+            self.pos += 1
+            result = mg.Type(self.type(), mg.Ref.BY_VALUE, True)
+            self.subs.append(result)
+            return result
+        if c == "N":
+            return mg.Type(self.nested_name(False))
+        if c.isdigit():
+            return self.class_name((self.unqualified(),))
+        if code == "St":
+            self.pos += 2
+            return self.class_name(("std", self.unqualified()))
+        if c == "S":
+            node = self.substitution()
+            if self.peek() == "I":
+                if not issubclass(type(node), mg.Name):
+                    self.error("Unsupported template name")
+                name = mg.Name(*(node.parts + (self.template_args(),)))
+                self.subs.append(name)
+                return mg.Type(name)
+            return mg.Type(node)
+        if c == "T":
+            self.pos += 1
+            idx = 0 if self.peek() == "_" else self.number() + 1
+            self.expect("_")
+            arg = mg.TemplateArg(idx)
+            self.subs.append(arg)
+            return mg.Type(arg)
+        self.error("Unsupported type")
+
+
+def parse(symbol):
+    """
+    Parse mangled symbol into mangle object model
+
+    :return: FnSig for functions (return type is first of args for function templates),
+             VTable for virtual tables, TypeSig for data
+    :raise DemangleError: symbol is not mangled or uses unsupported constructs
+    """
+    return _Parser(symbol).encoding()
+
+
+def _format_parts(parts):
+    result = []
+    for part in parts:
+        if issubclass(type(part), str):
+            result.append(part)
+        elif issubclass(type(part), mg.Template):
+            result[-1] += "<%s>" % ", ".join([format_node(t) for t in part.types])
+        elif issubclass(type(part), mg.Constructor):
+            result.append(result[-1].split("<")[0])
+        elif issubclass(type(part), mg.Destructor):
+            result.append("~" + result[-1].split("<")[0])
+        elif issubclass(type(part), mg.Operator):
+            result.append("operator" + operator_names[part.code])
+        else:
+            result.append(str(part))
+    return "::".join(result)
+
+
+def format_node(node):
+    """C++ declaration text of mangle model node"""
+    if issubclass(type(node), mg.Type):
+        if node.is_ref():
+            return format_node(node.val()) + ["", "*", "&", "&&"][node._reference_type]
+        if node.is_const():
+            return format_node(node.type_obj) + " const"
+        return format_node(node.type_obj)
+    if issubclass(type(node), mg.BType):
+        return builtin_names.get(node.short_typename, node.short_typename)
+    if issubclass(type(node), mg.Name):
+        return _format_parts(node.parts)
+    if issubclass(type(node), mg.FnSig):
+        args = node.args.args
+        if len(args) == 1 and args[0] is mg.m_void:
+            args = ()
+        return "%s(%s)%s" % (format_node(node.name), ", ".join([format_node(a) for a in args]),
+                             ["", " const"][node.const])
+    if issubclass(type(node), mg.TypeSig):
+        return format_node(node.name)
+    if issubclass(type(node), mg.VTable):
+        return "vtable for %s" % format_node(node.name)
+    if issubclass(type(node), mg.TemplateArg):
+        return "T%d" % node.idx
+    if issubclass(type(node), mg.Literal):
+        return node.value.replace("n", "-")
+    return str(node)
+
+
+def demangle(symbol):
+    """Human readable form of symbol, symbol itself if it can't be parsed"""
+    try:
+        return format_node(parse(symbol))
+    except DemangleError:
+        return symbol
@@ -12,24 +12,207 @@ __license__ = "MIT"
 __maintainer__ = "Dmitry Pavliuk"
 __email__ = "dmitry.pavluk@gmail.com"
 __status__ = "Development"
+import functools
+import weakref
+from _weakref import _remove_dead_weakref
+
+# pool of each node class: constructor arguments -> weak reference to node in
+# use, so equal nodes built while one is alive are the same instance; plain
+# dicts keep lookup of pooled node in C
+_pools = []
+
+
+class _PoolRef(weakref.ref):
+    # key is set after construction: weakref.KeyedRef takes it in Python level
+    # __new__ and __init__, which cost more than building the node itself
+
+    __slots__ = ("key",)
+
+
+def _drop(pool, ref):
+    # removes entry only if it is still dead, node may have been built again
+    _remove_dead_weakref(pool, ref.key)
+
+
+_set = object.__setattr__
+
+_seq_digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def seq_id(idx):
+    """Substitution reference of idx-th candidate: S_, S0_, ..., SZ_, S10_, ..."""
+    if idx == 0:
+        return "S_"
+    idx -= 1
+    digits = ""
+    while True:
+        digits = _seq_digits[idx % 36] + digits
+        idx //= 36
+        if not idx:
+            break
+    return "S%s_" % digits
+
+
+class Encoder(object):
+    """
+    Writer of mangled names with substitution table
+
+    Substitution candidates are keyed by what identifies them without
+    building a node: prefixes and template names by their parts, qualified
+    types by (type_obj, reference_type, const), template parameters by
+    interned node. Every lookup is O(1) and whole signature is encoded in
+    a single pass.
+    """
+
+    def __init__(self):
+        self.out = []
+        self.table = {}
+
+    def emit(self, s):
+        self.out.append(s)
+
+    def substitute(self, key):
+        idx = self.table.get(key)
+        if idx is None:
+            return False
+        self.out.append(seq_id(idx))
+        return True
+
+    def add(self, key):
+        if key not in self.table:
+            self.table[key] = len(self.table)
+
+    def prefix(self, parts):
+        """Encode name parts as <prefix>, registering each level as candidate"""
+        if self.substitute(parts):
+            return
+        abbreviation = _std_prefixes.get(parts)
+        if abbreviation is not None:
+            self.emit(abbreviation)
+            return
+        if parts == ("std",):
+            self.emit("St")
+            return
+        if len(parts) > 1:
+            self.prefix(parts[:-1])
+        self.unqualified(parts[-1])
+        self.add(parts)
+
+    def unqualified(self, part):
+        if issubclass(type(part), str):
+            self.emit("%d%s" % (len(part), part))
+        else:
+            part._mangle(self)
+
+    def result(self):
+        return "".join(self.out)
+
+
+def _is_unscoped(parts):
+    """Name is single (possibly std:: and template) component, encoded without N..E"""
+    count = len(parts)
+    if count and parts[0] == "std":
+        count -= 1
+    if count and isinstance(parts[-1], Template):
+        count -= 1
+    return count == 1
+
+
+class Node(object):
+    """
+    Immutable hash-consed node of mangle object model
+
+    Nodes constructed from equal arguments are the same instance, so they
+    can be compared and hashed by identity. Encoded string is computed on
+    first str() and cached. Pool refers to nodes weakly, node that is not
+    used any more is dropped with its encoding. Types derived with .ptr(),
+    .ref(), .const() and TypeSig.type() are kept by the node they are
+    derived from.
+    """
+
+    __slots__ = ("_str", "__weakref__")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # per class pool is keyed by the argument tuple itself, no key is built per call
+        cls._pool = {}
+        cls._drop = functools.partial(_drop, cls._pool)
+        _pools.append(cls._pool)
+
+    def __new__(cls, *args):
+        pool = cls._pool
+        ref = pool.get(args)
+        if ref is not None:
+            node = ref()
+            if node is not None:
+                return node
+        node = object.__new__(cls)
+        node._setup(*args)
+        ref = _PoolRef(node, cls._drop)
+        ref.key = args
+        # dict operations are atomic, so no lock is needed: the first node
+        # added wins, a dead entry is removed and adding is retried
+        current = pool.setdefault(args, ref)
+        while current is not ref:
+            pooled = current()
+            if pooled is not None:
+                return pooled
+            _remove_dead_weakref(pool, args)
+            current = pool.setdefault(args, ref)
+        return node
+
+    def _setup(self, *key):
+        pass
+
+    def __setattr__(self, key, value):
+        raise AttributeError("%s is immutable" % type(self).__name__)
+
+    def __delattr__(self, key):
+        raise AttributeError("%s is immutable" % type(self).__name__)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
+    def __str__(self):
+        try:
+            return self._str
+        except AttributeError:
+            result = self._encode()
+            _set(self, "_str", result)
+            return result
 
-class Name(object):
+    def __repr__(self):
+        return "<%s %s>" % (type(self).__name__, self)
 
-    def __init__(self, *parts):
-        self.parts = list(parts)
+    def _encode(self):
+        enc = Encoder()
+        self._mangle(enc)
+        return enc.result()
 
-    def __str__(self):
+    def _mangle(self, enc):
+        raise NotImplementedError()
 
-        packed_ns = []
 
-        for x in self.parts:
-            if issubclass(type(x), str):
-                packed_ns.append("%d%s" % (len(x), x))
-            else:
-                packed_ns.append(str(x))
+class Name(Node):
 
-        return ["N%sE", "%s"][len(self.parts) == 1] % ("".join(packed_ns))
+    __slots__ = ("parts",)
+
+    def _setup(self, *parts):
+        _set(self, "parts", parts)
+
+    def _mangle(self, enc):
+        parts = self.parts
+        if enc.substitute(parts):
+            return
+        if _is_unscoped(parts):
+            enc.prefix(parts)
+        else:
+            enc.emit("N")
+            enc.prefix(parts)
+            enc.emit("E")
 
 
 class Ref:
@@ -37,71 +220,106 @@ class Ref:
     BY_VALUE = 0
     BY_POINTER = 1
     BY_REFERENCE = 2
+    BY_RVALUE_REFERENCE = 3
 
-    mflags = ["", "P", "R"]
+    mflags = ["", "P", "R", "O"]
 
 
-class BType(object):
-    def __init__(self, short_typename):
-        self.short_typename = short_typename
+class BType(Node):
 
-    def __str__(self):
-        return self.short_typename
+    __slots__ = ("short_typename",)
 
+    def _setup(self, short_typename):
+        _set(self, "short_typename", short_typename)
 
-class TemplateArg(object):
+    def _mangle(self, enc):
+        enc.emit(self.short_typename)
 
-    def __init__(self, idx):
-        self.idx = idx
 
-    def __str__(self):
+class TemplateArg(Node):
+
+    __slots__ = ("idx",)
+
+    def _setup(self, idx):
+        _set(self, "idx", idx)
+
+    def _mangle(self, enc):
+        if enc.substitute(self):
+            return
         if (self.idx == 0):
-            return "T_"
+            enc.emit("T_")
         else:
-            return "T%d_" % (self.idx - 1)
+            enc.emit("T%d_" % (self.idx - 1))
+        enc.add(self)
 
 
-class VTable(object):
+class VTable(Node):
 
-    def __init__(self, name):
-        self.name = name
+    __slots__ = ("name",)
 
-    def __str__(self):
-        return "_ZTV%s" % self.name
+    def _setup(self, name):
+        _set(self, "name", name)
+
+    def _mangle(self, enc):
+        enc.emit("_ZTV")
+        self.name._mangle(enc)
 
 
-class Type(object):
+class Type(Node):
 
-    def __init__(self, type_obj, reference_type = 0, const = False):
-        self.flags = ""
-        self.type_obj = type_obj
-        self.flags += Ref.mflags[reference_type]
-        self._const = const
-        self._reference_type = reference_type
+    __slots__ = ("type_obj", "flags", "_const", "_reference_type", "_as_ptr", "_as_ref", "_as_const")
+
+    def __new__(cls, type_obj, reference_type = 0, const = False):
+        # canonical form: type_obj is never a value Type, so equal types are the same node
+        if issubclass(type(type_obj), Type):
+            while issubclass(type(type_obj), Type) and not type_obj._reference_type:
+                const = const or type_obj._const
+                type_obj = type_obj.type_obj
+            if issubclass(type(type_obj), Type) and not reference_type and not const:
+                return type_obj
+        return Node.__new__(cls, type_obj, reference_type, bool(const))
+
+    def _setup(self, type_obj, reference_type, const):
+        flags = Ref.mflags[reference_type]
         if const:
-            self.flags += "K"
+            flags += "K"
+        _set(self, "type_obj", type_obj)
+        _set(self, "flags", flags)
+        _set(self, "_const", const)
+        _set(self, "_reference_type", reference_type)
 
     def val(self):
         return Type(self.type_obj, Ref.BY_VALUE, self._const)
 
+    def _derived(self, slot, reference_type, const):
+        # derived type lives as long as this one, so chains like t.const().ptr() don't
+        # rebuild their intermediate nodes; types of references refer back, not cached
+        result = getattr(self, slot, None)
+        if result is None:
+            result = Type(self.type_obj, reference_type, const)
+            if result is not self:
+                _set(self, slot, result)
+        return result
+
     def ptr(self):
-        return Type(self.type_obj, Ref.BY_POINTER, self._const)
+        if self.is_ref():
+            return Type(self, Ref.BY_POINTER)
+        return self._derived("_as_ptr", Ref.BY_POINTER, self._const)
 
     def ref(self):
-        return Type(self.type_obj, Ref.BY_REFERENCE, self._const)
+        if self.is_ref():
+            return Type(self, Ref.BY_REFERENCE)
+        return self._derived("_as_ref", Ref.BY_REFERENCE, self._const)
 
     def const(self):
-        return Type(self.type_obj, self._reference_type, True)
+        return self._derived("_as_const", self._reference_type, True)
 
     def non_const(self):
         return Type(self.type_obj, self._reference_type, False)
 
     def deref(self):
         if self.is_ref():
-            if issubclass(type(self.type_obj), Type):
-                return self.type_obj
-            else:
-                return self.val()
+            return self.val()
         else:
             raise ValueError("Can't dereference non-reference type")
 
@@ -115,16 +333,31 @@ class Type(object):
         result.reverse()
         return result
 
-
-
     def is_ref(self):
         return self._reference_type > 0
 
     def is_const(self):
         return self._const
 
-    def __str__(self):
-        return "%s%s" % (self.flags, self.type_obj)
+    def _mangle(self, enc):
+        _mangle_type(enc, self.type_obj, self._reference_type, self._const)
+
+
+def _mangle_type(enc, type_obj, reference_type, const):
+    """Encode Type(type_obj, reference_type, const) without building it (or its val())"""
+    if not reference_type and not const:
+        type_obj._mangle(enc)
+        return
+    key = (type_obj, reference_type, const)
+    if enc.substitute(key):
+        return
+    if reference_type:
+        enc.emit(Ref.mflags[reference_type])
+        _mangle_type(enc, type_obj, Ref.BY_VALUE, const)
+    else:
+        enc.emit("K")
+        type_obj._mangle(enc)
+    enc.add(key)
 
 
 def mkstype(c):
@@ -136,10 +369,7 @@ def t_arg(idx, reference_type = 0, const = False):
 
 
 def s_arg(idx):
-        if (idx == 0):
-            return  mkstype("S_")
-        else:
-            return mkstype("S%d_" % (idx - 1))
+    return mkstype(seq_id(idx))
 
 # <builtin-type> ::= v	# void
 # 	 ::= w	# wchar_t
@@ -194,45 +424,85 @@ m_double = mkstype("d")
 m_long_double = mkstype("e")
 
 
-class Template(object):
-    def __init__(self, *types):
-        self.types = types
+class Template(Node):
 
-    def __str__(self):
-        return "I%sE" % "".join([str(t) for t in self.types])
+    __slots__ = ("types",)
 
+    def __new__(cls, *types):
+        # unqualified Type is the same template argument as the type it wraps
+        types = tuple([t.type_obj if issubclass(type(t), Type) and not t.flags else t for t in types])
+        return Node.__new__(cls, *types)
 
-class Args(object):
+    def _setup(self, *types):
+        _set(self, "types", types)
 
-    def __init__(self, *args):
-        self.args = args
+    def _mangle(self, enc):
+        enc.emit("I")
+        for t in self.types:
+            t._mangle(enc)
+        enc.emit("E")
 
-    def __str__(self):
-        return "%s" % "".join([str(t) for t in self.args])
 
+class Args(Node):
 
-class FnSig(object):
-    def __init__(self, name, args):
-        self.name = name
-        self.args = args
+    __slots__ = ("args",)
 
-    def __str__(self):
-        return "_Z%s%s" % (self.name, self.args)
+    def _setup(self, *args):
+        _set(self, "args", args)
 
+    def _mangle(self, enc):
+        for t in self.args:
+            t._mangle(enc)
 
-class TypeSig(object):
-    def __init__(self, name):
-        self.name = name
 
-    def __str__(self):
-        return "_Z%s" % (self.name)
+class FnSig(Node):
+
+    __slots__ = ("name", "args", "const")
+
+    def __new__(cls, name, args, const = False):
+        return Node.__new__(cls, name, args, bool(const))
+
+    def _setup(self, name, args, const):
+        _set(self, "name", name)
+        _set(self, "args", args)
+        _set(self, "const", const)
+
+    def _mangle(self, enc):
+        # function name itself is not a substitution candidate, only its prefixes
+        parts = self.name.parts
+        nested = self.const or not _is_unscoped(parts)
+        enc.emit("_Z")
+        if nested:
+            enc.emit(["N", "NK"][self.const])
+        if len(parts) > 1:
+            enc.prefix(parts[:-1])
+        enc.unqualified(parts[-1])
+        if nested:
+            enc.emit("E")
+        self.args._mangle(enc)
+
+
+class TypeSig(Node):
+
+    __slots__ = ("name", "_type")
+
+    def _setup(self, name):
+        _set(self, "name", name)
+
+    def _mangle(self, enc):
+        enc.emit("_Z")
+        self.name._mangle(enc)
 
     def method(self, name, *args):
-        parts = self.name.parts + [name]
+        parts = self.name.parts + (name,)
         return FnSig(Name(*parts), Args(*args))
 
+    def const_method(self, name, *args):
+        parts = self.name.parts + (name,)
+        return FnSig(Name(*parts), Args(*args), True)
+
     def struct(self, name):
-        args = self.name.parts + [name]
+        args = self.name.parts + (name,)
         return TypeSig(Name(*args))
 
     def constructor(self, idx, *args):
@@ -245,7 +515,11 @@ class TypeSig(object):
         return TemplateProxy(self.name.parts, types)
 
     def type(self):
-        return Type(self.name, Ref.BY_VALUE)
+        result = getattr(self, "_type", None)
+        if result is None:
+            result = Type(self.name, Ref.BY_VALUE)
+            _set(self, "_type", result)
+        return result
 
     def ptr_type(self, const = False):
         return Type(self.name, Ref.BY_POINTER, const)
@@ -266,21 +540,30 @@ def method(name, *args):
 
 
 def template(*types):
-    return TemplateProxy([], types)
+    return TemplateProxy((), types)
+
+
+class TemplateProxy(Node):
 
+    __slots__ = ("template", "parent_ns")
 
-class TemplateProxy(object):
-    def __init__(self, parent_ns, types):
-        self.template = Template(*types)
-        self.parent_ns = parent_ns
+    def __new__(cls, parent_ns, types):
+        return Node.__new__(cls, tuple(parent_ns), tuple(types))
+
+    def _setup(self, parent_ns, types):
+        _set(self, "template", Template(*types))
+        _set(self, "parent_ns", parent_ns)
+
+    def _mangle(self, enc):
+        self.template._mangle(enc)
 
     def struct(self, name):
-        ns_parts = self.parent_ns + [name, self.template]
+        ns_parts = self.parent_ns + (name, self.template)
         name = Name(*ns_parts)
         return TypeSig(name)
 
     def method(self, name, *args):
-        ns_parts = self.parent_ns + [name, self.template]
+        ns_parts = self.parent_ns + (name, self.template)
         name_ = Name(*ns_parts)
         args = Args(*args)
         return FnSig(name_, args)
@@ -292,19 +575,79 @@ class TemplateProxy(object):
         return self.method(Destructor(idx), *args)
 
 
-class Constructor(object):
+class Literal(Node):
+    """Template argument literal, value is encoded number (n prefix for negative)"""
 
-    def __init__(self, idx):
-        self.idx = idx
+    __slots__ = ("type", "value")
 
-    def __str__(self):
-        return "C%d" % self.idx
+    def _setup(self, type, value):
+        _set(self, "type", type)
+        _set(self, "value", value)
 
+    def _mangle(self, enc):
+        enc.emit("L")
+        self.type._mangle(enc)
+        enc.emit("%sE" % self.value)
 
-class Destructor(object):
-    def __init__(self, idx):
-        self.idx = idx
 
-    def __str__(self):
-        return "D%d" % self.idx
+class Operator(Node):
+    """Operator name part, code is two letter operator encoding (e.g. 'aS' for operator=)"""
+
+    __slots__ = ("code",)
+
+    def _setup(self, code):
+        _set(self, "code", code)
+
+    def _mangle(self, enc):
+        enc.emit(self.code)
+
+
+class Constructor(Node):
+
+    __slots__ = ("idx",)
+
+    def _setup(self, idx):
+        _set(self, "idx", idx)
+
+    def _mangle(self, enc):
+        enc.emit("C%d" % self.idx)
+
+
+class Destructor(Node):
+
+    __slots__ = ("idx",)
+
+    def _setup(self, idx):
+        _set(self, "idx", idx)
+
+    def _mangle(self, enc):
+        enc.emit("D%d" % self.idx)
+
+
+def _std(*parts):
+    return Name("std", *parts)
+
+
+def _char_traits_args():
+    return (m_char, _std("char_traits", Template(m_char)))
+
+
+# <substitution> ::= St # ::std::
+#                ::= Sa # ::std::allocator
+#                ::= Sb # ::std::basic_string
+#                ::= Ss # ::std::basic_string<char, ::std::char_traits<char>, ::std::allocator<char> >
+#                ::= Si # ::std::basic_istream<char, std::char_traits<char> >
+#                ::= So # ::std::basic_ostream<char, std::char_traits<char> >
+#                ::= Sd # ::std::basic_iostream<char, std::char_traits<char> >
+
+_std_abbreviations = {
+    _std("allocator"): "Sa",
+    _std("basic_string"): "Sb",
+    _std("basic_string", Template(*(_char_traits_args() + (_std("allocator", Template(m_char)),)))): "Ss",
+    _std("basic_istream", Template(*_char_traits_args())): "Si",
+    _std("basic_ostream", Template(*_char_traits_args())): "So",
+    _std("basic_iostream", Template(*_char_traits_args())): "Sd",
+}
 
+# parts of abbreviated name -> abbreviation, as encoder looks prefixes up
+_std_prefixes = dict([(name.parts, abbreviation) for name, abbreviation in _std_abbreviations.items()])
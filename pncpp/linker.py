@@ -0,0 +1,290 @@
+"""
+Symbol resolution for linked C++ classes
+
+Exported symbols are read once per library from ELF dynamic symbol table
+instead of dlsym lookup per method. Resolved symbol names and offsets can be
+cached on disk, so warm start skips both name mangling and symbol lookup.
+"""
+
+import pncpp.elf as elf
+import atexit
+import ctypes
+import hashlib
+import json
+import os
+import sys
+import weakref
+
+CACHE_VERSION = 1
+
+
+class _LinkMap(ctypes.Structure):
+    # leading fields of glibc link_map (and musl dso) returned by dlopen
+    _fields_ = [
+        ("l_addr", ctypes.c_void_p),
+        ("l_name", ctypes.c_char_p)
+    ]
+
+
+def library_info(cdll):
+    """
+    Path and load base address of library loaded by ctypes
+
+    :return: (path, base), base is None when it can't be found
+    """
+    if sys.platform.startswith("linux") and cdll._handle:
+        link_map = ctypes.cast(cdll._handle, ctypes.POINTER(_LinkMap)).contents
+        if link_map.l_name:
+            return os.fsdecode(link_map.l_name), link_map.l_addr or 0
+    return cdll._name, None
+
+
+def default_cache_dir():
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "pncpp")
+
+
+def _cache_dir(cache):
+    if cache is None:
+        cache = os.environ.get("PNCPP_CACHE_DIR") or False
+    if cache is True:
+        return default_cache_dir()
+    return cache or None
+
+
+def _class_key(cls):
+    """Cache key of class declaration and mtime of its source file"""
+    module = sys.modules.get(cls.__module__)
+    source = getattr(module, "__file__", None)
+    if not source or not os.path.exists(source):
+        return None, None
+    return "%s:%s" % (cls.__module__, cls.__qualname__), os.stat(source).st_mtime_ns
+
+
+class LinkCache(object):
+    """
+    On-disk cache of resolved symbols for one library
+
+    Valid while library path, mtime and build-id are the same.
+    """
+
+    def __init__(self, directory, path):
+        self.directory = directory
+        self.path = path
+        self.file = os.path.join(directory, "%s.json" % hashlib.sha1(path.encode()).hexdigest())
+        self.dirty = False
+
+        stat = os.stat(path)
+        self.mtime = stat.st_mtime_ns
+        self.build_id = None
+        try:
+            self.build_id = elf.read_build_id(path)
+        except (elf.ELFError, OSError):
+            pass
+
+        self.symbols = {}
+        self.classes = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (data.get("version"), data.get("path"), data.get("mtime"), data.get("build_id")) != \
+                (CACHE_VERSION, self.path, self.mtime, self.build_id):
+            return
+        self.symbols = data.get("symbols", {})
+        self.classes = data.get("classes", {})
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {
+            "version": CACHE_VERSION,
+            "path": self.path,
+            "mtime": self.mtime,
+            "build_id": self.build_id,
+            "symbols": self.symbols,
+            "classes": self.classes
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_file = "%s.%d.tmp" % (self.file, os.getpid())
+        with open(tmp_file, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.file)
+        self.dirty = False
+
+
+class SymbolResolver(object):
+    """
+    Resolves symbols of one library loaded with ctypes
+
+    Dynamic symbol table is parsed on first lookup that is not in link cache.
+    Falls back to dlsym lookup where ELF table or load base is not available.
+    """
+
+    def __init__(self, cdll):
+        self.cdll = cdll
+        self.path, self.base = library_info(cdll)
+        self.cache = None
+        self._table = None
+        self._index = None
+        self._symbols_at = None
+        self._class_symbols = {}
+
+    def enable_cache(self, directory):
+        if self.cache is None and self.base is not None and os.path.isfile(self.path):
+            self.cache = LinkCache(directory, self.path)
+            atexit.register(self.cache.save)
+
+    def table(self):
+        """Dict of exported symbol to offset from load base, None in dlsym mode"""
+        if self._table is None and self.base is not None:
+            try:
+                table = elf.read_dynamic_symbols(self.path)
+            except (elf.ELFError, OSError):
+                table = {}
+            if table and self._check_base(table):
+                self._table = table
+            else:
+                self.base = None
+        return self._table
+
+    def _check_base(self, table):
+        symbol = next(iter(table))
+        try:
+            address = ctypes.cast(getattr(self.cdll, symbol), ctypes.c_void_p).value
+        except AttributeError:
+            return False
+        return address == self.base + table[symbol]
+
+    def symbol(self, cls, key, make):
+        """
+        Symbol name of class member
+
+        :param key: member key unique in class
+        :param make: function that builds symbol name when it is not cached
+        """
+        symbols = self._class_symbols.get(cls)
+        if symbols is None:
+            symbols = self._class_symbols[cls] = self._cached_class_symbols(cls)
+        result = symbols.get(key)
+        if result is None:
+            result = symbols[key] = make()
+            if self.cache is not None:
+                self.cache.dirty = True
+        return result
+
+    def _cached_class_symbols(self, cls):
+        if self.cache is None:
+            return {}
+        key, source_mtime = _class_key(cls)
+        if key is None:
+            return {}
+        entry = self.cache.classes.get(key)
+        if entry is None or entry["source_mtime"] != source_mtime:
+            entry = self.cache.classes[key] = {"source_mtime": source_mtime, "symbols": {}}
+            self.cache.dirty = True
+        return entry["symbols"]
+
+    def address(self, symbol):
+        """Absolute address of symbol or None if library doesn't export it"""
+        # base is dropped when table doesn't match loaded library
+        if self.cache is not None and self.base is not None and symbol in self.cache.symbols:
+            offset = self.cache.symbols[symbol]
+            return None if offset is None else self.base + offset
+
+        table = self.table()
+        if table is not None and symbol in table:
+            if self.cache is not None:
+                self.cache.symbols[symbol] = table[symbol]
+                self.cache.dirty = True
+            return self.base + table[symbol]
+
+        # symbols not in table are missing or indirect functions resolved at load time
+        try:
+            return ctypes.cast(getattr(self.cdll, symbol), ctypes.c_void_p).value
+        except AttributeError:
+            if table is not None and self.cache is not None:
+                self.cache.symbols[symbol] = None
+                self.cache.dirty = True
+            return None
+
+    def symbol_at(self, address):
+        """Exported symbol at absolute address, None if there is none or in dlsym mode"""
+        if self._symbols_at is None:
+            table = self.table()
+            if table is None:
+                return None
+            self._symbols_at = {}
+            for symbol, offset in table.items():
+                self._symbols_at.setdefault(offset, symbol)
+        return self._symbols_at.get(address - self.base)
+
+    def index(self):
+        """SymbolIndex of exported symbols, None in dlsym mode"""
+        if self._index is None:
+            table = self.table()
+            if table is not None:
+                import pncpp.symbol_index as symbol_index
+                self._index = symbol_index.SymbolIndex(table)
+        return self._index
+
+    def function(self, symbol, nogil=None):
+        """
+        New ctypes function object for symbol or None if it is not exported
+
+        :param nogil: True to release GIL during call, False to hold it, None as library does (CDLL or PyDLL)
+        """
+        address = self.address(symbol)
+        if address is None:
+            return None
+        if nogil is None:
+            return self.cdll._FuncPtr(address)
+        return function_type(self.cdll, nogil)(address)
+
+    def save(self):
+        if self.cache is not None:
+            self.cache.save()
+
+
+_function_types = {}
+
+
+def function_type(cdll, nogil):
+    """
+    ctypes function pointer type of library with GIL handling chosen per function
+
+    Functions without FUNCFLAG_PYTHONAPI release GIL for the duration of call;
+    callbacks into python made meanwhile acquire it themselves.
+    """
+    flags = cdll._func_flags_ & ~ctypes._FUNCFLAG_PYTHONAPI
+    if not nogil:
+        flags |= ctypes._FUNCFLAG_PYTHONAPI
+    key = (flags, cdll._func_restype_)
+    result = _function_types.get(key)
+    if result is None:
+        result = _function_types[key] = type("_FuncPtr", (ctypes._CFuncPtr,),
+                                             {"_flags_": flags, "_restype_": cdll._func_restype_})
+    return result
+
+
+_resolvers = weakref.WeakKeyDictionary()
+
+
+def resolver_for(cdll, cache=None):
+    """
+    Shared symbol resolver of library
+
+    :param cache: link cache directory, True for default directory;
+                  by default enabled only when PNCPP_CACHE_DIR is set
+    """
+    resolver = _resolvers.get(cdll)
+    if resolver is None:
+        resolver = _resolvers[cdll] = SymbolResolver(cdll)
+    directory = _cache_dir(cache)
+    if directory:
+        resolver.enable_cache(directory)
+    return resolver
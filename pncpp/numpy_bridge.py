@@ -0,0 +1,56 @@
+"""
+NumPy structured dtypes and zero-copy arrays over memory of wrapped classes
+
+Optional: pncpp.core imports this module only when one of numpy methods of
+CXXStruct or CXXArray is called.
+"""
+
+import ctypes
+import numpy
+
+# pointers (including vtable pointer) are exposed as addresses
+_pointer_types = (ctypes.c_void_p, ctypes.c_char_p, ctypes.c_wchar_p, ctypes._Pointer, ctypes._CFuncPtr)
+
+_dtypes = {}
+
+
+def ctype_dtype(c_type):
+    """NumPy dtype of ctypes type"""
+    if issubclass(c_type, _pointer_types):
+        return numpy.dtype(numpy.uintp)
+    if issubclass(c_type, (ctypes.Structure, ctypes.Union)):
+        return structure_dtype(c_type)
+    if issubclass(c_type, ctypes.Array):
+        return numpy.dtype((ctype_dtype(c_type._type_), (c_type._length_,)))
+    if issubclass(c_type, ctypes.c_wchar):
+        return numpy.dtype(["<u2", "U1"][ctypes.sizeof(ctypes.c_wchar) == 4])
+    return numpy.dtype(c_type)
+
+
+def structure_dtype(c_structure):
+    """
+    Structured dtype with the same field offsets and size as ctypes structure
+
+    :raise TypeError: structure has bit fields
+    """
+    result = _dtypes.get(c_structure)
+    if result is None:
+        names, formats, offsets = [], [], []
+        for field in c_structure._fields_:
+            if len(field) > 2:
+                raise TypeError("Bit field '%s' has no NumPy dtype" % field[0])
+            names.append(field[0])
+            formats.append(ctype_dtype(field[1]))
+            offsets.append(getattr(c_structure, field[0]).offset)
+        result = _dtypes[c_structure] = numpy.dtype({
+            "names": names,
+            "formats": formats,
+            "offsets": offsets,
+            "itemsize": ctypes.sizeof(c_structure)
+        })
+    return result
+
+
+def as_array(c_object, c_structure):
+    """Writable array sharing memory with ctypes structure or array of structures"""
+    return numpy.frombuffer(c_object, structure_dtype(c_structure))
@@ -0,0 +1,234 @@
+"""
+Process pool owning native objects in worker processes
+
+Each worker loads the same library and links the same classes, objects are
+constructed and kept in the worker and addressed by handles. Requests are
+sent in batches, one pickled message per worker, so many calls cost one pipe
+round trip, and batches sent to different workers run in parallel.
+
+Classes are passed to workers by reference, so with "spawn" start method
+they must be importable from their module.
+"""
+
+import ctypes
+import itertools
+import multiprocessing
+import os
+import pickle
+import weakref
+
+NEW = 0
+CALL = 1
+GET = 2
+RELEASE = 3
+
+
+def _worker(connection, library, classes):
+    cdll = None
+    for cls in classes:
+        linked = cls.__dict__.get("_cdll")
+        if linked is None:
+            cdll = cdll or ctypes.CDLL(library)
+            cls.link_with(cdll)
+        # forked workers inherit classes already linked with the library
+        elif os.path.realpath(linked._name) != os.path.realpath(library):
+            raise ValueError("%s is linked with %s, not %s" % (cls.__name__, linked._name, library))
+    objects = {}
+
+    while True:
+        batch = connection.recv()
+        if batch is None:
+            break
+        results = []
+        for op, handle, name, args in batch:
+            try:
+                if op == CALL:
+                    value = getattr(objects[handle], name)(*args)
+                elif op == GET:
+                    value = getattr(objects[handle], name)
+                elif op == NEW:
+                    objects[handle] = classes[name](*args)
+                    value = None
+                else:
+                    obj = objects.pop(handle)
+                    value = getattr(obj, name)() if name else None
+                # pickled one by one, so value that can't be pickled fails its request only
+                results.append(pickle.dumps((True, value)))
+            except Exception as e:
+                results.append(_pickled_error(e))
+        connection.send(results)
+    connection.close()
+
+
+def _pickled_error(error):
+    try:
+        return pickle.dumps((False, error))
+    except Exception:
+        return pickle.dumps((False, RuntimeError("%s: %s" % (type(error).__name__, error))))
+
+
+class RemoteObject(object):
+    """
+    Handle of object living in worker process
+
+    Attribute access returns function calling method of the same name
+    remotely, so handle has no public attributes of its own. Object is
+    dropped in worker with next request sent to worker after handle is
+    collected; owned native object (one constructed through its wrapper, see
+    CXXStruct.own) is destroyed then, others are left as they are.
+    """
+
+    def __init__(self, pool, worker, handle, cls):
+        self._pool = pool
+        self._worker = worker
+        self._handle = handle
+        self._cls = cls
+        self._finalizer = weakref.finalize(self, pool._garbage.append, (worker, handle))
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args: self._pool.call(self, name, *args)
+
+    def __repr__(self):
+        return "<remote %s #%d in worker %d>" % (self._cls.__name__, self._handle, self._worker)
+
+
+class ProcessPool(object):
+    """
+    Worker processes with native objects sharded between them
+
+    :param library: CDLL or library path
+    :param classes: wrapped classes linked in workers
+    :param processes: number of workers, by default number of CPUs
+    :param context: multiprocessing context or start method name
+    """
+
+    def __init__(self, library, classes, processes=None, context=None):
+        if not isinstance(library, str):
+            library = library._name
+        if context is None or isinstance(context, str):
+            context = multiprocessing.get_context(context)
+        self.classes = list(classes)
+        self._class_index = {cls: i for i, cls in enumerate(self.classes)}
+        self._handles = itertools.count()
+        self._next_worker = itertools.cycle(range(processes or os.cpu_count() or 1))
+        self._connections = []
+        self._processes = []
+        # (worker, handle) of collected handles, released with next batch
+        self._garbage = []
+        for _ in range(processes or os.cpu_count() or 1):
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker, args=(child, library, self.classes), daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def __len__(self):
+        return len(self._processes)
+
+    def _execute(self, batches):
+        """
+        Send batches {worker: [request, ...]} and wait for all of them
+
+        :return: results in order of workers and requests
+        :raise: first exception raised by a request, after all batches are done
+        """
+        batches = dict(batches)
+        skip = {}
+        while self._garbage:
+            worker, handle = self._garbage.pop()
+            batches[worker] = [(RELEASE, handle, None, ())] + batches.get(worker, [])
+            skip[worker] = skip.get(worker, 0) + 1
+        for worker, batch in batches.items():
+            self._connections[worker].send(batch)
+        results = []
+        error = None
+        for worker in batches:
+            for item in self._connections[worker].recv()[skip.get(worker, 0):]:
+                ok, value = pickle.loads(item)
+                if not ok and error is None:
+                    error = value
+                results.append(value)
+        if error is not None:
+            raise error
+        return results
+
+    def create(self, cls, *args, **kwargs):
+        """
+        Construct object in worker
+
+        :param worker: worker index, by default workers are taken in turn
+        :return: RemoteObject
+        """
+        return self.create_many(cls, [args], **kwargs)[0]
+
+    def create_many(self, cls, arg_tuples, worker=None):
+        """Construct one object per argument tuple, spread evenly between workers"""
+        index = self._class_index[cls]
+        handles = []
+        batches = {}
+        for args in arg_tuples:
+            target = next(self._next_worker) if worker is None else worker
+            handle = RemoteObject(self, target, next(self._handles), cls)
+            batches.setdefault(target, []).append((NEW, handle._handle, index, tuple(args)))
+            handles.append(handle)
+        self._execute(batches)
+        return handles
+
+    def call(self, handle, name, *args):
+        """Call method of remote object"""
+        return self._execute({handle._worker: [(CALL, handle._handle, name, args)]})[0]
+
+    def call_many(self, calls):
+        """
+        Call methods of many objects, one batch per worker
+
+        :param calls: iterable of (handle, method name, argument tuple)
+        :return: list of results in order of calls
+        """
+        batches = {}
+        order = {}
+        for i, (handle, name, args) in enumerate(calls):
+            batch = batches.setdefault(handle._worker, [])
+            order.setdefault(handle._worker, []).append(i)
+            batch.append((CALL, handle._handle, name, tuple(args)))
+        values = self._execute(batches)
+        results = [None] * len(values)
+        for i, value in zip([i for worker in batches for i in order[worker]], values):
+            results[i] = value
+        return results
+
+    def map(self, name, handles, *columns):
+        """Same as call_many for one method, with one argument column per parameter"""
+        rows = zip(*columns) if columns else itertools.repeat(())
+        return self.call_many((handle, name, args) for handle, args in zip(handles, rows))
+
+    def get(self, handle, field):
+        """Read field or attribute of remote object"""
+        return self._execute({handle._worker: [(GET, handle._handle, field, ())]})[0]
+
+    def release(self, handle, destructor=None):
+        """Drop remote object, calling its destructor method if name is given, otherwise as when handle is collected"""
+        handle._finalizer.detach()
+        self._execute({handle._worker: [(RELEASE, handle._handle, destructor, ())]})
+
+    def close(self):
+        """Stop workers, objects they hold are dropped and owned native objects destroyed"""
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, EOFError):
+                pass
+        for process, connection in zip(self._processes, self._connections):
+            process.join()
+            connection.close()
+        self._processes = []
+        self._connections = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
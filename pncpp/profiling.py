@@ -0,0 +1,315 @@
+"""
+Call statistics of wrapped class methods
+
+Profiler instruments methods of classes while enabled and restores them when
+disabled, so disabled profiling costs nothing: compiled thunk of method looks
+its call target up in its own globals, and profiler replaces the target there
+(downcalls, python to C++); adapter of overridden virtual method calls
+python implementation through attribute that profiler replaces (upcalls,
+C++ to python). Direct calls CXXMethod(obj, ...) share the thunk; calls made
+by CXXMethod.map and starmap use function that profiler registers on the
+method for structure of the objects. Functions of binding modules generated
+by pncpp.codegen call C++ directly and are not recorded.
+
+Method inherited by several profiled classes is instrumented once and calls
+are attributed by structure type of the object, so classes derived without
+cxx_struct count as the decorated class they derive from.
+
+Time of a call includes ctypes argument conversion and C++ body for downcalls
+and python body for upcalls; self time excludes nested calls recorded by any
+profiler. Latency percentiles are computed over a random sample of timings.
+"""
+
+import json
+import marshal
+import random
+import sys
+import threading
+import time
+
+DOWNCALL = "downcall"
+UPCALL = "upcall"
+
+# times of nested calls, one accumulator per recorded call in progress
+_local = threading.local()
+
+
+class MethodStats(object):
+    """Counters of one method in one direction, times in seconds"""
+
+    __slots__ = ("cls", "name", "direction", "calls", "timed", "total", "self_total", "max", "samples",
+                 "_reservoir", "_random")
+
+    def __init__(self, cls, name, direction, reservoir):
+        self.cls = cls
+        self.name = name
+        self.direction = direction
+        self.calls = 0
+        self.timed = 0
+        self.total = 0.0
+        self.self_total = 0.0
+        self.max = 0.0
+        self.samples = []
+        self._reservoir = reservoir
+        self._random = random.Random(0)
+
+    def add(self, elapsed, self_time):
+        self.timed += 1
+        self.total += elapsed
+        self.self_total += self_time
+        if elapsed > self.max:
+            self.max = elapsed
+        if len(self.samples) < self._reservoir:
+            self.samples.append(elapsed)
+        else:
+            i = self._random.randrange(self.timed)
+            if i < self._reservoir:
+                self.samples[i] = elapsed
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+    def as_dict(self):
+        mean = self.total / self.timed if self.timed else 0.0
+        return {
+            "class": self.cls.__name__,
+            "method": self.name,
+            "direction": self.direction,
+            "calls": self.calls,
+            "timed": self.timed,
+            "total": self.total,
+            "self": self.self_total,
+            "mean": mean,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+def _timed(target, stats, sample):
+    """Wrapper of target recording every sample-th call into stats"""
+    perf_counter = time.perf_counter
+
+    def call(*args):
+        stats.calls += 1
+        if sample > 1 and stats.calls % sample:
+            return target(*args)
+        stack = _local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = perf_counter()
+        try:
+            return target(*args)
+        finally:
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            stats.add(elapsed, elapsed - nested)
+            if stack:
+                stack[-1] += elapsed
+
+    return call
+
+
+def _by_structure(target, timed, structure_of):
+    """Call of timed wrapper registered for structure of the object, plain target for other objects"""
+    get = timed.get
+
+    def call(*args):
+        wrapper = get(structure_of(args[0]))
+        if wrapper is None:
+            return target(*args)
+        return wrapper(*args)
+
+    return call
+
+
+def _this_structure(this):
+    return getattr(type(this), "_type_", None)
+
+
+def _object_structure(obj):
+    return getattr(obj, "CStructure", None)
+
+
+class _Hooks(object):
+    """Original targets of one method and timing wrappers of profiled classes calling it"""
+
+    def __init__(self, method):
+        self.namespace = method._thunk.__globals__
+        self.target = self.namespace["_target"]
+        self.adapter = method._adapter
+        self.fn = None if self.adapter is None else self.adapter._fn
+        # structure -> (class, downcall stats, upcall stats, sample)
+        self.classes = {}
+
+    def install(self, method):
+        if not self.classes:
+            self.namespace["_target"] = self.target
+            method._map_targets = None
+            if self.adapter is not None:
+                self.adapter._fn = self.fn
+            return
+        downcalls, mapped, upcalls = {}, {}, {}
+        address_target = method.address_target()
+        for structure, (cls, down, up, sample) in self.classes.items():
+            downcalls[structure] = _timed(self.target, down, sample)
+            mapped[structure] = _timed(address_target, down, sample)
+            if self.adapter is not None:
+                upcalls[structure] = _timed(self.fn, up, sample)
+        self.namespace["_target"] = _by_structure(self.target, downcalls, _this_structure)
+        method._map_targets = mapped
+        if self.adapter is not None:
+            self.adapter._fn = _by_structure(self.fn, upcalls, _object_structure)
+
+
+# CXXMethod -> _Hooks, shared by profilers as thunk of method is
+_hooks = {}
+_hooks_lock = threading.Lock()
+
+
+class Profiler(object):
+    """
+    Records calls of methods of wrapped classes
+
+    Can be used as context manager enabling it for classes passed to profile.
+
+    :param sample: time every sample-th call of each method, all calls are counted
+    :param reservoir: timings kept per method for percentiles
+    """
+
+    def __init__(self, sample=1, reservoir=1024):
+        self.sample = sample
+        self.reservoir = reservoir
+        self._stats = {}
+        # (class, method) pairs instrumented by profiler
+        self._patched = set()
+        self._classes = []
+        # classes of each entered profile() block, innermost last
+        self._enter_stack = []
+        self._pending_classes = None
+
+    def _stats_for(self, cls, method, direction):
+        key = (cls, method, direction)
+        result = self._stats.get(key)
+        if result is None:
+            result = self._stats[key] = MethodStats(cls, method.attr_name or method.name, direction, self.reservoir)
+        return result
+
+    def _instrument(self, cls, method):
+        if (cls, method) in self._patched:
+            return
+        if method._thunk is None:
+            # instrumented by CXXMethod.resolve_as_member when resolved
+            if cls not in method._profiled_in:
+                method._profiled_in += (cls,)
+            return
+        with _hooks_lock:
+            hooks = _hooks.get(method)
+            if hooks is None:
+                hooks = _hooks[method] = _Hooks(method)
+            other = hooks.classes.get(cls.CStructure)
+            if other is not None:
+                raise RuntimeError("%s shares structure with profiled %s" % (cls.__name__, other[0].__name__))
+            hooks.classes[cls.CStructure] = (cls, self._stats_for(cls, method, DOWNCALL),
+                                             self._stats_for(cls, method, UPCALL), self.sample)
+            hooks.install(method)
+        self._patched.add((cls, method))
+
+    def _restore(self, cls, method):
+        with _hooks_lock:
+            hooks = _hooks[method]
+            del hooks.classes[cls.CStructure]
+            hooks.install(method)
+            if not hooks.classes:
+                del _hooks[method]
+        self._patched.discard((cls, method))
+
+    def enable(self, *classes):
+        """Start recording calls of methods of classes, methods resolved later are recorded too"""
+        for cls in classes:
+            # inherited attribute is profiler of a base
+            profiler = cls.__dict__.get("_profiler_")
+            if profiler is self:
+                continue
+            if profiler is not None:
+                raise RuntimeError("%s is already profiled" % cls.__name__)
+            cls._profiler_ = self
+            self._classes.append(cls)
+            for nm, member in cls._methods_:
+                self._instrument(cls, member)
+
+    def disable(self, *classes):
+        """Stop recording calls of classes, all profiled classes by default; statistics are kept"""
+        classes = classes or list(self._classes)
+        for cls, method in list(self._patched):
+            if cls in classes:
+                self._restore(cls, method)
+        for cls in classes:
+            if cls.__dict__.get("_profiler_") is self:
+                cls._profiler_ = None
+                self._classes.remove(cls)
+                for nm, member in cls._methods_:
+                    if cls in member._profiled_in:
+                        member._profiled_in = tuple(c for c in member._profiled_in if c is not cls)
+
+    def profile(self, *classes):
+        """Context manager recording calls of classes inside with block"""
+        self._pending_classes = classes
+        return self
+
+    def __enter__(self):
+        classes, self._pending_classes = self._pending_classes or (), None
+        # nested blocks disable only classes they enabled
+        enabled = tuple(cls for cls in classes if cls.__dict__.get("_profiler_") is not self)
+        self.enable(*classes)
+        self._enter_stack.append(enabled)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        enabled = self._enter_stack.pop()
+        if enabled:
+            self.disable(*enabled)
+
+    def reset(self):
+        """Drop collected statistics"""
+        for stats in self._stats.values():
+            stats.__init__(stats.cls, stats.name, stats.direction, self.reservoir)
+
+    def stats(self):
+        """List of dicts with counters and latency of each method and direction"""
+        return [stats.as_dict() for stats in self._stats.values() if stats.calls]
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.stats(), **kwargs)
+
+    def pstats_dict(self):
+        """
+        Statistics in format of profile/cProfile, loadable by pstats.Stats after dump_stats
+
+        Times of sampled calls are extrapolated to all calls. Upcalls are listed as
+        "Class.method (upcall)".
+        """
+        result = {}
+        for stats in self._stats.values():
+            if not stats.calls:
+                continue
+            scale = float(stats.calls) / stats.timed if stats.timed else 0.0
+            name = "%s.%s" % (stats.cls.__name__, stats.name)
+            if stats.direction == UPCALL:
+                name += " (upcall)"
+            module = sys.modules.get(stats.cls.__module__)
+            filename = getattr(module, "__file__", None) or "<native>"
+            result[(filename, 0, name)] = (stats.calls, stats.calls, stats.self_total * scale, stats.total * scale, {})
+        return result
+
+    def dump_stats(self, path):
+        with open(path, "wb") as f:
+            marshal.dump(self.pstats_dict(), f)
+
+
+def profile(*classes, **kwargs):
+    """Context manager recording calls of classes with new Profiler, accepts Profiler arguments"""
+    return Profiler(**kwargs).profile(*classes)
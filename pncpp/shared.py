@@ -0,0 +1,187 @@
+"""
+Allocators placing wrapped objects in memory shared between processes
+
+Arena is a bump allocator over shared memory (multiprocessing.shared_memory)
+or a memory mapped file. Class decorated with cxx_struct(allocator=arena),
+or with _allocator_ = arena, gets new instances and CXXArray blocks from
+the arena, other processes open the same arena and attach to objects by
+offset without copying.
+
+Per process state is kept out of shared memory:
+
+* python object field of shared objects stays zero, upcalls find wrapper
+  in instance registry of the process;
+* vtable pointer is written once, by process placing object, as C++
+  calls virtual methods through it in every process. Attaching process
+  checks that its vtable copy is at the same address, so processes sharing
+  objects of virtual classes must be forked from process that linked
+  classes.
+
+Other pointer fields are stored as is and are valid only in process that wrote them.
+Objects are never freed one by one, arena memory is released as a whole.
+"""
+
+import pncpp.core as core
+import ctypes
+import mmap
+import os
+import threading
+
+MAGIC = 0x616e6572616370  # "pcarena"
+ALIGNMENT = 16
+
+
+class _Header(ctypes.Structure):
+    _fields_ = [
+        ("magic", ctypes.c_uint64),
+        ("size", ctypes.c_uint64),
+        ("used", ctypes.c_uint64),
+    ]
+
+
+class Arena(object):
+    """
+    Bump allocator over writable buffer, allocation state is kept in buffer header
+
+    Allocations are serialized within process; when several processes
+    allocate from one arena they must be serialized by caller.
+    """
+
+    shared = True
+
+    def __init__(self, buffer, create):
+        self.buffer = buffer
+        self._header = _Header.from_buffer(buffer)
+        self.address = ctypes.addressof(self._header)
+        self._lock = threading.Lock()
+        if create:
+            self._header.magic = MAGIC
+            self._header.size = len(buffer)
+            self._header.used = ctypes.sizeof(_Header)
+        elif self._header.magic != MAGIC:
+            raise ValueError("Buffer is not an initialized arena")
+
+    @property
+    def size(self):
+        return self._header.size
+
+    @property
+    def used(self):
+        return self._header.used
+
+    def allocate(self, c_type):
+        """
+        Zero filled ctypes object of c_type placed in arena
+
+        :raise MemoryError: arena is full
+        """
+        size = ctypes.sizeof(c_type)
+        with self._lock:
+            offset = -(-self._header.used // ALIGNMENT) * ALIGNMENT
+            if offset + size > self._header.size:
+                raise MemoryError("Arena is full: %d of %d bytes used, %d requested" %
+                                  (self._header.used, self._header.size, size))
+            self._header.used = offset + size
+        return c_type.from_buffer(self.buffer, offset)
+
+    def offset_of(self, obj):
+        """Offset of wrapped instance, CXXArray or ctypes object in arena"""
+        if isinstance(obj, (core.CXXStruct, core.CXXArray)):
+            address = ctypes.addressof(obj.struct) if isinstance(obj, core.CXXStruct) else obj.address
+        else:
+            address = ctypes.addressof(obj)
+        offset = address - self.address
+        if not 0 <= offset < self._header.size:
+            raise ValueError("Object is not placed in arena")
+        return offset
+
+    def attach(self, cls, offset, length=None):
+        """
+        Wrapper of object placed in arena by this or another process
+
+        Wrapper is created without calling __init__ of class. Vtable pointer
+        is not changed, see module description.
+
+        :param length: attach to CXXArray of length elements instead of single object
+        :raise ValueError: vtable pointer of object differs from one of this process
+        """
+        if length is None:
+            obj = cls.__new__(cls)
+            obj._attach(cls.CStructure.from_buffer(self.buffer, offset), True)
+            return obj
+        result = core.CXXArray.__new__(core.CXXArray)
+        result._bind(cls, (cls.CStructure * length).from_buffer(self.buffer, offset), True, {})
+        if cls._vtable_:
+            for address in result._addresses():
+                core._check_shared_vptr(address, cls._vptr_)
+        return result
+
+    def close(self):
+        """
+        Unmap arena in this process
+
+        Objects taken from arena must be dropped first: while they exist
+        the mapping stays exported and is released by garbage collector.
+        """
+        self._header = None
+        self.buffer = None
+
+
+class SharedArena(Arena):
+    """
+    Arena in multiprocessing.shared_memory block
+
+    :param name: block name, other processes open arena by it
+    :param size: block size in bytes when arena is created
+    :param create: create new block, by default when size is given
+    """
+
+    def __init__(self, name=None, size=None, create=None):
+        from multiprocessing import shared_memory
+        if create is None:
+            create = size is not None
+        self.memory = shared_memory.SharedMemory(name, create, size or 0)
+        self.name = self.memory.name
+        super(SharedArena, self).__init__(self.memory.buf, create)
+
+    def close(self):
+        super(SharedArena, self).close()
+        try:
+            self.memory.close()
+        except BufferError:
+            pass
+
+    def unlink(self):
+        """Remove block name, memory is freed when all processes close it"""
+        self.memory.unlink()
+
+
+class MappedArena(Arena):
+    """
+    Arena in memory mapped file
+
+    :param path: file path, file is created or extended to size when size is given
+    :param size: arena size in bytes, by default size of existing file
+    """
+
+    def __init__(self, path, size=None):
+        create = size is not None and (not os.path.exists(path) or os.path.getsize(path) == 0)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            if size is not None and os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size or 0)
+        finally:
+            os.close(fd)
+        self.path = path
+        super(MappedArena, self).__init__(self.map, create)
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        super(MappedArena, self).close()
+        try:
+            self.map.close()
+        except BufferError:
+            pass
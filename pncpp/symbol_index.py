@@ -0,0 +1,478 @@
+"""
+Index of C++ symbols exported by library, grouped by class (or namespace)
+
+Symbols with plain nested names are classified by a quick scan of their
+source names; signatures are demangled only when queried. Symbols with
+templates or substitutions in their scope are grouped by the mangled text of
+their scope, scanned without parsing, and parsed fully on first query of
+that scope; scopes() parses one name per distinct scope. Symbols the scan
+doesn't know are grouped by outermost scope name (std for standard library)
+and parsed on first query of a scope in the group. len() parses everything.
+
+Virtual and covariant thunks (_ZTh, _ZTv, _ZTc), local names (_ZZ), guard
+variables and other special names are not indexed, they are listed in
+SymbolIndex.unsupported with symbols that can't be demangled. So are
+typeinfo objects of templated classes whose name the scan doesn't know.
+Unsupported symbols are in no scope, check the list for what an index
+leaves out.
+"""
+
+import pncpp.itanium_abi_demangle as dm
+import pncpp.itanium_abi_mangle as mg
+import difflib
+import itertools
+import operator
+import re
+
+METHOD = "method"
+CONSTRUCTOR = "constructor"
+DESTRUCTOR = "destructor"
+VTABLE = "vtable"
+TYPEINFO = "typeinfo"
+TYPEINFO_NAME = "typeinfo name"
+DATA = "data"
+
+
+class SymbolEntry(object):
+
+    __slots__ = ("symbol", "kind", "scope", "name", "_node")
+
+    def __init__(self, symbol, kind, scope, name, node=None):
+        self.symbol = symbol
+        self.kind = kind
+        self.scope = scope
+        self.name = name
+        self._node = node
+
+    @property
+    def node(self):
+        """Parsed symbol (see itanium_abi_demangle.parse) or None if it can't be parsed"""
+        if self._node is None:
+            try:
+                self._node = dm.parse(self.symbol)
+            except dm.DemangleError:
+                self._node = False
+        return self._node or None
+
+    @property
+    def signature(self):
+        if self.kind in (TYPEINFO, TYPEINFO_NAME):
+            return "%s for %s" % (self.kind, self.scope)
+        node = self.node
+        if node is None:
+            return self.symbol
+        return dm.format_node(node)
+
+    def __repr__(self):
+        return "<SymbolEntry %s %s>" % (self.kind, self.signature)
+
+
+class ScopeEntry(object):
+    """Members of one class or namespace"""
+
+    def __init__(self, name):
+        self.name = name
+        self.methods = {}
+        self.data = {}
+        self.constructors = []
+        self.destructors = []
+        self.vtable = None
+        self.typeinfo = None
+        self.typeinfo_name = None
+
+    def add(self, entry):
+        if entry.kind == METHOD:
+            self.methods.setdefault(entry.name, []).append(entry)
+        elif entry.kind == CONSTRUCTOR:
+            self.constructors.append(entry)
+        elif entry.kind == DESTRUCTOR:
+            self.destructors.append(entry)
+        elif entry.kind == VTABLE:
+            self.vtable = entry
+        elif entry.kind == TYPEINFO:
+            self.typeinfo = entry
+        elif entry.kind == TYPEINFO_NAME:
+            self.typeinfo_name = entry
+        else:
+            self.data[entry.name] = entry
+
+
+def _source_name():
+    # <length><identifier> of 1..99 characters: one alternative per length keeps the
+    # match unambiguous, alternatives are grouped by first digit for faster matching
+    alternatives = []
+    for d in range(1, 10):
+        lengths = ["[A-Za-z_]\\w{%d}" % (d - 1)] + ["%d[A-Za-z_]\\w{%d}" % (e, d * 10 + e - 1) for e in range(10)]
+        alternatives.append("%d(?:%s)" % (d, "|".join(lengths)))
+    return "(?:%s)" % "|".join(alternatives)
+
+
+_name = _source_name()
+
+# plain nested names, vtables and typeinfo of plain names and free functions; everything else is parsed fully
+_symbol_re = re.compile(
+    r"^(_Z(?:N(K?)((?:%(n)s)*)(%(n)s|[CD][0-3])E(.*)|T([VIS])(?:N((?:%(n)s)+)E|(%(n)s))|(%(n)s)(.*)))$" % {"n": _name},
+    re.M)
+
+_name_re = re.compile(r"(\d+)")
+
+# outermost scope name of symbol that is parsed fully: std abbreviation or <length><identifier>
+_head_re = re.compile(r"_Z(N[rVK]*[RO]?)?(S[tabsiod]|\d+)")
+
+# special names: thunks, local names, guard variables...
+_special_re = re.compile(r"_Z[TZG]")
+
+_SPECIAL_KINDS = {"V": VTABLE, "I": TYPEINFO, "S": TYPEINFO_NAME}
+_SPECIAL_NAMES = frozenset("T" + code for code in _SPECIAL_KINDS)
+
+
+def _pending_key(symbol):
+    """Outermost scope name of symbol, '' for free functions, None if it is not known without parsing"""
+    match = _head_re.match(symbol)
+    if match is None:
+        return None
+    nested, head = match.groups()
+    if head[0] == "S":
+        return "std"
+    if not nested:
+        return ""
+    return symbol[match.end():match.end() + int(head)]
+
+
+def _skip_source_name(symbol, pos):
+    end = pos
+    while symbol[end:end + 1].isdigit():
+        end += 1
+    return end + int(symbol[pos:end])
+
+
+def _skip_template_args(symbol, pos):
+    """End of <template-args> starting at pos, None if they use constructs the scan doesn't know"""
+    depth = 0
+    while pos < len(symbol):
+        c = symbol[pos]
+        code = symbol[pos:pos + 2]
+        if c.isdigit():
+            pos = _skip_source_name(symbol, pos)
+        elif c in "INJF":
+            depth += 1
+            pos += 1
+        elif c == "E":
+            depth -= 1
+            pos += 1
+            if not depth:
+                return pos
+        elif c == "L":
+            if symbol.startswith("_Z", pos + 1):
+                depth += 1
+                pos += 3
+                continue
+            # literal: builtin type and value up to E
+            if code[1:] not in dm.builtin_names:
+                return None
+            pos = symbol.find("E", pos)
+            if pos < 0:
+                return None
+            pos += 1
+        elif c == "S":
+            pos = pos + 2 if code in _abbreviations else symbol.find("_", pos) + 1
+        elif c in "TA":
+            pos = symbol.find("_", pos) + 1
+        elif code in dm.builtin_names:
+            pos += 2
+        elif c in dm.builtin_names or c in "PROKVrMCGU":
+            pos += 1
+        else:
+            return None
+        if not pos:
+            return None
+    return None
+
+
+# std:: and its abbreviations, substitutions without seq-id
+_abbreviations = frozenset(list(dm._abbreviations) + ["St"])
+
+
+def _scope_prefix(symbol):
+    """
+    Mangled scope of function or data name, scanned without parsing: '_ZNK5outer3BoxIiE4sizeEv' -> '5outer3BoxIiE'
+
+    Same prefix is always the same scope, as substitutions in it refer to its own parts.
+    None if symbol uses constructs the scan doesn't know.
+    """
+    if symbol[2:3].isdigit() or symbol[2:4] in dm.operator_names:
+        return ""
+    if symbol.startswith("St", 2) and (symbol[4:5].isdigit() or symbol[4:6] in dm.operator_names):
+        return "St"
+    # vtable and typeinfo: the whole name is the scope
+    special = symbol[2:4] in _SPECIAL_NAMES
+    if not symbol.startswith("N", 4 if special else 2):
+        return None
+    pos = 5 if special else 3
+    while symbol[pos:pos + 1] in ("K", "V", "r", "R", "O"):
+        pos += 1
+    start = pos
+    last = None
+    while pos < len(symbol):
+        c = symbol[pos]
+        code = symbol[pos:pos + 2]
+        if c == "E":
+            if special:
+                return symbol[start:pos] if pos + 1 == len(symbol) else None
+            return None if last is None else symbol[start:last]
+        if c == "I":
+            if last is None:
+                return None
+            pos = _skip_template_args(symbol, pos)
+            if pos is None:
+                return None
+            continue
+        if code == "St" and pos == start:
+            # std:: qualifies next name
+            pos += 2
+            continue
+        last = pos
+        if c.isdigit():
+            pos = _skip_source_name(symbol, pos)
+        elif pos == start and c == "S":
+            pos = pos + 2 if code in _abbreviations else symbol.find("_", pos) + 1
+            if not pos:
+                return None
+        elif c in "CD" and code[1:].isdigit():
+            pos += 2
+        elif code in dm.operator_names:
+            pos += 2
+        else:
+            return None
+    return None
+
+
+def _scope_key(name):
+    """Outermost scope name of scope: 'outer::Box<int>' -> 'outer'"""
+    return re.split(r"::|<", name, 1)[0]
+
+
+def _scope_name(prefix):
+    """'5outer5inner' -> 'outer::inner'"""
+    parts = []
+    pos = 0
+    while pos < len(prefix):
+        length = _name_re.match(prefix, pos)
+        pos = length.end() + int(length.group())
+        parts.append(prefix[length.end():pos])
+    return "::".join(parts)
+
+
+def _classify(node):
+    if issubclass(type(node), mg.VTable):
+        return VTABLE, dm.format_node(node.name), None
+    parts = node.name.parts
+    if parts and issubclass(type(parts[-1]), mg.Template):
+        parts = parts[:-1]
+    last = parts[-1]
+    scope = dm._format_parts(parts[:-1]) if len(parts) > 1 else ""
+    if issubclass(type(last), mg.Constructor):
+        return CONSTRUCTOR, scope, str(last)
+    if issubclass(type(last), mg.Destructor):
+        return DESTRUCTOR, scope, str(last)
+    name = dm._format_parts((last,))
+    if issubclass(type(node), mg.TypeSig):
+        return DATA, scope, name
+    return METHOD, scope, name
+
+
+def _match_prefix(match):
+    return match[2] or match[6] or match[7]
+
+
+def _match_entry(scope, match):
+    symbol, _const, prefix, last, rest, special, sp_prefix, sp_name, fn_name, fn_rest = match
+    if special:
+        return SymbolEntry(symbol, _SPECIAL_KINDS[special], scope, None)
+    if fn_name:
+        return SymbolEntry(symbol, [METHOD, DATA][not fn_rest], scope, fn_name.lstrip("0123456789"))
+    if last[0] == "C" and last[1:].isdigit():
+        return SymbolEntry(symbol, CONSTRUCTOR, scope, last)
+    if last[0] == "D" and last[1:].isdigit():
+        return SymbolEntry(symbol, DESTRUCTOR, scope, last)
+    return SymbolEntry(symbol, [METHOD, DATA][not rest], scope, last.lstrip("0123456789"))
+
+
+class SymbolIndex(object):
+    """
+    Queryable index of exported symbols: scope -> methods, constructors, destructors, vtable, typeinfo
+
+    Scopes are C++ qualified names, e.g. 'outer::inner::Widget', free functions are in scope ''.
+    Scope entries are built on first query.
+    """
+
+    def __init__(self, symbols):
+        self._scopes = {}
+        self.unsupported = []
+
+        symbols = list(symbols)
+        matches = _symbol_re.findall("\n".join(symbols))
+        matched = set(map(operator.itemgetter(0), matches))
+        # outermost scope name -> {mangled scope prefix, None if not scanned -> symbols},
+        # parsed on query of scope in it
+        self._pending = {}
+        # mangled scope prefix -> scope name, False if prefix can't be parsed
+        self._prefix_scopes = {}
+        for symbol in symbols:
+            if symbol.startswith("_Z") and symbol not in matched:
+                prefix = _scope_prefix(symbol)
+                special = symbol[2:4] in _SPECIAL_NAMES
+                if prefix is None and _special_re.match(symbol):
+                    self.unsupported.append(symbol)
+                else:
+                    key = _pending_key("_Z" + symbol[4:] if special else symbol)
+                    self._pending.setdefault(key, {}).setdefault(prefix, []).append(symbol)
+
+        matches.sort(key=_match_prefix)
+        self._groups = dict([(_scope_name(prefix), list(group))
+                             for prefix, group in itertools.groupby(matches, _match_prefix)])
+
+    @classmethod
+    def from_library(cls, path):
+        import pncpp.elf as elf
+        return cls(elf.read_dynamic_symbols(path))
+
+    def _scope(self, name):
+        scope = self._scopes.get(name)
+        if scope is None:
+            group = self._groups.pop(name, None)
+            if group is None:
+                return None
+            scope = self._scopes[name] = ScopeEntry(name)
+            for match in group:
+                scope.add(_match_entry(name, match))
+        return scope
+
+    def _entry(self, name):
+        scope = self._scope(name)
+        if scope is None:
+            scope = self._scopes[name] = ScopeEntry(name)
+        return scope
+
+    def _prefix_scope(self, prefix):
+        """Scope name of mangled prefix, None if it can't be parsed"""
+        name = self._prefix_scopes.get(prefix)
+        if name is None:
+            name = False
+            try:
+                if not prefix:
+                    name = ""
+                else:
+                    # any member name completes prefix to a nested name
+                    parser = dm._Parser("_ZN%s1xE" % prefix)
+                    parser.expect("_Z")
+                    parsed, _const = parser.nested_name(True)
+                    name = dm._format_parts(parsed.parts[:-1])
+            except dm.DemangleError:
+                pass
+            self._prefix_scopes[prefix] = name
+        return name if name is not False else None
+
+    def _parse_group(self, prefix, symbols):
+        scope = None if prefix is None else self._prefix_scope(prefix)
+        if scope is not None:
+            # scope exists even if none of its symbols can be parsed
+            self._entry(scope)
+        for symbol in symbols:
+            special = _SPECIAL_KINDS.get(symbol[3:4]) if symbol[2:3] == "T" else None
+            if special is not None and scope is not None:
+                self._entry(scope).add(SymbolEntry(symbol, special, scope, None))
+                continue
+            try:
+                node = dm.parse(symbol)
+            except dm.DemangleError:
+                self.unsupported.append(symbol)
+                continue
+            entry = SymbolEntry(symbol, *(_classify(node) + (node,)))
+            self._entry(entry.scope).add(entry)
+
+    def _parse_pending(self, name=None):
+        """Parse symbols that may be in scope name, all symbols by default"""
+        if name is None:
+            keys = list(self._pending)
+        else:
+            keys = [_scope_key(name), None]
+        for key in keys:
+            groups = self._pending.get(key)
+            if groups is None:
+                continue
+            for prefix in list(groups):
+                if name is not None and prefix is not None:
+                    scope = self._prefix_scope(prefix)
+                    if scope is not None and scope != name:
+                        continue
+                self._parse_group(prefix, groups.pop(prefix))
+            if not groups:
+                del self._pending[key]
+
+    def scopes(self):
+        """
+        Sorted names of all scopes
+
+        Scopes of templated symbols are read from their mangled prefix, parsing one name
+        per distinct prefix; only symbols the prefix scan doesn't know are parsed here.
+        Symbols that can't be parsed are in no scope, they are listed in unsupported.
+        """
+        names = set(self._groups)
+        for key in list(self._pending):
+            groups = self._pending[key]
+            for prefix in list(groups):
+                scope = None if prefix is None else self._prefix_scope(prefix)
+                if scope is None:
+                    self._parse_group(prefix, groups.pop(prefix))
+                else:
+                    names.add(scope)
+            if not groups:
+                del self._pending[key]
+        names.update(self._scopes)
+        return sorted(names)
+
+    def scope(self, name):
+        self._parse_pending(name)
+        return self._scope(name)
+
+    def methods(self, scope, name=None):
+        entry = self.scope(scope)
+        if entry is None:
+            return []
+        if name is not None:
+            return list(entry.methods.get(name, []))
+        return [m for overloads in entry.methods.values() for m in overloads]
+
+    def suggest(self, scope, name, kind=METHOD, n=3):
+        """
+        Signatures of members close to requested one, for "did you mean" diagnostics
+
+        :param name: method name, ignored for constructors and destructors
+        """
+        entry = self.scope(scope)
+        if entry is None:
+            names = difflib.get_close_matches(scope, self.scopes(), n)
+            return ["%s (scope)" % s for s in names]
+        if kind == CONSTRUCTOR:
+            candidates = entry.constructors
+        elif kind == DESTRUCTOR:
+            candidates = entry.destructors
+        else:
+            candidates = []
+            for close in difflib.get_close_matches(name, list(entry.methods), n):
+                candidates.extend(entry.methods[close])
+        seen = []
+        for candidate in candidates:
+            signature = candidate.signature
+            if signature not in seen:
+                seen.append(signature)
+        return seen
+
+    def __len__(self):
+        """Number of indexed members; demangles all symbols, so costs a full parse of templated ones"""
+        self._parse_pending()
+        for name in list(self._groups):
+            self._scope(name)
+        return sum(len(s.methods) + len(s.constructors) + len(s.destructors) + len(s.data) + (s.vtable is not None)
+                   for s in self._scopes.values())
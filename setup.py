@@ -49,5 +49,7 @@ setup(name='pncpp',
         long_description=long_description,
         package_dir={'pncpp': 'pncpp'},
       	packages=['pncpp'],
-        install_requires=["pncpp"]
+        install_requires=["pncpp"],
+        extras_require={"numpy": ["numpy"]},
+        entry_points={"console_scripts": ["pncpp = pncpp.codegen:main"]}
 )
\ No newline at end of file
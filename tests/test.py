@@ -3,9 +3,39 @@ __author__ = 'Dimon'
 import unittest
 import subprocess
 from pncpp import *
+import pncpp.core
+import pncpp.aio as aio
+import pncpp.codegen as codegen
+import pncpp.elf as elf
+import pncpp.executor as executor
+import pncpp.itanium_abi_mangle as mg
+import pncpp.linker as linker
+import pncpp.procpool as procpool
+import pncpp.profiling as profiling
+import pncpp.shared as shared
+import pncpp.symbol_index as si
 import platform
+import array
+import asyncio
 import ctypes
+import gc
+import importlib.util
+import json
+import mmap
+import multiprocessing
 import os
+import pstats
+import tempfile
+import threading
+import time
+import types
+import warnings
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 if platform.system() == "Windows":
     so_ext = ".dll"
@@ -63,6 +93,28 @@ class NonVirtual(CXXStruct):
     def member_return(self):
         pass
 
+    _self = SelfTypeProxy()
+
+    @cxx_method(t_int, _self.ptr(), t_int)
+    def sum_results(self, items, count):
+        pass
+
+    @cxx_method(t_void, t_int, nogil=True)
+    def sleep_ms(self, ms):
+        pass
+
+    @cxx_method(t_int, t_int.ptr(), t_int, nogil=True)
+    def wait_flag(self, flag, timeout_ms):
+        pass
+
+    @cxx_method(t_int, nogil=False, name="member_return")
+    def member_return_gil(self):
+        pass
+
+    @cxx_method(t_int, t_int, t_int, t_int, name="foo", concurrent=True)
+    def foo_concurrent(self, a, b, c):
+        pass
+
     @cxx_method(t_int, t_int, t_int, t_int, name="foo")
     def foo_i_iii(self, a, b, c):
         pass
@@ -111,8 +163,75 @@ class Virtual(CXXStruct):
     def foo_v_ptr_csi_l_isc(self, a, b, c, z, cx, bx, ax):
         pass
 
+@cxx_struct(name="Virtual", virtual=1)
+class OverrideVirtual(CXXStruct):
+
+    _pyobject_ = "py_object"
+    _fields_ = [
+        (_pyobject_, ctypes.c_void_p),
+        ('result', ctypes.c_int)
+    ]
+
+    @cxx_method(t_void, t_char.ptr(), t_short.ptr(), t_int.ptr(), t_long, t_int.ptr(), t_short.ptr(), t_char.ptr(),
+                name="foo", override=True)
+    def foo_v_ptr_csi_l_isc(self, a, b, c, z, cx, bx, ax):
+        self.result = z
+
+    @cxx_constructor()
+    def constructor(self):
+        pass
+
+    @cxx_method(t_void, t_long)
+    def call_foo(self, z):
+        pass
+
+    @cxx_method(t_void, t_long, nogil=True)
+    def call_foo_in_thread(self, z):
+        pass
+
+    _self = SelfTypeProxy()
+
+    @cxx_method(t_void, _self.ptr(), t_int, t_long)
+    def call_foo_each(self, items, count, z):
+        pass
+
+
+@cxx_struct(name="NonVirtual")
+class LazyNonVirtual(CXXStruct):
+
+    _fields_ = [
+        ('py_object', ctypes.c_void_p),
+        ('result', ctypes.c_int)
+    ]
+
+    @cxx_method(t_int)
+    def member_return(self):
+        pass
+
+    @cxx_method(t_int, t_int, t_int, t_int, name="foo")
+    def foo_i_iii(self, a, b, c):
+        pass
+
+    @cxx_method(t_int, t_long, name="foo")
+    def foo_missing(self, a):
+        pass
+
+
+@cxx_struct(name="NonVirtual")
+class NonVirtualSub(NonVirtual):
+
+    @cxx_method(t_int, name="member_return")
+    def own_result(self):
+        pass
+
+
+@cxx_struct(name="Virtual", virtual=1)
+class OverrideVirtualSub(OverrideVirtual):
+    pass
+
 lib_test_abi = prepare_lib("test_abi", "test_abi.cpp")
-link_classes(lib_test_abi, NonVirtual, Virtual)
+link_classes(lib_test_abi, NonVirtual, Virtual, OverrideVirtual, NonVirtualSub, OverrideVirtualSub)
+LazyNonVirtual.link_with(lib_test_abi, lazy=True)
 
 class ABITest(unittest.TestCase):
 
@@ -139,6 +258,13 @@ class ABITest(unittest.TestCase):
         obj.result = 720
         self.assertEqual(obj.result, 720)
 
+    def test_member_field_descriptor(self):
+        obj = NonVirtual()
+        obj.struct.result = 722
+        self.assertEqual(obj.result, 722)
+        self.assertEqual(NonVirtual.result.offset, NonVirtual.CStructure.result.offset)
+        self.assertNotIn("result", obj.__dict__)
+
     def test_member_cpp_access(self):
         obj = NonVirtual()
         obj.result = 721
@@ -150,6 +276,39 @@ class ABITest(unittest.TestCase):
         self.assertEqual(obj.result, 10)
         self.assertEqual(result, 10*2)
 
+    def test_bound_method(self):
+        obj = NonVirtual()
+        self.assertEqual(obj.foo_i_iii, obj.foo_i_iii)
+        self.assertNotIn("foo_i_iii", obj.__dict__)
+        self.assertEqual(obj.foo_i_iii(1, 2, 3), 12)
+
+    def test_wrapper_freed_by_refcount(self):
+        gc.disable()
+        try:
+            obj = NonVirtual()
+            obj.constructor_int(3)
+            obj.foo_i_iii(1, 2, 3)
+            ref = weakref.ref(obj)
+            del obj
+            self.assertIsNone(ref())
+
+            obj = OverrideVirtual()
+            obj.constructor()
+            obj.set_instance_override("foo_v_ptr_csi_l_isc", lambda self, *args: None)
+            obj.foo_v_ptr_csi_l_isc(None, None, None, 1, None, None, None)
+            obj.call_foo(2)
+            ref = weakref.ref(obj)
+            del obj
+            self.assertIsNone(ref())
+        finally:
+            gc.enable()
+
+    def test_unbound_method_call(self):
+        obj = NonVirtual()
+        result = NonVirtual.foo_i_iii(obj, 2, 2, 2)
+        self.assertEqual(obj.result, 6)
+        self.assertEqual(result, 6*2)
+
     def test_mangle_args_i_PiPiPi(self):
         obj = NonVirtual()
         a = ctypes.c_int(4)
@@ -162,6 +321,46 @@ class ABITest(unittest.TestCase):
         self.assertEqual(obj.result, 10)
         self.assertEqual(result, 10*2)
 
+    def test_buffer_pointer_args(self):
+        obj = NonVirtual()
+        a = array.array("i", [4])
+        b = bytearray(8)
+        c = mmap.mmap(-1, 4)
+        # slice of view is passed at its offset
+        result = obj.foo_i_PiPiPi(a, memoryview(b).cast("i")[1:], memoryview(c).cast("i"))
+        self.assertEqual(result, 8)
+        self.assertEqual(a[0], 1)
+        self.assertEqual(memoryview(b).cast("i").tolist(), [0, 2])
+        self.assertEqual(memoryview(c).cast("i")[0], 3)
+        # buffer export ends with the call
+        b.extend(b"\0")
+        c.close()
+
+        result = NonVirtual.foo_i_PiPiPi(obj, array.array("i", [1]), array.array("i", [1]), a)
+        self.assertEqual(result, 6)
+
+        for wrong in (array.array("d", [1.0]), array.array("h", [1, 1]), array.array("l", [1]),
+                      array.array("I", [1]), bytearray(4),
+                      memoryview(array.array("i", [1])).toreadonly()):
+            self.assertRaises(TypeError, obj.foo_i_PiPiPi, wrong, a, a)
+
+        size = ctypes.sizeof(NonVirtual.CStructure)
+        items = bytearray(3 * size)
+        for i, item in enumerate((NonVirtual.CStructure * 3).from_buffer(items)):
+            item.result = i + 1
+        self.assertEqual(obj.sum_results(items, 3), 6)
+        self.assertRaises(TypeError, obj.sum_results, bytearray(size + 1), 1)
+        # structures over raw bytes at odd offset
+        self.assertRaises(TypeError, obj.sum_results, memoryview(bytearray(size + 1))[1:], 1)
+
+        text = pncpp.core._as_pointer(array.array("u", "ab"), ctypes.c_wchar)
+        self.assertEqual(text[:], "ab")
+        strings = pncpp.core._as_pointer(memoryview(bytearray(2 * ctypes.sizeof(ctypes.c_void_p))).cast("P"),
+                                         ctypes.c_char_p)
+        self.assertEqual(strings[:], [None, None])
+        self.assertIsNone(pncpp.core._as_pointer(array.array("i"), ctypes.c_int))
+        self.assertEqual(obj.sum_results(bytearray(), 0), 0)
+
     def test_mangle_args_v_PiiPi(self):
         obj = NonVirtual()
         i = ctypes.c_int(4)
@@ -186,6 +385,129 @@ class ABITest(unittest.TestCase):
         obj = NonVirtual()
         obj.foo_v_KP_cc(b"String1", b"String2")
 
+    def test_closures_only_for_overrides(self):
+        report = closure_report()
+        self.assertEqual(report[NonVirtual], 0)
+        self.assertEqual(report[Virtual], 0)
+        self.assertEqual(report[OverrideVirtual], 1)
+        self.assertIsNone(NonVirtual.__dict__["foo_i_iii"].v_method)
+        closure = ctypes.cast(OverrideVirtual.closures()[0], ctypes.c_void_p).value
+        self.assertIn(closure, list(OverrideVirtual._vtable_))
+
+    def test_star_import(self):
+        names = {}
+        exec("from pncpp import *", names)
+        modules = {"array", "collections", "itertools", "operator", "sys", "threading", "types", "weakref"}
+        self.assertEqual(modules & set(names), set())
+
+    def test_method_table(self):
+        self.assertEqual(dict(OverrideVirtual._methods_),
+                         {nm: member for nm, member in vars(OverrideVirtual).items() if isinstance(member, CXXMethod)})
+        self.assertIs(OverrideVirtual._self.self_class, OverrideVirtual)
+
+        @cxx_struct(name="Derived", virtual=1)
+        class Derived(OverrideVirtual):
+            # plain attribute hides inherited method
+            foo_v_ptr_csi_l_isc = None
+
+            @cxx_method(t_int)
+            def get(self):
+                pass
+
+        self.assertEqual(sorted(nm for nm, member in Derived._methods_),
+                         ["call_foo", "call_foo_each", "call_foo_in_thread", "constructor", "get"])
+        self.assertIs(Derived.__dict__["get"].parent, Derived)
+        self.assertIs(OverrideVirtual.__dict__["call_foo"].parent, OverrideVirtual)
+
+    def test_inherited_methods_of_linked_subclass(self):
+        obj = NonVirtualSub()
+        obj.constructor_int(10)
+        self.assertEqual(obj.member_return(), 10)
+        self.assertEqual(obj.own_result(), 10)
+        self.assertEqual(NonVirtual.foo_i_iii(obj, 1, 2, 3), 12)
+        self.assertEqual(list(NonVirtual.member_return.map([obj])), [6])
+
+        obj = OverrideVirtualSub()
+        obj.constructor()
+        # override declared by base is in vtable copy of subclass
+        obj.call_foo(43)
+        self.assertEqual(obj.result, 43)
+
+    def test_upcall(self):
+        obj = OverrideVirtual()
+        obj.call_foo(42)
+        self.assertEqual(obj.result, 42)
+        # object missing in registry is recovered from its python object field
+        del pncpp.core._instances[ctypes.addressof(obj.struct)]
+        obj.call_foo(7)
+        self.assertEqual(obj.result, 7)
+
+    def test_instance_registry_is_weak(self):
+        obj = OverrideVirtual()
+        address = ctypes.addressof(obj.struct)
+        self.assertIs(pncpp.core._instances[address](), obj)
+        # python object field holds borrowed reference, wrapper is freed without gc
+        del obj
+        self.assertNotIn(address, pncpp.core._instances)
+
+    def test_vtable_pointer(self):
+        obj = OverrideVirtual()
+        vptr = ctypes.c_void_p.from_address(ctypes.addressof(obj.struct)).value
+        self.assertEqual(vptr, OverrideVirtual._vptr_)
+        self.assertEqual(vptr - ctypes.addressof(OverrideVirtual._vtable_), 2 * ctypes.sizeof(ctypes.c_void_p))
+        # constructor called through wrapper sets vtable pointer back to vtable copy
+        obj.constructor()
+        self.assertEqual(ctypes.c_void_p.from_address(ctypes.addressof(obj.struct)).value, vptr)
+        obj.call_foo(3)
+        self.assertEqual(obj.result, 3)
+
+    def test_instance_override(self):
+        first, second = OverrideVirtual(), OverrideVirtual()
+        calls = []
+
+        def foo(self, a, b, c, z, cx, bx, ax):
+            calls.append((self, z))
+
+        first.set_instance_override("foo_v_ptr_csi_l_isc", foo)
+        vptr = lambda obj: ctypes.cast(obj.struct._vtable_, ctypes.c_void_p).value
+        self.assertEqual(vptr(second), OverrideVirtual._vptr_)
+        self.assertEqual(vptr(first), ctypes.addressof(first._instance_vtable_) + 2 * ctypes.sizeof(ctypes.c_void_p))
+        # unchanged slots are shared with class vtable
+        self.assertEqual(first._instance_vtable_[1], OverrideVirtual._vtable_[1])
+        first.call_foo(5)
+        second.call_foo(6)
+        self.assertEqual(calls, [(first, 5)])
+        self.assertEqual(second.result, 6)
+        first.set_instance_override("foo_v_ptr_csi_l_isc", None)
+        first.call_foo(7)
+        self.assertEqual(first.result, 7)
+        self.assertRaises(TypeError, first.set_instance_override, "constructor", foo)
+        self.assertRaises(RuntimeError, NonVirtual().set_instance_override, "member_return", foo)
+
+        # native object outliving its wrapper is pointed back to class vtable
+        memory = OverrideVirtual.CStructure()
+        obj = OverrideVirtual.wrap(ctypes.addressof(memory))
+        obj.constructor()
+        obj.set_instance_override("foo_v_ptr_csi_l_isc", foo)
+        del obj
+        gc.collect()
+        self.assertEqual(ctypes.cast(memory._vtable_, ctypes.c_void_p).value, OverrideVirtual._vptr_)
+        obj = OverrideVirtual.wrap(ctypes.addressof(memory))
+        obj.call_foo(8)
+        self.assertEqual(obj.result, 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_vtable_layout(self):
+        layout = Virtual.vtable_layout()
+        self.assertEqual(layout[1].symbol, "_ZTI7Virtual")
+        foo = Virtual.__dict__["foo_v_ptr_csi_l_isc"]
+        self.assertEqual([slot.method for slot in layout if slot.method is not None], [foo])
+        self.assertEqual(layout[2].symbol, foo.mangled_name(Virtual))
+        self.assertEqual(layout[2].address, ctypes.cast(foo.c_method, ctypes.c_void_p).value)
+        self.assertEqual(Virtual._vtable_index_[layout[2].address], 2)
+        # overridden slot keeps symbol of C++ implementation
+        self.assertEqual(OverrideVirtual.vtable_layout()[2].symbol, layout[2].symbol)
+
     def test_virtual_mangle_v_ptr_csi_l_isc(self):
         obj = Virtual()
         a = ctypes.pointer(ctypes.c_char(b"0"))
@@ -193,5 +515,743 @@ class ABITest(unittest.TestCase):
         c = ctypes.pointer(ctypes.c_int(0))
         obj.foo_v_ptr_csi_l_isc(a, b, c, 777, c, b, a)
 
+class MangleTest(unittest.TestCase):
+
+    def test_interned_types(self):
+        self.assertIs(mg.m_char.const().ptr(), mg.mkstype("c").const().ptr())
+        self.assertIs(mg.struct("NonVirtual").method("foo", mg.m_int),
+                      mg.struct("NonVirtual").method("foo", mg.m_int))
+
+    def test_unused_nodes_dropped(self):
+        sig = mg.struct("Dropped").method("foo", mg.m_int)
+        self.assertIs(sig, mg.struct("Dropped").method("foo", mg.m_int))
+        ref = weakref.ref(sig)
+        del sig
+        self.assertIsNone(ref())
+        self.assertFalse([key for pool in mg._pools for key in list(pool) if "Dropped" in repr(key)])
+
+    def test_derived_types_kept(self):
+        owner = mg.struct("DerivedOnly")
+        ref = weakref.ref(owner.type().const())
+        self.assertIs(owner.type().const().ref(), owner.type().const().ref())
+        self.assertIsNotNone(ref())
+        del owner
+        self.assertIsNone(ref())
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            mg.m_int.flags = "K"
+
+    def test_method_signature(self):
+        sig = mg.struct("NonVirtual").method("foo", mg.m_int, mg.m_int.ptr())
+        self.assertEqual(str(sig), "_ZN10NonVirtual3fooEiPi")
+
+
+class LinkTest(unittest.TestCase):
+
+    def temporary_directory(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def test_dynamic_symbols(self):
+        symbols = elf.read_dynamic_symbols(libname("test_abi"))
+        self.assertIn("_ZN10NonVirtual13member_returnEv", symbols)
+        self.assertIn("_ZTV7Virtual", symbols)
+        # imported, not defined in library
+        self.assertNotIn("_ZdlPvm", symbols)
+
+    def test_resolver_address(self):
+        resolver = linker.SymbolResolver(lib_test_abi)
+        symbol = "_ZN10NonVirtual13member_returnEv"
+        address = ctypes.cast(getattr(lib_test_abi, symbol), ctypes.c_void_p).value
+        self.assertEqual(resolver.address(symbol), address)
+        self.assertIsNone(resolver.address("_ZN10NonVirtual7missingEv"))
+
+    @unittest.skipUnless(platform.system() == "Linux", "GNU indirect functions are ELF only")
+    def test_indirect_function(self):
+        # memcpy of glibc is chosen by CPU features at load time
+        libc = ctypes.CDLL("libc.so.6")
+        resolver = linker.SymbolResolver(libc)
+        self.assertNotIn("memcpy", resolver.table())
+        self.assertEqual(resolver.address("memcpy"), ctypes.cast(libc.memcpy, ctypes.c_void_p).value)
+
+    def test_link_cache(self):
+        directory = self.temporary_directory()
+        symbol = "_ZN10NonVirtual13member_returnEv"
+
+        cold = linker.SymbolResolver(lib_test_abi)
+        cold.enable_cache(directory)
+        self.assertEqual(cold.symbol(NonVirtual, "member_return", lambda: symbol), symbol)
+        address = cold.address(symbol)
+        cold.save()
+
+        def fail():
+            raise AssertionError("symbol is not cached")
+
+        warm = linker.SymbolResolver(lib_test_abi)
+        warm.enable_cache(directory)
+        self.assertEqual(warm.symbol(NonVirtual, "member_return", fail), symbol)
+        self.assertEqual(warm.address(symbol), address)
+        self.assertIsNone(warm._table)
+
+    def test_symbol_index(self):
+        index = si.SymbolIndex.from_library(libname("test_abi"))
+        self.assertEqual(len(index.methods("NonVirtual", "foo")), 6)
+        self.assertEqual(index.scope("Virtual").vtable.signature, "vtable for Virtual")
+        self.assertEqual(index.scope("Virtual").typeinfo.signature, "typeinfo for Virtual")
+        self.assertEqual(index.scope("NonVirtual").vtable, None)
+
+    def test_unresolved_suggestion(self):
+
+        @cxx_struct(name="NonVirtual")
+        class Misdeclared(CXXStruct):
+            _fields_ = [('result', ctypes.c_int)]
+
+            @cxx_method(t_int, t_long, name="foo")
+            def foo_l(self, a):
+                pass
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            Misdeclared.link_with(lib_test_abi)
+        message = str(caught[0].message)
+        self.assertIn("_ZN10NonVirtual3fooEl", message)
+        self.assertIn("did you mean: ", message)
+        self.assertIn("NonVirtual::foo(int, int, int)", message)
+
+
+class LazyLinkTest(unittest.TestCase):
+
+    def test_resolved_on_first_access(self):
+        method = LazyNonVirtual.__dict__["foo_i_iii"]
+        self.assertIsNone(method.c_method)
+        obj = LazyNonVirtual()
+        self.assertEqual(obj.foo_i_iii(1, 2, 3), 12)
+        self.assertIsNotNone(method.c_method)
+        self.assertEqual(obj.foo_i_iii, obj.foo_i_iii)
+
+    def test_concurrent_first_access(self):
+        method = LazyNonVirtual.__dict__["member_return"]
+        resolved = []
+        resolve_as_member = method.resolve_as_member
+
+        def counting_resolve(cls):
+            resolved.append(cls)
+            resolve_as_member(cls)
+
+        method.resolve_as_member = counting_resolve
+        barrier = threading.Barrier(8)
+        results = []
+
+        def call():
+            obj = LazyNonVirtual()
+            obj.result = 5
+            barrier.wait()
+            results.append(obj.member_return())
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        del method.resolve_as_member
+        self.assertEqual(resolved, [LazyNonVirtual])
+        self.assertEqual(results, [5] * 8)
+
+    def test_lazy_subclass(self):
+        @cxx_struct(name="NonVirtual")
+        class LazyBase(CXXStruct):
+
+            _fields_ = [
+                ('py_object', ctypes.c_void_p),
+                ('result', ctypes.c_int)
+            ]
+
+            @cxx_method(t_int)
+            def member_return(self):
+                pass
+
+        @cxx_struct(name="Virtual", virtual=1)
+        class LazySub(LazyBase):
+            pass
+
+        LazyBase.link_with(lib_test_abi, lazy=True)
+        LazySub.link_with(lib_test_abi, lazy=True)
+        # inherited member is resolved through class declaring it, not as Virtual::member_return
+        self.assertIs(LazyBase.__dict__["member_return"]._lazy_owner, LazyBase)
+        obj = LazyBase()
+        obj.result = 5
+        self.assertEqual(obj.member_return(), 5)
+
+    def test_unresolved_on_first_access(self):
+        obj = LazyNonVirtual()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            method = obj.foo_missing
+        self.assertIn("_ZN10NonVirtual3fooEl", str(caught[0].message))
+        self.assertRaises(AttributeError, method, 1)
+
+
+class ArrayTest(unittest.TestCase):
+
+    def test_construct_and_pass_to_cpp(self):
+        items = CXXArray(NonVirtual, 10)
+        items.construct(5)
+        self.assertEqual([item.result for item in items], [5] * 10)
+        items[3].result = 20
+        self.assertEqual(items.buffer[3].result, 20)
+        self.assertEqual(NonVirtual().sum_results(items, len(items)), 65)
+        items.destroy()
+        self.assertEqual(items[-1].result, 799)
+
+    def test_views(self):
+        items = CXXArray(NonVirtual, 3)
+        self.assertIs(items[1], items[1])
+        self.assertEqual(ctypes.addressof(items[1].struct), items.address + items.itemsize)
+        self.assertEqual(items[1].foo_i_iii(1, 2, 3), 12)
+        self.assertEqual(items.buffer[1].result, 6)
+        self.assertRaises(IndexError, items.__getitem__, 3)
+
+    def test_default_constructor(self):
+        items = CXXArray(NonVirtual, 2)
+        items.construct(constructor="constructor_empty")
+        self.assertEqual(items[0].result, 701)
+        self.assertRaises(TypeError, items.construct, 1, 2)
+
+    def test_upcall_on_elements(self):
+        items = CXXArray(OverrideVirtual, 4)
+        items.construct()
+        self.assertFalse(items._views)
+        OverrideVirtual().call_foo_each(items, len(items), 10)
+        self.assertEqual([item.result for item in items], [10, 11, 12, 13])
+
+
+class LifetimeTest(unittest.TestCase):
+
+    def tearDown(self):
+        set_leak_detection(False)
+
+    def test_with_block(self):
+        with NonVirtual() as obj:
+            obj.constructor_int(5)
+            self.assertTrue(obj.owned)
+            struct = obj.struct
+        self.assertEqual(struct.result, 799)
+        self.assertFalse(obj.owned)
+        self.assertRaises(RuntimeError, obj.destructor)
+
+    def test_finalizer(self):
+        calls = []
+        obj = NonVirtual()
+        obj.constructor_empty()
+        obj.own()
+        obj.disown().own(calls.append)
+        address = ctypes.addressof(obj.struct)
+        count = live_objects()[NonVirtual]
+        # bound methods cached in instance dict refer back to wrapper
+        del obj
+        gc.collect()
+        self.assertEqual(calls, [address])
+        self.assertEqual(live_objects().get(NonVirtual, 0), count - 1)
+
+    def test_explicit_destroy(self):
+        obj = NonVirtual()
+        obj.constructor_int(3)
+        count = live_objects()[NonVirtual]
+        obj.destructor()
+        self.assertEqual(obj.result, 799)
+        self.assertEqual(live_objects().get(NonVirtual, 0), count - 1)
+        # constructed again, owned again
+        obj.constructor_int(4)
+        self.assertTrue(obj.owned)
+        obj.disown()
+        self.assertFalse(obj.owned)
+        obj.destructor()
+
+    def test_wrap(self):
+        struct = NonVirtual.CStructure()
+        obj = NonVirtual.wrap(ctypes.pointer(struct))
+        obj.constructor_int(8)
+        self.assertFalse(obj.owned)
+        self.assertEqual(NonVirtual.wrap(ctypes.addressof(struct)).member_return(), 8)
+        owned = NonVirtual.wrap(ctypes.c_void_p(ctypes.addressof(struct)), own=True)
+        self.assertTrue(owned.owned)
+        del owned
+        gc.collect()
+        self.assertEqual(struct.result, 799)
+        self.assertRaises(ValueError, NonVirtual.wrap, None)
+
+    def test_leak_report(self):
+        set_leak_detection()
+        obj = NonVirtual()
+        obj.constructor_empty()
+        records = leak_report()
+        self.assertEqual([(record.cls, record.address) for record in records],
+                         [(NonVirtual, ctypes.addressof(obj.struct))])
+        self.assertEqual(records[0].stack[-1].name, "test_leak_report")
+        obj.dispose()
+        self.assertEqual(leak_report(), [])
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_downcall_upcall(self):
+        obj = OverrideVirtual()
+        call_foo = OverrideVirtual.__dict__["call_foo"]
+        with profiling.profile(OverrideVirtual) as profiler:
+            self.assertIsNot(call_foo._thunk.__globals__["_target"], call_foo.c_method)
+            obj.call_foo(5)
+            obj.call_foo(6)
+        self.assertIs(call_foo._thunk.__globals__["_target"], call_foo.c_method)
+        obj.call_foo(7)
+        stats = {(item["method"], item["direction"]): item for item in profiler.stats()}
+        self.assertEqual(set(stats), {("call_foo", profiling.DOWNCALL), ("foo_v_ptr_csi_l_isc", profiling.UPCALL)})
+        downcall = stats["call_foo", profiling.DOWNCALL]
+        upcall = stats["foo_v_ptr_csi_l_isc", profiling.UPCALL]
+        self.assertEqual((downcall["calls"], upcall["calls"]), (2, 2))
+        self.assertLess(downcall["self"], downcall["total"])
+        self.assertLessEqual(downcall["p50"], downcall["max"])
+        self.assertEqual(json.loads(profiler.to_json())[0]["class"], "OverrideVirtual")
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "calls.prof")
+        profiler.dump_stats(path)
+        names = [key[2] for key in pstats.Stats(path).stats]
+        self.assertIn("OverrideVirtual.foo_v_ptr_csi_l_isc (upcall)", names)
+
+    def test_call_sites(self):
+        objects = [NonVirtual(), NonVirtual()]
+        profiler = profiling.Profiler()
+        with profiler.profile(NonVirtual):
+            with profiler.profile(NonVirtual):
+                NonVirtual.member_return(objects[0])
+                NonVirtual.member_return.map(objects)
+            # inner block leaves class enabled by outer one
+            self.assertIs(NonVirtual._profiler_, profiler)
+            NonVirtual.member_return.starmap(objects, [(), ()])
+        self.assertIsNone(NonVirtual._profiler_)
+        self.assertEqual(list(NonVirtual.member_return.map(objects)), [obj.result for obj in objects])
+        [stats] = profiler.stats()
+        self.assertEqual((stats["method"], stats["calls"]), ("member_return", 5))
+
+    def test_base_and_subclass(self):
+        base, sub = NonVirtual(), NonVirtualSub()
+        base_profiler, sub_profiler = profiling.Profiler(), profiling.Profiler()
+        base_profiler.enable(NonVirtual)
+        self.addCleanup(base_profiler.disable)
+        sub_profiler.enable(NonVirtualSub)
+        self.addCleanup(sub_profiler.disable)
+        for obj in (base, sub, sub):
+            obj.member_return()
+        NonVirtual.member_return.map([sub])
+        # profiler of subclass keeps recording after profiler of base stops
+        base_profiler.disable()
+        sub.member_return()
+        base.member_return()
+        [base_stats] = base_profiler.stats()
+        [sub_stats] = sub_profiler.stats()
+        self.assertEqual((base_stats["class"], base_stats["calls"]), ("NonVirtual", 1))
+        self.assertEqual((sub_stats["class"], sub_stats["calls"]), ("NonVirtualSub", 4))
+        sub_profiler.disable()
+        self.assertIs(NonVirtual.member_return._thunk.__globals__["_target"], NonVirtual.member_return.c_method)
+        self.assertIsNone(NonVirtual.member_return._map_targets)
+
+    def test_sampling_and_lazy_link(self):
+        @cxx_struct(name="NonVirtual")
+        class ProfiledNonVirtual(CXXStruct):
+
+            _fields_ = [
+                ('py_object', ctypes.c_void_p),
+                ('result', ctypes.c_int)
+            ]
+
+            @cxx_method(t_int)
+            def member_return(self):
+                pass
+
+        profiler = profiling.Profiler(sample=2)
+        ProfiledNonVirtual.link_with(lib_test_abi, lazy=True, profile=profiler)
+        obj = ProfiledNonVirtual()
+        for _ in range(4):
+            obj.member_return()
+        [stats] = profiler.stats()
+        self.assertEqual((stats["calls"], stats["timed"]), (4, 2))
+        self.assertRaises(RuntimeError, profiling.Profiler().enable, ProfiledNonVirtual)
+        profiler.disable()
+        self.assertIsNone(ProfiledNonVirtual._profiler_)
+
+
+class ObjectPoolTest(unittest.TestCase):
+
+    def test_reuse(self):
+        pool = ObjectPool(NonVirtual, max_size=1)
+        first = pool.acquire()
+        self.assertEqual(first.result, 701)
+        second = pool.acquire(5)
+        self.assertEqual(second.result, 5)
+        self.assertEqual(second.foo_i_iii(1, 1, 1), 6)
+        pool.release(first)
+        self.assertEqual(first.result, 799)
+        self.assertRaises(ValueError, pool.release, first)
+        self.assertRaises(ValueError, pool.release, NonVirtual())
+        pool.release(second)
+        self.assertIs(pool.acquire(7), first)
+        self.assertEqual(first.result, 7)
+        self.assertEqual(pool.stats(), PoolStats(hits=1, misses=2, in_use=1, high_water=2, free=0, discarded=1))
+        with pool.borrow(constructor="constructor_int", *(3,)) as obj:
+            self.assertEqual(obj.member_return(), 3)
+        self.assertEqual(pool.stats().free, 1)
+
+    def test_dropped_without_release(self):
+        pool = ObjectPool(NonVirtual)
+        obj = pool.acquire(5)
+        struct = obj.struct
+        del obj
+        # destructor ran on collection
+        self.assertEqual(struct.result, 799)
+        self.assertEqual(pool.stats().in_use, 0)
+        self.assertEqual(pool._acquired, {})
+        self.assertRaises(ValueError, pool.release, NonVirtual())
+
+    def test_virtual(self):
+        pool = ObjectPool(OverrideVirtual)
+        obj = pool.acquire()
+        obj.call_foo(4)
+        self.assertEqual(obj.result, 4)
+        pool.release(obj)
+        self.assertIs(pool.acquire(), obj)
+        obj.call_foo(9)
+        self.assertEqual(obj.result, 9)
+        self.assertEqual(pool.stats().hits, 1)
+
+
+class BatchCallTest(unittest.TestCase):
+
+    def test_map_over_array(self):
+        items = CXXArray(NonVirtual, 5)
+        foo = NonVirtual.foo_i_iii
+        result = foo.map(items, [1, 2, 3, 4, 5], array.array("i", [10] * 5), 100)
+        self.assertEqual(list(result), [(a + 110) * 2 for a in range(1, 6)])
+        self.assertEqual([item.result for item in items], [a + 110 for a in range(1, 6)])
+
+    def test_map_over_objects(self):
+        objects = [NonVirtual() for _ in range(3)]
+        out = array.array("i", [0] * 3)
+        self.assertIs(NonVirtual.foo_i_iii.map(objects, [1, 2, 3], 0, 0, out=out), out)
+        self.assertEqual(list(out), [2, 4, 6])
+        self.assertRaises(ValueError, NonVirtual.foo_i_iii.map, objects, [1, 2, 3], 0, 0, out=array.array("i", [0] * 4))
+        self.assertRaises(ValueError, NonVirtual.member_return.map, objects, out=(ctypes.c_int * 2)())
+        self.assertEqual(list(NonVirtual.member_return.map(objects)), [1, 2, 3])
+
+    def test_starmap_one_object(self):
+        obj = NonVirtual()
+        result = NonVirtual.foo_i_iii.starmap(obj, [(1, 1, 1), (2, 2, 2)])
+        self.assertEqual(list(result), [6, 12])
+        self.assertEqual(obj.result, 6)
+
+    def test_void_and_pointer_columns(self):
+        a, c = ctypes.c_int(0), ctypes.c_int(0)
+        objects = [NonVirtual(), NonVirtual()]
+        self.assertIsNone(NonVirtual.foo_v_PiiPi.map(objects, ctypes.pointer(a), [1, 2], ctypes.pointer(c)))
+
+    def test_mismatched_columns(self):
+        items = CXXArray(NonVirtual, 2)
+        self.assertRaises(ValueError, NonVirtual.foo_i_iii.map, items, [1, 2, 3], 0, 0)
+        self.assertRaises(TypeError, NonVirtual.foo_i_iii.map, items, [1, 2])
+        self.assertRaises(TypeError, NonVirtual.foo_i_iii.map, NonVirtual(), 1, 2, 3)
+
+    def test_special_methods_rejected(self):
+        items = CXXArray(NonVirtual, 2)
+        self.assertRaises(TypeError, NonVirtual.constructor_int.map, items, [1, 2])
+        self.assertRaises(TypeError, NonVirtual.destructor.starmap, items, [(), ()])
+
+    def test_unresolved(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.assertRaises(AttributeError, LazyNonVirtual.foo_missing.starmap, LazyNonVirtual(), [])
+
+
+class ThreadingTest(unittest.TestCase):
+
+    def test_gil_flags(self):
+        flags = lambda method: NonVirtual.__dict__[method].c_method._flags_ & ctypes._FUNCFLAG_PYTHONAPI
+        self.assertFalse(flags("sleep_ms"))
+        self.assertFalse(flags("foo_concurrent"))
+        self.assertTrue(flags("member_return_gil"))
+        self.assertRaises(ValueError, cxx_method(t_int, nogil=False, concurrent=True), lambda self: None)
+
+    def test_gil_released(self):
+        obj = NonVirtual()
+        flag = ctypes.c_int(0)
+        result = []
+        # native call waits for this thread to answer, which needs the GIL
+        thread = threading.Thread(target=lambda: result.append(obj.wait_flag(flag, 10000)))
+        thread.start()
+        while flag.value != 1 and thread.is_alive():
+            time.sleep(0.001)
+        flag.value = 2
+        thread.join()
+        self.assertEqual(result, [1])
+
+    def test_upcall_from_cpp_thread(self):
+        obj = OverrideVirtual()
+        obj.call_foo_in_thread(31)
+        self.assertEqual(obj.result, 31)
+
+    def test_executor(self):
+        items = CXXArray(NonVirtual, 10)
+        with executor.NativeExecutor(3) as pool:
+            result = pool.map(NonVirtual.foo_concurrent, items, list(range(10)), 1, 1)
+            self.assertEqual(result, [(x + 2) * 2 for x in range(10)])
+            self.assertEqual([item.result for item in items], [x + 2 for x in range(10)])
+            obj = NonVirtual()
+            self.assertEqual(pool.submit(obj.foo_concurrent, 1, 2, 3).result(), 12)
+            self.assertRaises(ValueError, pool.submit, obj.foo_i_iii, 1, 2, 3)
+
+
+class AsyncTest(unittest.TestCase):
+
+    def test_acall(self):
+        obj = NonVirtual()
+
+        async def ticker(done, ticks):
+            while not done.done():
+                ticks.append(None)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            ticks = []
+            call = asyncio.ensure_future(NonVirtual.sleep_ms.acall(obj, 200))
+            await ticker(call, ticks)
+            self.assertGreater(len(ticks), 5)
+            self.assertEqual(await aio.acall(obj.foo_i_iii, 1, 2, 3), 12)
+            self.assertEqual(obj.result, 6)
+
+        asyncio.run(main())
+
+    def test_limit_and_stats(self):
+        caller = aio.AsyncCaller(max_workers=4, per_class=1)
+        obj = NonVirtual()
+
+        class Tagged(NonVirtual):
+            pass
+
+        async def main():
+            await asyncio.gather(caller.call(obj.sleep_ms, 100), caller.call(obj.sleep_ms, 100))
+            with self.assertRaises(ctypes.ArgumentError):
+                await caller.call(obj.foo_i_iii, "a", 2, 3)
+            # limit is of class of object, not of class declaring method
+            await caller.call(NonVirtual.sleep_ms, Tagged(), 1)
+            self.assertEqual(set(caller._limits[asyncio.get_running_loop()]), {NonVirtual, Tagged})
+
+        asyncio.run(main())
+        caller.shutdown()
+        stats = caller.stats()
+        self.assertEqual(stats["NonVirtual.sleep_ms"].calls, 2)
+        self.assertGreater(stats["NonVirtual.sleep_ms"].queue_max, 0.05)
+        self.assertEqual(stats["NonVirtual.foo_i_iii"].errors, 1)
+        self.assertEqual(stats["Tagged.sleep_ms"].calls, 1)
+        self.assertEqual(executor.unbind(obj.foo_i_iii, concurrent=False), (NonVirtual.foo_i_iii, obj))
+
+
+class ProcessPoolTest(unittest.TestCase):
+
+    def test_remote_objects(self):
+        with procpool.ProcessPool(lib_test_abi, [NonVirtual], processes=2) as pool:
+            items = pool.create_many(NonVirtual, [()] * 5)
+            self.assertEqual(sorted(item._worker for item in items), [0, 0, 0, 1, 1])
+            self.assertEqual(pool.map("foo_i_iii", items, range(5), [1] * 5, [1] * 5), [(x + 2) * 2 for x in range(5)])
+            self.assertEqual([pool.get(item, "result") for item in items], [x + 2 for x in range(5)])
+            self.assertEqual(items[3].foo_i_iii(1, 2, 3), 12)
+            self.assertRaises(AttributeError, items[0].missing_method)
+            pool.release(items[0])
+            self.assertRaises(KeyError, pool.get, items[0], "result")
+            self.assertEqual(pool.get(items[1], "result"), 3)
+
+            # value that can't be pickled fails its request only
+            self.assertRaises(ValueError, pool.get, items[1], "this")
+            self.assertEqual(pool.get(items[1], "result"), 3)
+
+            # collected handle is released with next request to worker
+            worker, handle = items[2]._worker, items[2]._handle
+            del items[2]
+            gc.collect()
+            self.assertEqual(pool.get(items[1], "result"), 3)
+            self.assertRaises(KeyError, pool.get, procpool.RemoteObject(pool, worker, handle, NonVirtual), "result")
+
+
+def _shared_worker(name, offset):
+    arena = shared.SharedArena(name)
+    obj = arena.attach(NonVirtual, offset)
+    obj.foo_i_iii(10, 20, 30)
+
+
+class SharedMemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "arena")
+
+    def tearDown(self):
+        NonVirtual._allocator_ = None
+        OverrideVirtual._allocator_ = None
+        gc.collect()
+
+    def test_mapped_file(self):
+        NonVirtual._allocator_ = shared.MappedArena(self.path, 4096)
+        obj = NonVirtual()
+        items = CXXArray(NonVirtual, 3)
+        offset = NonVirtual._allocator_.offset_of(obj)
+        self.assertEqual(offset % shared.ALIGNMENT, 0)
+        self.assertEqual(obj.py_object, None)
+        obj.foo_i_iii(1, 2, 3)
+        NonVirtual.foo_i_iii.map(items, [1, 2, 3], 0, 0)
+
+        other = shared.MappedArena(self.path)
+        self.assertEqual(other.used, NonVirtual._allocator_.used)
+        copy = other.attach(NonVirtual, offset)
+        self.assertEqual(copy.result, 6)
+        copy.foo_i_iii(2, 2, 2)
+        self.assertEqual(obj.result, 6)
+        self.assertEqual(obj.member_return(), 6)
+        self.assertEqual([item.result for item in other.attach(NonVirtual, NonVirtual._allocator_.offset_of(items), 3)], [1, 2, 3])
+        pool = ObjectPool(NonVirtual)
+        self.assertEqual(NonVirtual._allocator_.offset_of(pool.acquire(3)) % shared.ALIGNMENT, 0)
+        self.assertRaises(MemoryError, other.allocate, ctypes.c_char * 4096)
+
+    def test_virtual_override(self):
+        OverrideVirtual._allocator_ = shared.MappedArena(self.path, 4096)
+        obj = OverrideVirtual()
+        obj.call_foo(5)
+        self.assertEqual(obj.result, 5)
+        copy = shared.MappedArena(self.path).attach(OverrideVirtual, OverrideVirtual._allocator_.offset_of(obj))
+        copy.call_foo(6)
+        self.assertEqual(obj.result, 6)
+        self.assertEqual(ctypes.cast(obj.struct._vtable_, ctypes.c_void_p).value, OverrideVirtual._vptr_)
+
+        # vtable pointer of other process is not overwritten
+        other = OverrideVirtual()
+        offset = OverrideVirtual._allocator_.offset_of(other)
+        ctypes.c_void_p.from_address(ctypes.addressof(other.struct)).value = OverrideVirtual._vptr_ + 8
+        self.assertRaises(ValueError, shared.MappedArena(self.path).attach, OverrideVirtual, offset)
+        self.assertRaises(ValueError, shared.MappedArena(self.path).attach, OverrideVirtual, offset, 1)
+
+    def test_shared_memory_process(self):
+        arena = shared.SharedArena(size=4096)
+        open(self.path, "w").close()
+        try:
+            NonVirtual._allocator_ = arena
+            obj = NonVirtual()
+            process = multiprocessing.get_context("fork").Process(target=_shared_worker,
+                                                                   args=(arena.name, arena.offset_of(obj)))
+            process.start()
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+            self.assertEqual(obj.result, 60)
+        finally:
+            NonVirtual._allocator_ = obj = None
+            gc.collect()
+            arena.close()
+            arena.unlink()
+
+
+class CodegenTest(unittest.TestCase):
+
+    def test_generated_module(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "test_bindings.py")
+        codegen.main([NonVirtual.__module__, lib_test_abi._name, "-c", "NonVirtual,OverrideVirtual", "-o", path])
+        with open(path) as f:
+            source = f.read()
+        self.assertIn("'_ZN10NonVirtual3fooEiii'", source)
+        self.assertNotIn("LazyNonVirtual", source)
+
+        spec = importlib.util.spec_from_file_location("test_bindings", path)
+        bindings = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(bindings)
+        obj = bindings.NonVirtual()
+        self.assertRaises(RuntimeError, obj.member_return)
+        bindings.link(lib_test_abi)
+
+        obj.constructor_empty()
+        self.assertEqual(obj.result, 701)
+        self.assertEqual(obj.foo_i_iii(1, 5, 4), 20)
+        self.assertTrue(obj.owned)
+        obj.dispose()
+        self.assertEqual(obj.result, 799)
+
+        obj = bindings.OverrideVirtual()
+        obj.constructor()
+        obj.call_foo(42)
+        self.assertEqual(obj.result, 42)
+        self.assertEqual(NonVirtual.result.offset, bindings.NonVirtual.result.offset)
+
+    def test_generated_subclasses(self):
+        # bases are linked, subclasses are not, bindings of bases are not generated
+        source = codegen.generate(NonVirtual.__module__, lib_test_abi, ["NonVirtualSub", "OverrideVirtualSub"])
+        self.assertNotIn("class NonVirtual(", source)
+        self.assertIsNotNone(NonVirtualSub.__dict__["_cdll"])
+        bindings = types.ModuleType("test_sub_bindings")
+        exec(compile(source, "test_sub_bindings", "exec"), bindings.__dict__)
+        bindings.link(lib_test_abi)
+
+        obj = bindings.NonVirtualSub()
+        obj.constructor_empty()
+        self.assertEqual(obj.foo_i_iii(1, 5, 4), 20)
+        self.assertEqual(obj.member_return(), 10)
+        self.assertEqual(obj.own_result(), 10)
+        self.assertEqual(obj.sum_results(obj, 1), 10)
+
+        obj = bindings.OverrideVirtualSub()
+        obj.constructor()
+        obj.call_foo(43)
+        self.assertEqual(obj.result, 43)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class NumpyTest(unittest.TestCase):
+
+    def test_dtype(self):
+        dtype = Virtual.numpy_dtype()
+        self.assertEqual(dtype.names, ("_vtable_", "py_object", "result"))
+        self.assertEqual(dtype.itemsize, ctypes.sizeof(Virtual.CStructure))
+        self.assertEqual(dtype.fields["result"][1], Virtual.CStructure.result.offset)
+
+    def test_object_view(self):
+        obj = NonVirtual()
+        view = obj.as_numpy()
+        view["result"] = 17
+        self.assertEqual(obj.result, 17)
+        self.assertEqual(obj.member_return(), 17)
+
+    def test_array_view(self):
+        items = CXXArray(NonVirtual, 1000)
+        items.construct(2)
+        view = items.as_numpy()
+        self.assertEqual(int(view["result"].sum()), 2000)
+        view["result"] += numpy.arange(1000, dtype=numpy.int32)
+        self.assertEqual(items[999].result, 1001)
+        self.assertEqual(NonVirtual().sum_results(items, len(items)), 2000 + 999 * 1000 // 2)
+
+    def test_pointer_args(self):
+        values = numpy.array([4, 0, 0, 0], dtype=numpy.int32)
+        self.assertEqual(NonVirtual().foo_i_PiPiPi(values[0:], values[1:], values[2:]), 8)
+        self.assertEqual(values.tolist(), [1, 2, 3, 0])
+        self.assertRaises(TypeError, NonVirtual().foo_i_PiPiPi, values[::2], values, values)
+        self.assertRaises(TypeError, NonVirtual().foo_i_PiPiPi, numpy.zeros(1), values, values)
+
+    def test_map_columns(self):
+        items = CXXArray(NonVirtual, 100)
+        values = numpy.arange(100, dtype=numpy.int32)
+        out = numpy.zeros(100, dtype=numpy.int32)
+        NonVirtual.foo_i_iii.map(items, values, values, values, out=out)
+        self.assertTrue((out == values * 6).all())
+        self.assertTrue((items.as_numpy()["result"] == values * 3).all())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,6 @@
 #include "test_abi.h"
+#include <chrono>
+#include <thread>
 
 NonVirtual::NonVirtual():result(701)
 {
@@ -40,6 +42,44 @@ int NonVirtual::member_return()
     return result;
 }
 
+void NonVirtual::sleep_ms(int ms)
+{
+    std::this_thread::sleep_for(std::chrono::milliseconds(ms));
+}
+
+// sets flag to 1, returns 1 when another thread sets it to 2 before timeout
+int NonVirtual::wait_flag(int* flag, int timeout_ms)
+{
+    __atomic_store_n(flag, 1, __ATOMIC_SEQ_CST);
+    for (int i = 0; i < timeout_ms; i++)
+    {
+        if (__atomic_load_n(flag, __ATOMIC_SEQ_CST) == 2)
+            return 1;
+        std::this_thread::sleep_for(std::chrono::milliseconds(1));
+    }
+    return 0;
+}
+
+int NonVirtual::sum_results(NonVirtual* items, int count)
+{
+    int sum = 0;
+    for (int i = 0; i < count; i++)
+        sum += items[i].result;
+    return sum;
+}
+
 Virtual::Virtual(){};
 void Virtual::foo(char* a, short* b, int* c, long z, int* cx, short* bx, char* ax){};
+void Virtual::call_foo(long z){ foo(0, 0, 0, z, 0, 0, 0); };
+void Virtual::call_foo_in_thread(long z)
+{
+    std::thread thread(&Virtual::call_foo, this, z);
+    thread.join();
+}
+
+void Virtual::call_foo_each(Virtual* items, int count, long z)
+{
+    for (int i = 0; i < count; i++)
+        items[i].foo(0, 0, 0, z + i, 0, 0, 0);
+}
 Virtual::~Virtual(){};
\ No newline at end of file
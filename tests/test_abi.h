@@ -12,6 +12,9 @@ public:
     NonVirtual();
     NonVirtual(int result);
     int member_return();
+    int sum_results(NonVirtual* items, int count);
+    void sleep_ms(int ms);
+    int wait_flag(int* flag, int timeout_ms);
     int foo(int a, int b, int c);
     int foo(int* a, int* b, int* c);
     void foo(int* a, int b, int* c);
@@ -30,5 +33,8 @@ public:
 
     Virtual();
     virtual void foo(char* a, short* b, int* c, long z, int* cx, short* bx, char* ax);
+    void call_foo(long z);
+    void call_foo_each(Virtual* items, int count, long z);
+    void call_foo_in_thread(long z);
     virtual ~Virtual();
 };
\ No newline at end of file
@@ -0,0 +1,136 @@
+#include <string>
+#include <vector>
+#include <map>
+#include <iostream>
+
+namespace outer
+{
+namespace inner
+{
+
+struct Point
+{
+    int x, y;
+};
+
+template<typename T> struct Box
+{
+    T value;
+};
+
+template<typename K, typename V> struct Pair
+{
+    K key;
+    V value;
+};
+
+struct Widget
+{
+    Widget();
+    Widget(const Widget& other);
+    Widget(int a, const Point& p);
+    ~Widget();
+
+    void builtins(char, signed char, unsigned char, short, unsigned short, int, unsigned int,
+                  long, unsigned long, long long, unsigned long long, float, double, long double, bool, wchar_t);
+    void values(Point, Point);
+    void pointers(char*, char**, char***, const char*, const char**, const char* const*, char* const*);
+    void refs(int&, const int&, int*&, const int*&, Point&, const Point&, Point*&);
+    void repeated(Point*, const Point*, Point*, const Point*, Point&, const Point&);
+    void self(Widget*, const Widget*, Widget&, const Widget&, Widget);
+    void templates(Box<int>, Box<int>*, const Box<int>&, Box<Point>, Box<Point>&, Box<Box<int> >&);
+    void pairs(Pair<int, Point>&, Pair<Point, int>&, Pair<Box<int>, Box<int> >&, Pair<int, Point>*);
+    void std_types(std::vector<int>&, const std::vector<int>&, std::vector<Point>&, std::vector<std::vector<int> >&);
+    void strings(std::string, const std::string&, std::string*, std::vector<std::string>&);
+    void streams(std::ostream&, std::istream&, std::iostream&);
+    void maps(std::map<int, Point>&, const std::map<std::string, std::vector<int> >&);
+    void allocators(std::allocator<char>&, std::allocator<Point>&);
+    void none();
+    int size() const;
+    void move(Point&&);
+};
+
+struct Other
+{
+    void mixed(Widget&, Point&, Box<Widget>&, Widget*, Box<Widget>*, Point*);
+    void many(int*, int*, int*, int*, int*, int*, int*, int*, int*, int*, int*, int*);
+};
+
+template<typename T> struct Holder
+{
+    void put(T, const T&, T*);
+    void swap(Holder<T>&);
+};
+
+void free_function(int, Point*, Point*);
+
+}  // namespace inner
+
+void outer_function(inner::Point&, inner::Widget&, inner::Point&);
+
+}  // namespace outer
+
+struct Top
+{
+    void plain(int);
+    void nested(outer::inner::Point*, outer::inner::Point*, Top*);
+};
+
+void global_function();
+void global_function(const char*, const char*);
+void global_function(Top&, const Top&);
+void global_function(std::vector<Top>&, std::vector<Top>&);
+
+namespace outer
+{
+namespace inner
+{
+
+Widget::Widget() {}
+Widget::Widget(const Widget& other) {}
+Widget::Widget(int a, const Point& p) {}
+Widget::~Widget() {}
+
+void Widget::builtins(char, signed char, unsigned char, short, unsigned short, int, unsigned int,
+                      long, unsigned long, long long, unsigned long long, float, double, long double, bool, wchar_t) {}
+void Widget::values(Point, Point) {}
+void Widget::pointers(char*, char**, char***, const char*, const char**, const char* const*, char* const*) {}
+void Widget::refs(int&, const int&, int*&, const int*&, Point&, const Point&, Point*&) {}
+void Widget::repeated(Point*, const Point*, Point*, const Point*, Point&, const Point&) {}
+void Widget::self(Widget*, const Widget*, Widget&, const Widget&, Widget) {}
+void Widget::templates(Box<int>, Box<int>*, const Box<int>&, Box<Point>, Box<Point>&, Box<Box<int> >&) {}
+void Widget::pairs(Pair<int, Point>&, Pair<Point, int>&, Pair<Box<int>, Box<int> >&, Pair<int, Point>*) {}
+void Widget::std_types(std::vector<int>&, const std::vector<int>&, std::vector<Point>&, std::vector<std::vector<int> >&) {}
+void Widget::strings(std::string, const std::string&, std::string*, std::vector<std::string>&) {}
+void Widget::streams(std::ostream&, std::istream&, std::iostream&) {}
+void Widget::maps(std::map<int, Point>&, const std::map<std::string, std::vector<int> >&) {}
+void Widget::allocators(std::allocator<char>&, std::allocator<Point>&) {}
+void Widget::none() {}
+int Widget::size() const { return 0; }
+void Widget::move(Point&&) {}
+
+void Other::mixed(Widget&, Point&, Box<Widget>&, Widget*, Box<Widget>*, Point*) {}
+void Other::many(int*, int*, int*, int*, int*, int*, int*, int*, int*, int*, int*, int*) {}
+
+template<typename T> void Holder<T>::put(T, const T&, T*) {}
+template<typename T> void Holder<T>::swap(Holder<T>&) {}
+
+template struct Holder<int>;
+template struct Holder<Point>;
+template struct Holder<Box<Point> >;
+
+void free_function(int, Point*, Point*) {}
+
+}  // namespace inner
+
+void outer_function(inner::Point&, inner::Widget&, inner::Point&) {}
+
+}  // namespace outer
+
+void Top::plain(int) {}
+void Top::nested(outer::inner::Point*, outer::inner::Point*, Top*) {}
+
+void global_function() {}
+void global_function(const char*, const char*) {}
+void global_function(Top&, const Top&) {}
+void global_function(std::vector<Top>&, std::vector<Top>&) {}
@@ -0,0 +1,237 @@
+import unittest
+import subprocess
+import os
+import pncpp.elf as elf
+import pncpp.itanium_abi_demangle as dm
+import pncpp.itanium_abi_mangle as mg
+import pncpp.symbol_index as si
+import platform
+
+if platform.system() != "Linux":
+    raise unittest.SkipTest("ELF symbol table is required")
+
+
+def compile_corpus(target, *sources):
+    # lib prefix: test_mangle.so in cwd would shadow this module on import
+    out_name = "lib%s.so" % target
+    subprocess.check_call(["g++"] + list(sources) + ["-shared", "-fpic", "-o", out_name])
+    return elf.read_dynamic_symbols(out_name)
+
+
+symbols = compile_corpus("test_mangle", "test_mangle.cpp")
+
+c = mg.m_char
+i = mg.m_int
+
+outer = mg.struct("outer")
+inner = outer.struct("inner")
+point = inner.struct("Point").type()
+widget = inner.struct("Widget")
+other = inner.struct("Other")
+top = mg.struct("Top")
+
+
+def box(t):
+    return inner.template(t).struct("Box").type()
+
+
+def pair(k, v):
+    return inner.template(k, v).struct("Pair").type()
+
+
+def holder(t):
+    return inner.template(t).struct("Holder")
+
+
+def std(name, *args):
+    if args:
+        return mg.struct("std").template(*args).struct(name).type()
+    return mg.struct("std").struct(name).type()
+
+
+def vector(t):
+    return std("vector", t, std("allocator", t))
+
+
+traits = std("char_traits", c)
+string = mg.struct("std").struct("__cxx11").template(c, traits, std("allocator", c)).struct("basic_string").type()
+
+
+def std_map(k, v):
+    return std("map", k, v, std("less", k), std("allocator", std("pair", k.const(), v)))
+
+
+corpus = [
+    widget.constructor(1, mg.m_void),
+    widget.constructor(1, widget.type().const().ref()),
+    widget.constructor(1, i, point.const().ref()),
+    widget.destructor(1),
+    widget.method("builtins", mg.m_char, mg.m_signed_char, mg.m_unsigned_char, mg.m_short, mg.m_unsigned_short,
+                  mg.m_int, mg.m_unsigned_int, mg.m_long, mg.m_unsigned_long, mg.m_long_long,
+                  mg.m_unsigned_long_long, mg.m_float, mg.m_double, mg.m_long_double, mg.m_bool, mg.m_wchar_t),
+    widget.method("values", point, point),
+    widget.method("pointers", c.ptr(), c.ptr().ptr(), c.ptr().ptr().ptr(), c.const().ptr(), c.const().ptr().ptr(),
+                  mg.Type(c.const().ptr(), mg.Ref.BY_POINTER, True), mg.Type(c.ptr(), mg.Ref.BY_POINTER, True)),
+    widget.method("refs", i.ref(), i.const().ref(), i.ptr().ref(), i.const().ptr().ref(), point.ref(),
+                  point.const().ref(), point.ptr().ref()),
+    widget.method("repeated", point.ptr(), point.const().ptr(), point.ptr(), point.const().ptr(), point.ref(),
+                  point.const().ref()),
+    widget.method("self", widget.ptr_type(), widget.ptr_type(True), widget.ref_type(), widget.ref_type(True),
+                  widget.type()),
+    widget.method("templates", box(i), box(i).ptr(), box(i).const().ref(), box(point), box(point).ref(),
+                  box(box(i)).ref()),
+    widget.method("pairs", pair(i, point).ref(), pair(point, i).ref(), pair(box(i), box(i)).ref(),
+                  pair(i, point).ptr()),
+    widget.method("std_types", vector(i).ref(), vector(i).const().ref(), vector(point).ref(),
+                  vector(vector(i)).ref()),
+    widget.method("strings", string, string.const().ref(), string.ptr(), vector(string).ref()),
+    widget.method("streams", std("basic_ostream", c, traits).ref(), std("basic_istream", c, traits).ref(),
+                  std("basic_iostream", c, traits).ref()),
+    widget.method("maps", std_map(i, point).ref(), std_map(string, vector(i)).const().ref()),
+    widget.method("allocators", std("allocator", c).ref(), std("allocator", point).ref()),
+    widget.method("none", mg.m_void),
+    widget.const_method("size", mg.m_void),
+    widget.method("move", mg.Type(point, mg.Ref.BY_RVALUE_REFERENCE)),
+    other.method("mixed", widget.ref_type(), point.ref(), box(widget.type()).ref(), widget.ptr_type(),
+                 box(widget.type()).ptr(), point.ptr()),
+    other.method("many", *([i.ptr()] * 12)),
+    holder(i).method("put", i, i.const().ref(), i.ptr()),
+    holder(i).method("swap", holder(i).ref_type()),
+    holder(point).method("put", point, point.const().ref(), point.ptr()),
+    holder(point).method("swap", holder(point).ref_type()),
+    holder(box(point)).method("put", box(point), box(point).const().ref(), box(point).ptr()),
+    holder(box(point)).method("swap", holder(box(point)).ref_type()),
+    inner.method("free_function", i, point.ptr(), point.ptr()),
+    outer.method("outer_function", point.ref(), widget.ref_type(), point.ref()),
+    top.method("plain", i),
+    top.method("nested", point.ptr(), point.ptr(), top.ptr_type()),
+    mg.method("global_function", mg.m_void),
+    mg.method("global_function", c.const().ptr(), c.const().ptr()),
+    mg.method("global_function", top.ref_type(), top.ref_type(True)),
+    mg.method("global_function", vector(top.type()).ref(), vector(top.type()).ref()),
+]
+
+
+class MangleCorpusTest(unittest.TestCase):
+
+    def test_corpus(self):
+        for sig in corpus:
+            self.assertIn(str(sig), symbols)
+
+    def test_vtable(self):
+        self.assertEqual(str(widget.vtable()), "_ZTVN5outer5inner6WidgetE")
+
+    def test_std_abbreviations(self):
+        std_string = std("basic_string", c, traits, std("allocator", c))
+        self.assertEqual(str(mg.method("f", std_string, std_string.const().ref())), "_Z1fSsRKSs")
+        self.assertEqual(str(mg.method("f", std("basic_string", c, traits, std("allocator", c)).ptr(),
+                                       std("allocator", c))), "_Z1fPSsSaIcE")
+
+    def test_seq_id(self):
+        self.assertEqual([mg.seq_id(n) for n in (0, 1, 10, 11, 36, 37)], ["S_", "S0_", "S9_", "SA_", "SZ_", "S10_"])
+
+
+class DemangleTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for sig in corpus:
+            self.assertEqual(str(dm.parse(str(sig))), str(sig))
+        for symbol in symbols:
+            if symbol.startswith("_ZN5outer"):
+                self.assertEqual(str(dm.parse(symbol)), symbol)
+
+    def test_round_trip_libstdcxx(self):
+        # real corpus: exported symbols of the C++ runtime the tests link with
+        library = subprocess.check_output(["g++", "-print-file-name=libstdc++.so"]).decode().strip()
+        if not os.path.isabs(library):
+            self.skipTest("libstdc++.so is not found")
+        parsed = 0
+        for symbol in elf.read_dynamic_symbols(os.path.realpath(library)):
+            if not symbol.startswith("_Z"):
+                continue
+            try:
+                node = dm.parse(symbol)
+            except dm.DemangleError:
+                continue
+            parsed += 1
+            self.assertEqual(str(node), symbol)
+        self.assertGreater(parsed, 1000)
+
+    def test_parse_model(self):
+        self.assertIs(dm.parse(str(widget.method("none", mg.m_void))), widget.method("none", mg.m_void))
+        self.assertIs(dm.parse("_ZTVN5outer5inner6WidgetE"), widget.vtable())
+
+    def test_demangle(self):
+        self.assertEqual(dm.demangle(str(widget.constructor(1, widget.type().const().ref()))),
+                         "outer::inner::Widget::Widget(outer::inner::Widget const&)")
+        self.assertEqual(dm.demangle(str(widget.const_method("size", mg.m_void))), "outer::inner::Widget::size() const")
+        self.assertEqual(dm.demangle(str(holder(i).method("put", i, i.const().ref(), i.ptr()))),
+                         "outer::inner::Holder<int>::put(int, int const&, int*)")
+        self.assertEqual(dm.demangle("_ZTVN5outer5inner6WidgetE"), "vtable for outer::inner::Widget")
+        self.assertEqual(dm.demangle("not_mangled"), "not_mangled")
+
+    def test_unsupported(self):
+        self.assertRaises(dm.DemangleError, dm.parse, "_ZTIN5outer5inner6WidgetE")
+        self.assertRaises(dm.DemangleError, dm.parse, "_ZN5outer")
+
+
+class SymbolIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = si.SymbolIndex(symbols)
+
+    def test_scopes(self):
+        scopes = self.index.scopes()
+        for scope in ("outer::inner::Widget", "outer::inner::Holder<int>", "outer::inner", "outer", ""):
+            self.assertIn(scope, scopes)
+
+    def test_members(self):
+        widget_entry = self.index.scope("outer::inner::Widget")
+        self.assertEqual(len(set(e.signature for e in widget_entry.constructors)), 3)
+        self.assertTrue(widget_entry.destructors)
+        self.assertEqual(widget_entry.vtable, None)
+        self.assertEqual([e.signature for e in self.index.methods("outer::inner::Widget", "size")],
+                         ["outer::inner::Widget::size() const"])
+        self.assertEqual(len(self.index.methods("", "global_function")), 4)
+        self.assertEqual(len(self.index.methods("outer::inner::Holder<outer::inner::Point>", "put")), 1)
+
+    def test_lazy_groups(self):
+        index = si.SymbolIndex(list(symbols) + ["_ZNSt6vectorIiSaIiEE9push_backERKi"])
+        self.assertEqual(len(index.methods("outer::inner::Holder<int>", "put")), 1)
+        # only symbols of the queried scope are parsed
+        self.assertNotIn("5outer5inner6HolderIiE", index._pending["outer"])
+        self.assertIn("5outer5inner6HolderINS0_5PointEE", index._pending["outer"])
+        self.assertIn("std", index._pending)
+        scope = [name for name in index.scopes() if name.startswith("std::vector")][0]
+        # scope names come from the mangled prefix, symbols stay unparsed
+        self.assertEqual(index._pending["std"], {"St6vectorIiSaIiEE": ["_ZNSt6vectorIiSaIiEE9push_backERKi"]})
+        self.assertEqual(len(index.methods(scope, "push_back")), 1)
+        self.assertNotIn("std", index._pending)
+        len(index)
+        self.assertEqual(index._pending, {})
+
+        index = si.SymbolIndex(["_ZNSt6vectorIiSaIiEE9push_backERKi"])
+        self.assertEqual(len(index.methods(scope, "push_back")), 1)
+
+    def test_templated_special_names(self):
+        index = si.SymbolIndex(["_ZTVN5outer3BoxIiEE", "_ZTIN5outer3BoxIiEE", "_ZTINSt8ios_base7failureE",
+                                "_ZNK5outer3BoxIiE4sizeEv"])
+        self.assertEqual(index.scopes(), ["outer::Box<int>", "std::ios_base::failure"])
+        self.assertEqual(index.scope("outer::Box<int>").typeinfo.signature, "typeinfo for outer::Box<int>")
+        self.assertEqual(index.scope("outer::Box<int>").vtable.signature, "vtable for outer::Box<int>")
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.unsupported, [])
+
+    def test_special_names(self):
+        index = si.SymbolIndex(["_ZTIN5outer6WidgetE", "_ZTS6Widget", "_ZThn8_N5outer6Widget3fooEv", "_ZZ4mainE5count"])
+        self.assertEqual(index.scope("outer::Widget").typeinfo.signature, "typeinfo for outer::Widget")
+        self.assertEqual(index.scope("Widget").typeinfo_name.signature, "typeinfo name for Widget")
+        self.assertEqual(index.unsupported, ["_ZThn8_N5outer6Widget3fooEv", "_ZZ4mainE5count"])
+
+    def test_suggest(self):
+        self.assertEqual(self.index.suggest("outer::inner::Widget", "siz"), ["outer::inner::Widget::size() const"])
+        self.assertEqual(self.index.suggest("outer::inner::Wigdet", "size")[0], "outer::inner::Widget (scope)")
+
+
+if __name__ == '__main__':
+    unittest.main()